@@ -1,202 +1,147 @@
 # app/api/historias.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 import os
-import json
-from typing import List, Dict, Any
+from datetime import date
+from typing import List, Dict, Any, Optional
+
+from app.services import historia_index, filtro_index, busqueda_index, job_queue, response_cache, storage, validacion_masiva
+from app.utils import paginacion, versiones
 
-DATA_DIR = "./data/historias"
 UPLOAD_DIR = "./uploads"  # Definimos la ruta de uploads
 
 router = APIRouter()
 
 def _load_historia(id_historia: str) -> Dict[str, Any]:
-    path = os.path.join(DATA_DIR, f"{id_historia}.json")
-    if not os.path.exists(path):
+    historia = storage.get_historia(id_historia)
+    if historia is None:
         raise HTTPException(status_code=404, detail="Historia no encontrada")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return historia
 
-def _save_historia(historia: Dict[str, Any]):
-    os.makedirs(DATA_DIR, exist_ok=True)
-    path = os.path.join(DATA_DIR, f"{historia['id']}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(historia, f, ensure_ascii=False, indent=2)
+def _save_historia(historia: Dict[str, Any], version_esperada: Optional[int] = None):
+    # La capa de persistencia avisa a los índices (listado, dedup)
+    storage.save_historia(historia, version_esperada=version_esperada)
 
 @router.get("/historias", summary="Listar historias clínicas")
-def listar_historias():
-    if not os.path.exists(DATA_DIR):
-        return {"total": 0, "items": []}
-
-    items: List[Dict[str, Any]] = []
-    for fname in os.listdir(DATA_DIR):
-        if not fname.endswith(".json"):
-            continue
-        with open(os.path.join(DATA_DIR, fname), "r", encoding="utf-8") as f:
-            try:
-                h = json.load(f)
-                # Priorizamos la data validada
-                data_source = h.get("validada") or h.get("borrador") or {}
-                enf = data_source.get("enfermedad", {})
-                paciente = data_source.get("paciente", {})
-                consulta = data_source.get("consulta", {})
-
-                items.append({
-                    "id": h.get("id"),
-                    "estado": h.get("estado", "pendiente"),
-                    "nivel_criticidad": h.get("nivel_criticidad", "medio"),
-                    "paciente": paciente,
-                    "diagnostico": enf.get("diagnostico"),
-                    "forma": enf.get("forma"),
-                    "fecha_consulta": consulta.get("fecha"),
-                })
-            except:
-                continue
-
+def listar_historias(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página; sin limit se devuelven todas"),
+    cursor: Optional[str] = Query(None, description="cursor_siguiente de la página anterior"),
+    orden: str = Query("fecha", description="fecha (más recientes primero) | id"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, ej. id,estado,paciente.nombre"),
+):
+    # Se sirve desde el índice en memoria: sin listdir ni json.load por request
+    if orden not in historia_index.ORDENES:
+        raise HTTPException(status_code=400, detail=f"orden debe ser uno de {', '.join(historia_index.ORDENES)}")
+    try:
+        despues = paginacion.decodificar_cursor(cursor, orden) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def calcular():
+        items, siguiente = historia_index.pagina(orden, despues, limit)
+        campos = paginacion.parsear_campos(fields)
+        return {
+            "total": historia_index.total(),
+            "items": [paginacion.proyectar(r, campos) for r in items],
+            "cursor_siguiente": paginacion.codificar_cursor(orden, siguiente) if siguiente else None,
+        }
+
+    # Repetir el mismo pedido sin escrituras en el medio no recalcula (o da 304)
+    return response_cache.responder(request, calcular)
+
+def _fecha_param(valor: Optional[str], nombre: str) -> Optional[str]:
+    """YYYY-MM-DD normalizada (como las guarda filtro_index); 400 si no es una fecha."""
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor.strip()).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{nombre} debe ser una fecha YYYY-MM-DD")
+
+# Debe registrarse antes de /historias/{id_historia}
+@router.get("/historias/filtrar", summary="Filtrar historias clínicas (FiltrosHistoria)")
+def filtrar_historias(
+    patologia: Optional[str] = Query(None, description="Contenido en el diagnóstico; varias separadas por |"),
+    forma: Optional[str] = None,
+    estado: Optional[str] = None,
+    criticidad: Optional[str] = None,
+    fecha_desde: Optional[str] = Query(None, alias="fechaDesde", description="YYYY-MM-DD (inclusive)"),
+    fecha_hasta: Optional[str] = Query(None, alias="fechaHasta", description="YYYY-MM-DD (inclusive)"),
+    edad: Optional[int] = Query(None, ge=0, description="Edad actual exacta del paciente"),
+    edad_min: Optional[int] = Query(None, alias="edadMin", ge=0),
+    edad_max: Optional[int] = Query(None, alias="edadMax", ge=0),
+    sexo: Optional[str] = None,
+    medicamento: Optional[str] = Query(None, description="Molécula o droga; varias separadas por |"),
+    escala_edss: Optional[float] = Query(None, alias="escalaEDSS", description="EDSS exacto"),
+    edss_min: Optional[float] = Query(None, alias="edssMin"),
+    edss_max: Optional[float] = Query(None, alias="edssMax"),
+):
+    """
+    Resuelve los criterios con los índices secundarios en memoria (filtro_index):
+    el costo depende del tamaño del resultado, no de la cantidad de historias.
+    """
+    # Comparadas como texto en el índice: "2024-1-5" o "ayer" no pueden llegar crudas
+    fecha_desde = _fecha_param(fecha_desde, "fechaDesde")
+    fecha_hasta = _fecha_param(fecha_hasta, "fechaHasta")
+    if edad is not None:
+        edad_min = edad_max = edad
+    if escala_edss is not None:
+        edss_min = edss_max = escala_edss
+
+    ids = filtro_index.filtrar(
+        patologia=patologia, forma=forma, estado=estado, criticidad=criticidad,
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta,
+        edad_min=edad_min, edad_max=edad_max, sexo=sexo, medicamento=medicamento,
+        edss_min=edss_min, edss_max=edss_max,
+    )
+    items = historia_index.obtener(ids)
+    # Más recientes primero; sin fecha al final
+    items.sort(key=lambda r: r.get("fecha_consulta") or "", reverse=True)
     return {
         "total": len(items),
         "items": items
     }
 
-@router.get("/historias/{id_historia}/borrador", summary="Obtener borrador")
-def obtener_borrador(id_historia: str):
-    h = _load_historia(id_historia)
-    return {
-        "id": h["id"],
-        "estado": h.get("estado", "pendiente"),
-        "nivel_criticidad": h.get("nivel_criticidad", "medio"),
-        "borrador": h.get("borrador"),
-        "validada": h.get("validada")
-    }
-
-@router.patch("/historias/{id_historia}/validacion", summary="Validar historia individual")
-def validar_historia(id_historia: str, historia_validada: Dict[str, Any]):
-    h = _load_historia(id_historia)
-    h["validada"] = historia_validada
-    h["estado"] = historia_validada.get("estado", "validada") 
-    h["nivel_criticidad"] = historia_validada.get("nivel_criticidad", "medio")
-    _save_historia(h)
-    return {"id": h["id"], "estado": h["estado"], "validada": h["validada"]}
-
-@router.delete("/historias/{id_historia}", summary="Eliminar una historia clínica permanentemente")
-def eliminar_historia(id_historia: str):
-    json_path = os.path.join(DATA_DIR, f"{id_historia}.json")
-    
-    if not os.path.exists(json_path):
-        raise HTTPException(status_code=404, detail="Historia no encontrada")
-    
+@router.get("/historias/buscar", summary="Búsqueda de texto libre en las historias")
+def buscar_historias(
+    request: Request,
+    q: str = Query(..., min_length=1, description='Términos, ej. "bandas oligoclonales" o natalizumab'),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="cursor_siguiente de la página anterior"),
+):
+    """
+    Historias que contienen todos los términos (sin distinguir tildes ni
+    mayúsculas, con plurales), de la más relevante a la menos, con fragmentos
+    de síntomas, evolución, estudios y comentario. Sale del índice invertido de
+    app/services/busqueda_index.py.
+    """
     try:
-        # 1. Cargar el JSON primero para saber qué archivo físico borrar
-        with open(json_path, "r", encoding="utf-8") as f:
-            historia = json.load(f)
-        
-        # 2. Intentar borrar el archivo físico en /uploads
-        try:
-            borrador = historia.get("borrador", {})
-            if borrador:
-                fuente = borrador.get("fuente", {})
-                nombre_archivo = fuente.get("nombre_archivo")
-                
-                if nombre_archivo:
-                    file_path = os.path.join(UPLOAD_DIR, nombre_archivo)
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        print(f"INFO: Archivo físico eliminado: {file_path}")
-        except Exception as e_file:
-            print(f"WARNING: No se pudo eliminar el archivo físico: {e_file}")
-
-        # 3. Finalmente borrar el JSON (metadatos)
-        os.remove(json_path)
-        return {"mensaje": "Historia y archivo físico eliminados correctamente", "id": id_historia}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al eliminar la historia: {str(e)}")
-
-# --- NUEVO ENDPOINT PARA VALIDACIÓN MASIVA ---
-@router.post("/historias/validacion-masiva", summary="Aprobar todos los pendientes")
-def validar_todas_las_historias():
-    if not os.path.exists(DATA_DIR):
-        return {"procesadas": 0, "mensaje": "No hay directorio"}
-
-    count = 0
-    for fname in os.listdir(DATA_DIR):
-        if not fname.endswith(".json"):
-            continue
-        
-        path = os.path.join(DATA_DIR, fname)
-        with open(path, "r", encoding="utf-8") as f:
-            h = json.load(f)
-        
-        # Si no está validada, la aprobamos automáticamente
-        if h.get("estado") != "validada":
-            borrador = h.get("borrador")
-            if borrador:
-                h["validada"] = borrador
-                h["estado"] = "validada"
-                if "nivel_criticidad" not in h:
-                    h["nivel_criticidad"] = "medio"
-                
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(h, f, ensure_ascii=False, indent=2)
-                count += 1
-
-    return {"procesadas": count, "mensaje": "Validación masiva completada"}# app/api/historias.py
-from fastapi import APIRouter, HTTPException
-import os
-import json
-from typing import List, Dict, Any
-
-DATA_DIR = "./data/historias"
-UPLOAD_DIR = "./uploads"  # Definimos la ruta de uploads
-
-router = APIRouter()
-
-def _load_historia(id_historia: str) -> Dict[str, Any]:
-    path = os.path.join(DATA_DIR, f"{id_historia}.json")
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Historia no encontrada")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def _save_historia(historia: Dict[str, Any]):
-    os.makedirs(DATA_DIR, exist_ok=True)
-    path = os.path.join(DATA_DIR, f"{historia['id']}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(historia, f, ensure_ascii=False, indent=2)
-
-@router.get("/historias", summary="Listar historias clínicas")
-def listar_historias():
-    if not os.path.exists(DATA_DIR):
-        return {"total": 0, "items": []}
-
-    items: List[Dict[str, Any]] = []
-    for fname in os.listdir(DATA_DIR):
-        if not fname.endswith(".json"):
-            continue
-        with open(os.path.join(DATA_DIR, fname), "r", encoding="utf-8") as f:
-            try:
-                h = json.load(f)
-                # Priorizamos la data validada
-                data_source = h.get("validada") or h.get("borrador") or {}
-                enf = data_source.get("enfermedad", {})
-                paciente = data_source.get("paciente", {})
-                consulta = data_source.get("consulta", {})
-
-                items.append({
-                    "id": h.get("id"),
-                    "estado": h.get("estado", "pendiente"),
-                    "nivel_criticidad": h.get("nivel_criticidad", "medio"),
-                    "paciente": paciente,
-                    "diagnostico": enf.get("diagnostico"),
-                    "forma": enf.get("forma"),
-                    "fecha_consulta": consulta.get("fecha"),
-                })
-            except:
-                continue
-
-    return {
-        "total": len(items),
-        "items": items
-    }
+        despues = paginacion.decodificar_cursor(cursor, "relevancia") if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def calcular():
+        consulta, resultados = busqueda_index.buscar(q)
+        # Clave (-puntaje, id): la lista queda ascendente y se corta como los listados
+        claves, hay_mas = paginacion.cortar([(-p, i) for p, i in resultados], despues, limit)
+        puntajes = {i: -p for p, i in claves}
+        items = []
+        for resumen in historia_index.obtener([i for _, i in claves]):
+            h = storage.get_historia(resumen["id"]) or {}
+            items.append({
+                **resumen,
+                "puntaje": puntajes[resumen["id"]],
+                "fragmentos": busqueda_index.fragmentos(h, consulta),
+            })
+        return {
+            "total": len(resultados),
+            "terminos": consulta,
+            "items": items,
+            "cursor_siguiente": paginacion.codificar_cursor("relevancia", claves[-1]) if hay_mas else None,
+        }
+
+    return response_cache.responder(request, calcular)
 
 @router.get("/historias/{id_historia}/borrador", summary="Obtener borrador")
 def obtener_borrador(id_historia: str):
@@ -206,43 +151,48 @@ def obtener_borrador(id_historia: str):
         "estado": h.get("estado", "pendiente"),
         "nivel_criticidad": h.get("nivel_criticidad", "medio"),
         "borrador": h.get("borrador"),
-        "validada": h.get("validada")
+        "validada": h.get("validada"),
+        "version": h.get("version", 0)
     }
 
 @router.patch("/historias/{id_historia}/validacion", summary="Validar historia individual")
-def validar_historia(id_historia: str, historia_validada: Dict[str, Any]):
+def validar_historia(
+    id_historia: str,
+    historia_validada: Dict[str, Any],
+    if_match: Optional[str] = Header(None, description="Versión leída; 409 si la historia cambió desde entonces"),
+):
+    esperada = versiones.parsear_if_match(if_match)
     h = _load_historia(id_historia)
     h["validada"] = historia_validada
     h["estado"] = historia_validada.get("estado", "validada") 
     h["nivel_criticidad"] = historia_validada.get("nivel_criticidad", "medio")
-    _save_historia(h)
-    return {"id": h["id"], "estado": h["estado"], "validada": h["validada"]}
+    try:
+        # Sin If-Match igual se exige la versión recién leída: nada se pisa entre lectura y escritura
+        _save_historia(h, version_esperada=esperada if esperada is not None else h.get("version", 0))
+    except storage.ConflictoVersion as e:
+        raise versiones.conflicto(e)
+    return {"id": h["id"], "estado": h["estado"], "validada": h["validada"], "version": h["version"]}
 
 
 @router.get("/historias/{id_historia}", summary="Obtener historia completa")
 def obtener_historia_completa(id_historia: str):
     """
     Este endpoint es el que llama la página de detalle en el frontend.
-    Retorna el JSON completo del archivo.
+    Retorna el JSON completo de la historia.
     """
-    path = os.path.join(DATA_DIR, f"{id_historia}.json")
-    if not os.path.exists(path):
+    historia = storage.get_historia(id_historia)
+    if historia is None:
         raise HTTPException(status_code=404, detail="Archivo de historia no encontrado")
-    
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return historia
 
 @router.delete("/historias/{id_historia}", summary="Eliminar una historia clínica permanentemente")
 def eliminar_historia(id_historia: str):
-    json_path = os.path.join(DATA_DIR, f"{id_historia}.json")
-    
-    if not os.path.exists(json_path):
+    historia = storage.get_historia(id_historia)
+    if historia is None:
         raise HTTPException(status_code=404, detail="Historia no encontrada")
     
     try:
-        # 1. Cargar el JSON primero para saber qué archivo físico borrar
-        with open(json_path, "r", encoding="utf-8") as f:
-            historia = json.load(f)
+        # 1. La historia ya cargada dice qué archivo físico borrar
         
         # 2. Intentar borrar el archivo físico en /uploads
         try:
@@ -259,8 +209,8 @@ def eliminar_historia(id_historia: str):
         except Exception as e_file:
             print(f"WARNING: No se pudo eliminar el archivo físico: {e_file}")
 
-        # 3. Finalmente borrar el JSON (metadatos)
-        os.remove(json_path)
+        # 3. Finalmente borrar la historia (metadatos); los índices se enteran solos
+        storage.delete_historia(id_historia)
         return {"mensaje": "Historia y archivo físico eliminados correctamente", "id": id_historia}
         
     except Exception as e:
@@ -268,31 +218,24 @@ def eliminar_historia(id_historia: str):
 
 # --- NUEVO ENDPOINT PARA VALIDACIÓN MASIVA ---
 @router.post("/historias/validacion-masiva", summary="Aprobar todos los pendientes")
-def validar_todas_las_historias():
-    if not os.path.exists(DATA_DIR):
-        return {"procesadas": 0, "mensaje": "No hay directorio"}
-
-    count = 0
-    for fname in os.listdir(DATA_DIR):
-        if not fname.endswith(".json"):
-            continue
-        
-        path = os.path.join(DATA_DIR, fname)
-        with open(path, "r", encoding="utf-8") as f:
-            h = json.load(f)
-        
-        # Si no está validada, la aprobamos automáticamente
-        if h.get("estado") != "validada":
-            borrador = h.get("borrador")
-            if borrador:
-                h["validada"] = borrador
-                h["estado"] = "validada"
-                if "nivel_criticidad" not in h:
-                    h["nivel_criticidad"] = "medio"
-                
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(h, f, ensure_ascii=False, indent=2)
-                count += 1
-
-    return {"procesadas": count, "mensaje": "Validación masiva completada"}
+def validar_todas_las_historias(
+    modo: str = Query("sync", description="sync: valida y responde al terminar | async: encola y devuelve un job_id"),
+    lote: Optional[int] = Query(None, ge=1, le=10000, description="Historias por lote (por defecto VALIDACION_LOTE)"),
+):
+    # Por lotes: cada uno es una unidad del journal (ver app/services/validacion_masiva.py)
+    if modo == "async":
+        job = validacion_masiva.iniciar(lote)
+        return JSONResponse(status_code=202, content=validacion_masiva.progreso(job))
 
+    try:
+        resultado = validacion_masiva.validar_pendientes(lote=lote)
+    except storage.ConflictoVersion as e:
+        raise versiones.conflicto(e)
+    return {"procesadas": resultado["procesadas"], "mensaje": "Validación masiva completada"}
+
+@router.get("/historias/validacion-masiva/{job_id}", summary="Progreso de una validación masiva asíncrona")
+def progreso_validacion_masiva(job_id: str):
+    job = job_queue.obtener(job_id)
+    if not job or job.get("tipo") != validacion_masiva.TIPO:
+        raise HTTPException(status_code=404, detail="Validación masiva no encontrada")
+    return validacion_masiva.progreso(job)
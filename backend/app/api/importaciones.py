@@ -1,107 +1,279 @@
 # app/api/importaciones.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import StreamingResponse, JSONResponse
 import os
 import json
-from datetime import datetime
-from typing import Dict, Any
-import hashlib
+import time
+import asyncio
+import zipfile
+from typing import List
 
-from app.services import nlp_service, patient_service # <--- IMPORTAR EL NUEVO SERVICIO
+from app.core import config
+from app.services import import_service, dedup_index, job_queue, storage
+from app.services.import_service import (
+    build_dedup_key, DocumentoDuplicado, ArchivoDemasiadoGrande, EXTENSIONES_PERMITIDAS, UPLOAD_DIR
+)
 
 router = APIRouter()
 
-UPLOAD_DIR = "./uploads"
-DATA_DIR = "./data/historias"
+CONFLICTO_PACIENTE = "El paciente fue modificado por otra operación mientras se importaba; volvé a intentar."
 
 
-def build_dedup_key(borrador: dict) -> str:
-    paciente = borrador.get("paciente", {}) or {}
-    consulta = borrador.get("consulta", {}) or {}
-    enf = borrador.get("enfermedad", {}) or {}
-
-    dni = (paciente.get("dni") or "").strip()
-    fecha_consulta = (consulta.get("fecha") or "").strip()
-    dx = (enf.get("diagnostico") or "").strip().lower()
-    
-    texto = (borrador.get("texto_original") or "").strip().lower()
-    h = hashlib.sha256(texto.encode("utf-8")).hexdigest()[:10] if texto else "vac"
+def _descartar_upload(file_path: str):
+    # Ningún camino de error deja el archivo huérfano en uploads/
+    if os.path.exists(file_path):
+        os.remove(file_path)
 
-    if dni and fecha_consulta:
-        return f"DNI:{dni}|F:{fecha_consulta}|H:{h}"
 
-    return f"F:{fecha_consulta}|DX:{dx}|H:{h}"
+def _demasiado_grande(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"El archivo supera el máximo permitido de {max_bytes // (1024 * 1024)} MB."
+    )
 
 
 @router.post("/importaciones/historias", summary="Importar Historia Clínica")
-async def importar_historia(file: UploadFile = File(...)):
+async def importar_historia(
+    file: UploadFile = File(...),
+    modo: str = Query("sync", description="sync: responde con el borrador | async: encola y devuelve un job_id"),
+):
     ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in [".docx", ".pdf", ".doc"]:
+    if ext not in EXTENSIONES_PERMITIDAS:
         raise HTTPException(status_code=415, detail="Formato no permitido. Solo .doc, .docx o .pdf")
 
     os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(DATA_DIR, exist_ok=True)
 
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    random_suffix = hashlib.md5(file.filename.encode()).hexdigest()[:4]
-    new_filename = f"historia_{ts}_{random_suffix}{ext}"
-    file_path = os.path.join(UPLOAD_DIR, new_filename)
+    id_historia, new_filename, file_path = import_service.nuevo_archivo_upload(file.filename, ext)
 
-    # 1) Guardar archivo físico
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
+    # 1) Guardar archivo físico en bloques (sin cargarlo entero en memoria) + hash al vuelo
+    t0 = time.perf_counter()
+    try:
+        _, hash_contenido = await import_service.guardar_upload(file, file_path, config.MAX_UPLOAD_BYTES)
+    except ArchivoDemasiadoGrande:
+        raise _demasiado_grande(config.MAX_UPLOAD_BYTES)
+    t_guardado = round(time.perf_counter() - t0, 3)
+
+    # 1.b) Mismos bytes ya importados: se corta antes de gastar en NLP
+    if dedup_index.buscar_contenido(hash_contenido):
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=409,
+            detail="Este documento exacto ya fue importado previamente."
+        )
 
-    # 2) Procesar con NLP
+    # 1.c) Modo asíncrono: el resto del pipeline lo hace la cola de trabajos
+    if modo == "async":
+        job = await import_service.run_io(job_queue.encolar, "importacion", {
+            "archivo": file.filename,
+            "nombre_archivo": new_filename,
+            "file_path": file_path,
+            "hash_contenido": hash_contenido,
+            "id_historia": id_historia,
+            "historia_id": None,
+            "tiempos": {"guardado": t_guardado},
+        })
+        return JSONResponse(status_code=202, content={
+            "job_id": job["id"],
+            "estado": job["estado"],
+            "nombre_archivo": new_filename,
+        })
+
+    # 2) Procesar con NLP (fuera del event loop: no frena al resto de los endpoints)
     try:
-        borrador = nlp_service.process(file_path)
+        borrador = await import_service.procesar_archivo_async(file_path, hash_contenido)
     except Exception as e:
-        os.remove(file_path)
+        _descartar_upload(file_path)
         print(f"Error procesando NLP: {e}")
         raise HTTPException(status_code=500, detail=f"Error al procesar el archivo: {str(e)}")
 
-    # --- NUEVO: CREAR O ACTUALIZAR PACIENTE ---
+    # 3) Paciente maestro, huella clínica, duplicados y guardado
     try:
-        if borrador.get("paciente"):
-            patient_service.upsert_paciente_from_nlp(borrador["paciente"])
+        await import_service.run_io(import_service.registrar_historia, id_historia, borrador, hash_contenido)
+    except DocumentoDuplicado:
+        _descartar_upload(file_path)
+        raise HTTPException(
+            status_code=409,
+            detail="Este documento exacto ya fue importado previamente."
+        )
+    except storage.ConflictoVersion:
+        # Agotados los reintentos de registrar_historia
+        _descartar_upload(file_path)
+        raise HTTPException(status_code=409, detail=CONFLICTO_PACIENTE)
     except Exception as e:
-        print(f"Advertencia: No se pudo guardar el paciente maestro: {e}")
-    # ------------------------------------------
+        _descartar_upload(file_path)
+        print(f"Error guardando la historia: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al guardar la historia: {str(e)}")
 
-    # 3) Construir huella clínica
-    dedup_key = build_dedup_key(borrador)
-
-    # 4) Verificar duplicados
-    for fname in os.listdir(DATA_DIR):
-        if not fname.endswith(".json"):
-            continue
-        try:
-            with open(os.path.join(DATA_DIR, fname), "r", encoding="utf-8") as f:
-                h_existente = json.load(f)
-                if h_existente.get("dedup_key") == dedup_key:
-                    os.remove(file_path)
-                    raise HTTPException(
-                        status_code=409,
-                        detail="Este documento exacto ya fue importado previamente."
-                    )
-        except json.JSONDecodeError:
-            continue
-
-    # 5) Armar objeto historia
-    historia = {
-        "id": ts + "_" + random_suffix,
+    return {
+        "id_importacion": id_historia,
+        "nombre_archivo": new_filename,
         "estado": "pendiente_validacion",
-        "dedup_key": dedup_key,
-        "borrador": borrador,
-        "validada": None
+        "borrador": borrador
     }
 
-    # 6) Guardar historia en JSON
-    historia_path = os.path.join(DATA_DIR, f"{historia['id']}.json")
-    with open(historia_path, "w", encoding="utf-8") as f:
-        json.dump(historia, f, ensure_ascii=False, indent=2)
 
+@router.get("/importaciones/{job_id}", summary="Estado de una importación asíncrona")
+def obtener_job_importacion(job_id: str):
+    job = job_queue.obtener(job_id)
+    if not job or job.get("tipo") != "importacion":
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
     return {
-        "id_importacion": historia["id"],
-        "nombre_archivo": new_filename,
-        "estado": "pendiente_validacion",
-        "borrador": borrador
-    }
\ No newline at end of file
+        "job_id": job["id"],
+        "estado": job["estado"],
+        "etapa": job["etapa"],
+        "archivo": job.get("archivo"),
+        "nombre_archivo": job.get("nombre_archivo"),
+        "historia_id": job.get("historia_id"),
+        "creado": job["creado"],
+        "actualizado": job["actualizado"],
+        "tiempos": job.get("tiempos", {}),
+        "error": job.get("error"),
+    }
+
+
+async def _guardar_zip(upload: UploadFile, resultados: list, registrar_pendiente):
+    """
+    Copia el .zip a un temporal y extrae cada miembro a uploads/. Un miembro roto
+    (CRC, datos corruptos, método de compresión no soportado) es una línea de
+    error y no corta el lote. El temporal se borra siempre.
+    """
+    zip_path = os.path.join(UPLOAD_DIR, f"lote_{time.time_ns()}.zip")
+    try:
+        try:
+            await import_service.guardar_upload(upload, zip_path, config.MAX_ZIP_BYTES)
+            zf = zipfile.ZipFile(zip_path)
+        except ArchivoDemasiadoGrande:
+            resultados.append({"archivo": upload.filename, "resultado": "error", "detalle": "ZIP demasiado grande"})
+            return
+        except zipfile.BadZipFile:
+            resultados.append({"archivo": upload.filename, "resultado": "error", "detalle": "ZIP inválido"})
+            return
+
+        with zf:
+            for info in zf.infolist():
+                nombre = os.path.basename(info.filename)
+                if info.is_dir() or nombre.startswith("."):
+                    continue
+                ext_m = os.path.splitext(nombre)[1].lower()
+                if ext_m not in EXTENSIONES_PERMITIDAS:
+                    resultados.append({"archivo": nombre, "resultado": "error", "detalle": "Formato no permitido"})
+                    continue
+                id_historia, new_filename, file_path = import_service.nuevo_archivo_upload(nombre, ext_m)
+                try:
+                    # extraer_de_zip borra lo que haya escrito si falla
+                    _, hash_contenido = await import_service.run_io(
+                        import_service.extraer_de_zip, zf, info, file_path, config.MAX_UPLOAD_BYTES)
+                except ArchivoDemasiadoGrande:
+                    resultados.append({"archivo": nombre, "resultado": "error", "detalle": "Archivo demasiado grande"})
+                    continue
+                except Exception as e:
+                    resultados.append({"archivo": nombre, "resultado": "error", "detalle": f"No se pudo extraer del ZIP: {e}"})
+                    continue
+                registrar_pendiente(nombre, id_historia, new_filename, file_path, hash_contenido)
+    finally:
+        _descartar_upload(zip_path)
+
+
+@router.post("/importaciones/historias/lote", summary="Importar lote de Historias Clínicas (.doc/.docx/.pdf o .zip)")
+async def importar_lote(files: List[UploadFile] = File(...)):
+    """
+    Guarda todos los archivos (o el contenido de los .zip) y reparte extracción + NLP
+    en el pool de procesos. La respuesta es NDJSON: una línea por archivo a medida
+    que termina (aceptado, duplicado o error) y una última línea con el resumen.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    inicio = time.perf_counter()
+
+    # 1) Guardar todo a disco antes de responder (los UploadFile se cierran al salir).
+    #    Cada archivo -y cada miembro de un .zip- se copia en bloques con hash al vuelo.
+    resultados_inmediatos = []
+    pendientes = []  # (nombre_original, id_historia, new_filename, file_path, hash_contenido)
+
+    def _registrar_pendiente(nombre, id_historia, new_filename, file_path, hash_contenido):
+        if dedup_index.buscar_contenido(hash_contenido):
+            os.remove(file_path)
+            resultados_inmediatos.append({"archivo": nombre, "resultado": "duplicado"})
+        else:
+            pendientes.append((nombre, id_historia, new_filename, file_path, hash_contenido))
+
+    try:
+        for upload in files:
+            ext = os.path.splitext(upload.filename)[1].lower()
+
+            if ext == ".zip":
+                await _guardar_zip(upload, resultados_inmediatos, _registrar_pendiente)
+                continue
+
+            if ext not in EXTENSIONES_PERMITIDAS:
+                resultados_inmediatos.append({"archivo": upload.filename, "resultado": "error", "detalle": "Formato no permitido"})
+                continue
+            id_historia, new_filename, file_path = import_service.nuevo_archivo_upload(upload.filename, ext)
+            try:
+                _, hash_contenido = await import_service.guardar_upload(upload, file_path, config.MAX_UPLOAD_BYTES)
+            except ArchivoDemasiadoGrande:
+                resultados_inmediatos.append({"archivo": upload.filename, "resultado": "error", "detalle": "Archivo demasiado grande"})
+                continue
+            _registrar_pendiente(upload.filename, id_historia, new_filename, file_path, hash_contenido)
+    except BaseException:
+        # Si el pedido se corta acá no hay stream que los procese
+        for pendiente in pendientes:
+            _descartar_upload(pendiente[3])
+        raise
+
+    async def _stream():
+        conteo = {"aceptado": 0, "duplicado": 0, "error": 0}
+        for r in resultados_inmediatos:
+            conteo[r["resultado"]] += 1
+            yield json.dumps(r, ensure_ascii=False) + "\n"
+
+        # 2) Fan-out de la parte CPU-bound al pool de procesos
+        async def _procesar(item):
+            try:
+                return item, await import_service.procesar_archivo_async(item[3], item[4]), None
+            except Exception as e:
+                return item, None, e
+
+        # 3) Registrar (paciente, dedup, guardado) en este proceso a medida que terminan
+        sin_procesar = {item[3] for item in pendientes}
+        try:
+            for tarea in asyncio.as_completed([_procesar(i) for i in pendientes]):
+                (nombre, id_historia, new_filename, file_path, hash_contenido), borrador, error = await tarea
+                sin_procesar.discard(file_path)
+                if error is not None:
+                    _descartar_upload(file_path)
+                    r = {"archivo": nombre, "resultado": "error", "detalle": str(error)}
+                else:
+                    try:
+                        await import_service.run_io(import_service.registrar_historia, id_historia, borrador, hash_contenido)
+                        r = {"archivo": nombre, "resultado": "aceptado", "id": id_historia, "nombre_archivo": new_filename}
+                    except DocumentoDuplicado:
+                        _descartar_upload(file_path)
+                        r = {"archivo": nombre, "resultado": "duplicado"}
+                    except storage.ConflictoVersion:
+                        _descartar_upload(file_path)
+                        r = {"archivo": nombre, "resultado": "error", "detalle": CONFLICTO_PACIENTE}
+                    except Exception as e:
+                        _descartar_upload(file_path)
+                        r = {"archivo": nombre, "resultado": "error", "detalle": str(e)}
+                conteo[r["resultado"]] += 1
+                yield json.dumps(r, ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectado a mitad del stream: no quedan uploads sin procesar
+            for file_path in sin_procesar:
+                _descartar_upload(file_path)
+
+        segundos = time.perf_counter() - inicio
+        total = sum(conteo.values())
+        yield json.dumps({
+            "resumen": {
+                "total": total,
+                "aceptados": conteo["aceptado"],
+                "duplicados": conteo["duplicado"],
+                "fallidos": conteo["error"],
+                "segundos": round(segundos, 2),
+                "archivos_por_segundo": round(total / segundos, 2) if segundos > 0 else None,
+                "workers": config.IMPORT_WORKERS
+            }
+        }, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
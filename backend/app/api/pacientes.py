@@ -1,21 +1,36 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
-import os
-import json
-from app.services import patient_service
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from typing import List, Dict, Any, Optional
+from app.services import patient_service, paciente_index, historia_index, linea_tiempo, response_cache, storage
+from app.utils import paginacion, versiones
 
 router = APIRouter()
 
-# Rutas de almacenamiento (asegúrate de que coincidan con tu estructura)
-PATH_HISTORIAS = "./data/historias"
-
 @router.get("/pacientes", summary="Listar todos los pacientes")
-def listar_pacientes():
-    pacientes = patient_service.get_all_pacientes()
-    return {
-        "total": len(pacientes),
-        "items": pacientes
-    }
+def listar_pacientes(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página; sin limit se devuelven todos"),
+    cursor: Optional[str] = Query(None, description="cursor_siguiente de la página anterior"),
+    orden: str = Query("id", description="id | nombre"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, ej. id,nombre,dni"),
+):
+    # Desde el índice en memoria (paciente_index), sin recorrer data/pacientes
+    if orden not in paciente_index.ORDENES:
+        raise HTTPException(status_code=400, detail=f"orden debe ser uno de {', '.join(paciente_index.ORDENES)}")
+    try:
+        despues = paginacion.decodificar_cursor(cursor, orden) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def calcular():
+        pacientes, siguiente = paciente_index.pagina(orden, despues, limit)
+        campos = paginacion.parsear_campos(fields)
+        return {
+            "total": paciente_index.total(),
+            "items": [paginacion.proyectar(p, campos) for p in pacientes],
+            "cursor_siguiente": paginacion.codificar_cursor(orden, siguiente) if siguiente else None,
+        }
+
+    return response_cache.responder(request, calcular)
 
 @router.get("/pacientes/{id_paciente}", summary="Obtener detalle de paciente")
 def obtener_paciente(id_paciente: str):
@@ -24,6 +39,45 @@ def obtener_paciente(id_paciente: str):
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     return paciente
 
+@router.get("/pacientes/{id_paciente}/historias", summary="Historias clínicas de un paciente")
+def listar_historias_paciente(
+    id_paciente: str,
+    fields: Optional[str] = Query(None, description="Campos a devolver, ej. id,validada.enfermedad.edss"),
+):
+    """
+    Historias completas del paciente, consulta más reciente primero. El índice
+    DNI -> historias dice cuáles leer: no se recorre el resto.
+    """
+    paciente = patient_service.get_paciente_by_id(id_paciente)
+    if not paciente:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+
+    campos = paginacion.parsear_campos(fields)
+    items = []
+    for id_historia in historia_index.ids_por_dni(paciente.get("dni") or paciente.get("id")):
+        historia = storage.get_historia(id_historia)
+        if historia is not None:
+            items.append(paginacion.proyectar(historia, campos))
+    return {
+        "total": len(items),
+        "items": items
+    }
+
+@router.get("/pacientes/{id_paciente}/linea-tiempo", summary="Línea de tiempo de un paciente")
+def obtener_linea_tiempo(id_paciente: str, request: Request):
+    # Se arma con la línea de tiempo en memoria del paciente, sin leer historias
+    paciente = patient_service.get_paciente_by_id(id_paciente)
+    if not paciente:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    return response_cache.responder(request, lambda: linea_tiempo.linea_tiempo(paciente))
+
+@router.get("/pacientes/{id_paciente}/analisis", summary="Análisis de un paciente (EDSS, DMT, soporte)")
+def obtener_analisis(id_paciente: str, request: Request):
+    paciente = patient_service.get_paciente_by_id(id_paciente)
+    if not paciente:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    return response_cache.responder(request, lambda: linea_tiempo.analisis(paciente))
+
 @router.delete("/pacientes/{id_paciente}", summary="Eliminar paciente e historias asociadas")
 def eliminar_paciente(id_paciente: str):
     # 1. Primero obtenemos los datos del paciente para saber su DNI
@@ -33,30 +87,19 @@ def eliminar_paciente(id_paciente: str):
     
     dni_objetivo = paciente.get("dni")
 
-    # 2. Lógica de Borrado en Cascada: Buscamos y borramos sus historias clínicas
-    if dni_objetivo:
-        try:
-            if os.path.exists(PATH_HISTORIAS):
-                archivos = os.listdir(PATH_HISTORIAS)
-                for archivo in archivos:
-                    if archivo.endswith(".json"):
-                        ruta_h = os.path.join(PATH_HISTORIAS, archivo)
-                        with open(ruta_h, "r", encoding="utf-8") as f_h:
-                            historia_raw = json.load(f_h)
-                            # Verificamos DNI en 'validada' o 'borrador'
-                            h_info = historia_raw.get("validada") or historia_raw.get("borrador") or {}
-                            dni_en_historia = h_info.get("paciente", {}).get("dni")
-                            
-                            # Si coinciden, borramos el archivo de la historia
-                            if str(dni_en_historia) == str(dni_objetivo):
-                                os.remove(ruta_h)
-        except Exception as e:
-            print(f"Error al limpiar historias en cascada: {e}")
+    # Historias + paciente en una sola unidad: se borra todo o nada
+    with storage.transaccion():
+        # 2. Lógica de Borrado en Cascada: Buscamos y borramos sus historias clínicas
+        #    (DNI en 'validada' o 'borrador'; el índice en memoria dice cuáles son)
+        if dni_objetivo:
+            for id_historia in historia_index.ids_por_dni(dni_objetivo):
+                storage.delete_historia(id_historia)
 
-    # 3. Finalmente eliminamos al paciente del registro
-    exito = patient_service.delete_paciente_by_id(id_paciente)
-    if not exito:
-        raise HTTPException(status_code=500, detail="Error al eliminar el registro del paciente")
+        # 3. Finalmente eliminamos al paciente del registro
+        exito = patient_service.delete_paciente_by_id(id_paciente)
+        if not exito:
+            # Dentro del bloque: la excepción descarta también el borrado de las historias
+            raise HTTPException(status_code=500, detail="Error al eliminar el registro del paciente")
     
     return {
         "mensaje": "Paciente e historias asociadas eliminados correctamente",
@@ -65,8 +108,16 @@ def eliminar_paciente(id_paciente: str):
     }
 
 @router.put("/pacientes/{id_paciente}", summary="Actualizar datos de paciente")
-def actualizar_paciente(id_paciente: str, data: Dict[str, Any]):
-    paciente = patient_service.update_paciente(id_paciente, data)
+def actualizar_paciente(
+    id_paciente: str,
+    data: Dict[str, Any],
+    if_match: Optional[str] = Header(None, description="Versión leída; 409 si el paciente cambió desde entonces"),
+):
+    esperada = versiones.parsear_if_match(if_match)
+    try:
+        paciente = patient_service.update_paciente(id_paciente, data, version_esperada=esperada)
+    except storage.ConflictoVersion as e:
+        raise versiones.conflicto(e)
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     return paciente
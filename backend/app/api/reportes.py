@@ -1,12 +1,21 @@
-from fastapi import APIRouter
-from app.services import report_service
+from fastapi import APIRouter, Query, Request
+from app.services import report_service, response_cache
 
 router = APIRouter()
 
 @router.get("/general", summary="Obtener estadísticas globales de la cohorte")
-def obtener_reporte_general():
+def obtener_reporte_general(
+    request: Request,
+    rebuild: bool = Query(False, description="Recalcular todo recorriendo las historias"),
+):
     """
-    Este endpoint activa el escaneo de todas las historias clínicas 
-    para devolver los datos agregados en tiempo real.
+    Devuelve los agregados materializados de la cohorte (se actualizan con cada
+    importación, validación o borrado). Con ?rebuild=true se vuelven a escanear
+    todas las historias clínicas. Si nada cambió y el cliente manda el ETag en
+    If-None-Match, responde 304.
     """
-    return report_service.generar_estadisticas_generales()
\ No newline at end of file
+    return response_cache.responder(
+        request,
+        lambda: report_service.generar_estadisticas_generales(rebuild=rebuild),
+        forzar=rebuild,
+    )
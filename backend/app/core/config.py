@@ -1 +1,65 @@
-# Configuraciones generales (placeholder)
+# Configuraciones generales
+import os
+
+
+def _env_int(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Procesos para extracción + NLP de importaciones (0 = núcleos de la máquina)
+IMPORT_WORKERS = _env_int("IMPORT_WORKERS", 0) or (os.cpu_count() or 1)
+
+# Importación fuera del event loop: "process" (regex/PDF en paralelo real) o "thread"
+IMPORT_EXECUTOR = os.getenv("IMPORT_EXECUTOR", "process").strip().lower()
+
+# Máximo de documentos procesándose a la vez (el resto espera sin bloquear el loop)
+IMPORT_CONCURRENCY = _env_int("IMPORT_CONCURRENCY", 0) or IMPORT_WORKERS
+
+# Threads que atienden la cola de trabajos en segundo plano (importaciones asíncronas)
+JOB_WORKERS = _env_int("JOB_WORKERS", 2)
+
+# Segundos que un trabajo "procesando" queda reservado para su proceso sin que
+# este renueve la reserva; vencida, se vuelve a encolar
+JOB_LEASE = _env_int("JOB_LEASE", 60)
+
+# Horas que se conservan en data/jobs los trabajos terminados (0 = no se borran)
+JOB_RETENCION_HORAS = _env_int("JOB_RETENCION_HORAS", 24 * 7)
+
+# Validación masiva: historias por lote (una unidad del journal y un checkpoint por lote)
+VALIDACION_LOTE = _env_int("VALIDACION_LOTE", 200)
+
+# Tope de la caché de texto extraído + NLP por contenido (desalojo LRU)
+CACHE_MAX_BYTES = _env_int("CACHE_MAX_MB", 512) * 1024 * 1024
+
+# Tamaño máximo por documento subido (se controla mientras se recibe) y por .zip de lote
+MAX_UPLOAD_BYTES = _env_int("MAX_UPLOAD_MB", 200) * 1024 * 1024
+MAX_ZIP_BYTES = _env_int("MAX_ZIP_MB", 4096) * 1024 * 1024
+
+# PDFs largos: procesos del pool de páginas y desde cuántas páginas se usa. Con
+# IMPORT_EXECUTOR=process esos PDFs se extraen en el proceso principal y el worker
+# de importación sólo corre el NLP (no se anidan pools)
+PDF_WORKERS = _env_int("PDF_WORKERS", 0) or (os.cpu_count() or 1)
+PDF_PARALLEL_MIN_PAGES = _env_int("PDF_PARALLEL_MIN_PAGES", 40)
+
+# .doc legacy: procesos antiword simultáneos por proceso de importación y timeout por archivo
+ANTIWORD_WORKERS = _env_int("ANTIWORD_WORKERS", 4)
+ANTIWORD_TIMEOUT = _env_int("ANTIWORD_TIMEOUT", 60)
+
+# Persistencia de historias y pacientes: "json" (un archivo por registro), "sqlite",
+# "compacto" (historias en binario, ver app/services/formato_compacto.py) o
+# "segmentos" (log append-only, ver app/services/segmentos.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "./data/neurosoft.db")
+
+# STORAGE_BACKEND=segmentos: tamaño de cada segmento y cada cuántos segundos el
+# compactador revisa si hay que reescribirlos (0 = sin compactador)
+SEGMENTOS_MAX_MB = _env_int("SEGMENTOS_MAX_MB", 64)
+SEGMENTOS_COMPACTAR_CADA = _env_int("SEGMENTOS_COMPACTAR_CADA", 60)
+
+# Caché de respuestas de listados y reportes: vigencia máxima (además de la
+# invalidación por escrituras) y cantidad de entradas
+RESPONSE_CACHE_TTL = _env_int("RESPONSE_CACHE_TTL", 300)
+RESPONSE_CACHE_MAX_ENTRIES = _env_int("RESPONSE_CACHE_MAX_ENTRIES", 256)
@@ -1 +1,73 @@
-# Conexión a la base de datos (placeholder)
+# Conexión a la base de datos
+"""
+SQLite embebido para historias y pacientes (STORAGE_BACKEND=sqlite).
+
+Cada tabla guarda el registro completo como JSON en la columna `data` y, aparte,
+las columnas por las que se consulta (DNI, fecha de consulta, estado,
+diagnóstico y forma) con su índice. La base se abre en modo WAL: las lecturas no
+bloquean a la escritura y cada escritura es una transacción.
+
+Una conexión por thread (sqlite3 no comparte conexiones entre threads).
+"""
+import os
+import sqlite3
+import threading
+
+from app.core import config
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS historias (
+    id             TEXT PRIMARY KEY,
+    dni            TEXT,
+    fecha_consulta TEXT,
+    estado         TEXT,
+    diagnostico    TEXT,
+    forma          TEXT,
+    data           TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_historias_dni ON historias (dni);
+CREATE INDEX IF NOT EXISTS ix_historias_fecha ON historias (fecha_consulta);
+CREATE INDEX IF NOT EXISTS ix_historias_estado ON historias (estado);
+CREATE INDEX IF NOT EXISTS ix_historias_diagnostico ON historias (diagnostico);
+CREATE INDEX IF NOT EXISTS ix_historias_forma ON historias (forma);
+
+CREATE TABLE IF NOT EXISTS pacientes (
+    id     TEXT PRIMARY KEY,
+    dni    TEXT,
+    nombre TEXT,
+    data   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pacientes_nombre ON pacientes (nombre);
+"""
+
+
+def _abrir(path: str) -> sqlite3.Connection:
+    directorio = os.path.dirname(path)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Con WAL, NORMAL no pierde consistencia ante un corte (sólo la última transacción)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Conexión del thread actual a SQLITE_PATH (se crea y migra el esquema la primera vez)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != config.SQLITE_PATH:
+        conn = _abrir(config.SQLITE_PATH)
+        _local.conn = conn
+        _local.path = config.SQLITE_PATH
+    return conn
+
+
+def cerrar():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import importaciones, historias, reportes, pacientes 
+from app.services import storage, historia_index, paciente_index, dedup_index, filtro_index, busqueda_index, report_service, linea_tiempo, import_service, job_queue
 
 app = FastAPI(title="NeuroSoft Backend - Grupo 21")
 
@@ -16,6 +17,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- ÍNDICES EN MEMORIA ---
+@app.on_event("startup")
+def cargar_indices():
+    # Un solo proceso servidor por ./data: los índices no ven escrituras de otros
+    storage.reservar_servidor()
+    # Un único escaneo del disco por proceso; luego se mantiene en cada escritura
+    historia_index.cargar()
+    paciente_index.cargar()
+    dedup_index.cargar()
+    filtro_index.cargar()
+    busqueda_index.cargar()
+    report_service.cargar()
+    linea_tiempo.cargar()
+    job_queue.iniciar()
+
+@app.on_event("shutdown")
+def liberar_workers():
+    import_service.shutdown_process_pool()
+    # Próximo arranque: sólo se tokenizan las historias que cambien hasta entonces
+    busqueda_index.guardar()
+
 # --- REGISTRO DE RUTAS ---
 
 # 1. IMPORTACIONES: Quitamos el prefix porque el router interno ya dice "/importaciones/historias"
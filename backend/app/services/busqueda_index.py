@@ -0,0 +1,310 @@
+# backend/app/services/busqueda_index.py
+"""
+Índice invertido para la búsqueda de texto libre (`GET /historias/buscar`).
+
+Se indexan las secciones de texto (síntomas, antecedentes, examen físico,
+evolución, estudios, comentario...) y el texto original de cada historia. Los
+términos se normalizan sin tildes ni mayúsculas, se descartan palabras vacías
+y se reducen con un stemming simple (plurales y terminación de género), así
+"Neuritis Óptica" encuentra "neuritis ópticas". Cada término apunta a las
+historias que lo contienen con su frecuencia y el ranking es BM25.
+
+Se mantiene escuchando las escrituras de app/services/storage.py (importación,
+validación, borrado). Los términos de cada historia se guardan además en
+data/busqueda/indice.json junto con su versión: al arrancar sólo se vuelven a
+tokenizar las historias que cambiaron. Para rehacerlo todo:
+
+    python -m app.services.busqueda_index reconstruir
+"""
+import os
+import re
+import sys
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services import storage
+
+SNAPSHOT_PATH = "./data/busqueda/indice.json"
+FORMATO = 1
+
+# Secciones de donde salen los fragmentos de cada resultado
+SECCIONES_FRAGMENTO = ("sintomas_principales", "evolucion", "estudios", "comentario")
+PESO_SECCIONES = 2  # una palabra en una sección pesa más que en el texto original
+LARGO_FRAGMENTO = 160
+
+# BM25
+K1 = 1.2
+B = 0.75
+
+_PALABRAS_VACIAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aun bajo bien cada casi
+como con contra cual cuando de del desde donde dos durante e el ella ellas ellos
+en entre era es esa esas ese eso esos esta estaba estan estas este esto estos fue
+fueron ha habia han hasta hay la las le les lo los mas me mi muy nada ni no nos o
+otra otras otro otros para pero poco por porque que quien se segun ser si sin
+sobre solo son su sus tambien tiene tras tu un una uno unos y ya
+""".split())
+
+# Minúsculas sin tildes, un carácter por carácter (los offsets sirven sobre el original)
+_SIN_TILDES = {
+    ord(c): unicodedata.normalize("NFKD", c)[0]
+    for c in map(chr, range(0xC0, 0x250))
+    if unicodedata.normalize("NFKD", c)[0].isascii() and len(c.lower()) == 1
+}
+_RE_PALABRA = re.compile(r"[a-z0-9]+")
+
+_lock = threading.RLock()
+_postings: Dict[str, Dict[str, int]] = {}     # término -> {id historia -> frecuencia}
+_terminos: Dict[str, Dict[str, int]] = {}     # id historia -> {término -> frecuencia}
+_longitudes: Dict[str, int] = {}              # id historia -> términos (con peso)
+_versiones: Dict[str, int] = {}               # id historia -> versión indexada
+_longitud_total = 0
+_cargado = False
+
+
+def normalizar(texto: str) -> str:
+    return texto.lower().translate(_SIN_TILDES)
+
+
+@lru_cache(maxsize=65536)
+def raiz(palabra: str) -> str:
+    """Stemming simple: plural y vocal final de género ("ópticas" -> "optic")."""
+    if len(palabra) > 4 and palabra.endswith("es") and palabra[-3] not in "aeiou":
+        palabra = palabra[:-2]
+    elif len(palabra) > 3 and palabra.endswith("s") and palabra[-2] in "aeo":
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra[-1] in "aeo":
+        palabra = palabra[:-1]
+    return palabra
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    if not texto:
+        return []
+    return [
+        raiz(p) for p in _RE_PALABRA.findall(normalizar(str(texto)))
+        if len(p) > 1 and p not in _PALABRAS_VACIAS
+    ]
+
+
+def _textos(h: Dict[str, Any]) -> Tuple[Dict[str, str], str]:
+    """Secciones (prioridad a la data validada) y texto original de una historia."""
+    data = h.get("validada") or h.get("borrador") or {}
+    secciones = {
+        k: v for k, v in (data.get("secciones_texto", {}) or {}).items()
+        if isinstance(v, str) and v.strip()
+    }
+    original = data.get("texto_original") or (h.get("borrador") or {}).get("texto_original") or ""
+    return secciones, original if isinstance(original, str) else ""
+
+
+def terminos_historia(h: Dict[str, Any]) -> Dict[str, int]:
+    secciones, original = _textos(h)
+    conteo: Counter = Counter()
+    for texto in secciones.values():
+        for termino in tokenizar(texto):
+            conteo[termino] += PESO_SECCIONES
+    conteo.update(tokenizar(original))
+    return dict(conteo)
+
+
+def _indexar(id_historia: str, terminos: Dict[str, int], version: int):
+    global _longitud_total
+    _terminos[id_historia] = terminos
+    _versiones[id_historia] = version
+    longitud = sum(terminos.values())
+    _longitudes[id_historia] = longitud
+    _longitud_total += longitud
+    for termino, frecuencia in terminos.items():
+        _postings.setdefault(termino, {})[id_historia] = frecuencia
+
+
+def _desindexar(id_historia: str):
+    global _longitud_total
+    terminos = _terminos.pop(id_historia, None)
+    if terminos is None:
+        return
+    _versiones.pop(id_historia, None)
+    _longitud_total -= _longitudes.pop(id_historia, 0)
+    for termino in terminos:
+        docs = _postings.get(termino)
+        if docs is not None:
+            docs.pop(id_historia, None)
+            if not docs:
+                del _postings[termino]
+
+
+def _leer_snapshot() -> Dict[str, Any]:
+    try:
+        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        print("WARNING: Índice de búsqueda en disco ilegible, se reconstruye")
+        return {}
+    if snapshot.get("formato") != FORMATO:
+        return {}
+    return snapshot.get("historias", {})
+
+
+def guardar():
+    """Escribe los términos de cada historia (temporal + rename)."""
+    if not _cargado:
+        return  # no pisar el snapshot con un índice vacío
+    with _lock:
+        historias = {i: {"v": _versiones.get(i, 0), "t": t} for i, t in _terminos.items()}
+        crudo = json.dumps({"formato": FORMATO, "historias": historias}, ensure_ascii=False, separators=(",", ":"))
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+    tmp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(crudo)
+    os.replace(tmp_path, SNAPSHOT_PATH)
+
+
+def cargar(reconstruir: bool = False):
+    """Arma el índice; reutiliza del snapshot las historias cuya versión no cambió."""
+    global _cargado, _longitud_total
+    snapshot = {} if reconstruir else _leer_snapshot()
+    tokenizadas = 0
+    with _lock:
+        _postings.clear()
+        _terminos.clear()
+        _longitudes.clear()
+        _versiones.clear()
+        _longitud_total = 0
+        for h in storage.iter_historias():
+            previo = snapshot.get(h["id"])
+            version = h.get("version", 0)
+            if previo is not None and previo.get("v") == version:
+                terminos = previo["t"]
+            else:
+                terminos = terminos_historia(h)
+                tokenizadas += 1
+            _indexar(h["id"], terminos, version)
+        _cargado = True
+    if tokenizadas or len(snapshot) != len(_terminos):
+        guardar()
+    print(f"INFO: Índice de búsqueda cargado ({len(_terminos)} historias, {tokenizadas} tokenizadas, {len(_postings)} términos)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def actualizar(h: Dict[str, Any]):
+    _asegurar_cargado()
+    terminos = terminos_historia(h)
+    with _lock:
+        _desindexar(h["id"])
+        _indexar(h["id"], terminos, h.get("version", 0))
+
+
+def quitar(id_historia: str):
+    _asegurar_cargado()
+    with _lock:
+        _desindexar(id_historia)
+
+
+def buscar(q: str) -> Tuple[List[str], List[Tuple[float, str]]]:
+    """
+    Términos de la consulta y (puntaje, id) de las historias que los contienen
+    todos, de mayor a menor puntaje (a igual puntaje, por id).
+    """
+    _asegurar_cargado()
+    consulta = list(dict.fromkeys(tokenizar(q)))
+    if not consulta:
+        return consulta, []
+    with _lock:
+        listas = [_postings.get(t, {}) for t in consulta]
+        if not all(listas):
+            return consulta, []
+        n = len(_terminos)
+        promedio = _longitud_total / n if n else 1.0
+        # Se recorre la lista más corta y se verifica en las demás
+        orden = sorted(range(len(consulta)), key=lambda i: len(listas[i]))
+        idf = [math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for docs in listas]
+        resultados = []
+        for id_historia in listas[orden[0]]:
+            if not all(id_historia in listas[i] for i in orden[1:]):
+                continue
+            norma = K1 * (1 - B + B * _longitudes[id_historia] / promedio)
+            puntaje = 0.0
+            for i, docs in enumerate(listas):
+                frecuencia = docs[id_historia]
+                puntaje += idf[i] * frecuencia * (K1 + 1) / (frecuencia + norma)
+            resultados.append((round(puntaje, 6), id_historia))
+    resultados.sort(key=lambda r: (-r[0], r[1]))
+    return consulta, resultados
+
+
+def _fragmento(texto: str, consulta: List[str]) -> Optional[Dict[str, Any]]:
+    """Ventana del texto alrededor de la primera coincidencia, con las posiciones resaltables."""
+    normalizado = normalizar(texto)
+    coincidencias = [
+        (m.start(), m.end()) for m in _RE_PALABRA.finditer(normalizado)
+        if raiz(m.group()) in consulta
+    ]
+    if not coincidencias:
+        return None
+    inicio = max(0, coincidencias[0][0] - LARGO_FRAGMENTO // 3)
+    fin = min(len(texto), inicio + LARGO_FRAGMENTO)
+    # Cortar en límites de palabra
+    if inicio > 0:
+        espacio = texto.find(" ", inicio, coincidencias[0][0])
+        inicio = espacio + 1 if espacio != -1 else inicio
+    if fin < len(texto):
+        espacio = texto.rfind(" ", coincidencias[0][1], fin)
+        fin = espacio if espacio != -1 else fin
+    prefijo = "…" if inicio > 0 else ""
+    sufijo = "…" if fin < len(texto) else ""
+    return {
+        "texto": prefijo + texto[inicio:fin].replace("\n", " ") + sufijo,
+        "coincidencias": [
+            [a - inicio + len(prefijo), b - inicio + len(prefijo)]
+            for a, b in coincidencias if a >= inicio and b <= fin
+        ],
+    }
+
+
+def fragmentos(h: Dict[str, Any], consulta: List[str]) -> List[Dict[str, Any]]:
+    """Fragmentos de síntomas, evolución, estudios y comentario; si no hay, del texto original."""
+    secciones, original = _textos(h)
+    resultado = []
+    for seccion in SECCIONES_FRAGMENTO:
+        fragmento = _fragmento(secciones.get(seccion, ""), consulta)
+        if fragmento:
+            resultado.append({"seccion": seccion, **fragmento})
+    if not resultado:
+        for seccion, texto in list(secciones.items()) + [("texto_original", original)]:
+            fragmento = _fragmento(texto, consulta)
+            if fragmento:
+                resultado.append({"seccion": seccion, **fragmento})
+                break
+    return resultado
+
+
+def _on_cambio(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    if evento == "eliminada":
+        quitar(id_historia)
+    else:
+        actualizar(historia)
+
+
+storage.suscribir_historias(_on_cambio)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["reconstruir"]:
+        print("Uso: python -m app.services.busqueda_index reconstruir")
+        sys.exit(2)
+    cargar(reconstruir=True)
+    print(f"Índice de búsqueda guardado en {SNAPSHOT_PATH}")
@@ -0,0 +1,180 @@
+# backend/app/services/cohorte.py
+"""
+Tabla columnar de la cohorte para los reportes.
+
+Cada columna es un arreglo NumPy de capacidad creciente y cada historia ocupa
+una o más filas (una por historia en la tabla principal, una por estudio en la
+de RMN). Reemplazar o quitar una historia sólo marca sus filas viejas como
+muertas y agrega las nuevas al final; cuando las muertas superan a las vivas se
+compacta. Los textos repetidos (DNI, forma, droga) se guardan como códigos
+enteros de un Diccionario, así los group-by son bincount / lexsort sobre enteros.
+"""
+from typing import Dict, Any, List, Iterable, Tuple
+
+import numpy as np
+
+NAT = np.datetime64("NaT", "D")
+
+# nombre de columna -> (dtype, valor por defecto)
+Esquema = Dict[str, Tuple[Any, Any]]
+
+
+def dia(valor: Any) -> np.datetime64:
+    """'YYYY-MM-DD...' -> datetime64[D]; NaT si falta o no es una fecha."""
+    if not isinstance(valor, str) or len(valor) < 10:
+        return NAT
+    try:
+        return np.datetime64(valor[:10], "D")
+    except ValueError:
+        return NAT
+
+
+def edades(nacimiento: np.ndarray, referencia: np.ndarray) -> np.ndarray:
+    """Años cumplidos a la fecha de referencia (0 si falta alguna de las dos, como get_age)."""
+    validas = ~np.isnat(nacimiento) & ~np.isnat(referencia)
+    b = np.where(validas, nacimiento, np.datetime64("2000-01-01", "D"))
+    r = np.where(validas, referencia, np.datetime64("2000-01-01", "D"))
+    anios = r.astype("M8[Y]").astype(np.int64) - b.astype("M8[Y]").astype(np.int64)
+    anios -= _mes_dia(r) < _mes_dia(b)
+    return np.where(validas, anios, 0)
+
+
+def _mes_dia(d: np.ndarray) -> np.ndarray:
+    # (mes, día) como un entero comparable, sin depender de años bisiestos
+    mes = (d.astype("M8[M]") - d.astype("M8[Y]")).astype(np.int64)
+    return mes * 32 + (d - d.astype("M8[M]")).astype(np.int64)
+
+
+class Diccionario:
+    """Texto <-> código entero; None es -1."""
+
+    def __init__(self):
+        self._codigos: Dict[Any, int] = {}
+        self.valores: List[Any] = []
+
+    def codigo(self, valor: Any) -> int:
+        if valor is None:
+            return -1
+        codigo = self._codigos.get(valor)
+        if codigo is None:
+            codigo = self._codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return codigo
+
+    def __len__(self) -> int:
+        return len(self.valores)
+
+
+class TablaColumnar:
+    """Columnas NumPy con filas agrupadas por clave (el id de la historia)."""
+
+    def __init__(self, esquema: Esquema):
+        self._esquema = esquema
+        self._n = 0
+        self._muertas = 0
+        self._cols: Dict[str, np.ndarray] = {c: np.empty(0, dtype) for c, (dtype, _) in esquema.items()}
+        self._vivo = np.zeros(0, dtype=bool)
+        self._filas: Dict[str, List[int]] = {}
+        self._claves: List[str] = []  # clave de cada fila (vivas y muertas)
+
+    def __len__(self) -> int:
+        return self._n - self._muertas
+
+    def _crecer(self, minimo: int):
+        capacidad = len(self._vivo)
+        if minimo <= capacidad:
+            return
+        nueva = max(minimo, capacidad * 2, 1024)
+        for c, col in self._cols.items():
+            ampliada = np.empty(nueva, col.dtype)
+            ampliada[:self._n] = col[:self._n]
+            self._cols[c] = ampliada
+        vivo = np.zeros(nueva, dtype=bool)
+        vivo[:self._n] = self._vivo[:self._n]
+        self._vivo = vivo
+
+    def cargar(self, filas_por_clave: Iterable[Tuple[str, List[Dict[str, Any]]]]):
+        """Reemplaza el contenido completo armando cada columna de una vez."""
+        claves: List[str] = []
+        filas: List[Dict[str, Any]] = []
+        for clave, grupo in filas_por_clave:
+            claves.extend([clave] * len(grupo))
+            filas.extend(grupo)
+        self._n = len(filas)
+        self._muertas = 0
+        self._cols = {
+            c: np.array([f.get(c, vacio) for f in filas], dtype=dtype).reshape(-1)
+            for c, (dtype, vacio) in self._esquema.items()
+        }
+        self._vivo = np.ones(self._n, dtype=bool)
+        self._filas = {}
+        self._claves = claves
+        for i, clave in enumerate(claves):
+            self._filas.setdefault(clave, []).append(i)
+
+    def reemplazar(self, clave: str, filas: List[Dict[str, Any]]):
+        self.quitar(clave)
+        if not filas:
+            return
+        self._crecer(self._n + len(filas))
+        indices = []
+        for fila in filas:
+            i = self._n
+            for c, (_, vacio) in self._esquema.items():
+                self._cols[c][i] = fila.get(c, vacio)
+            self._vivo[i] = True
+            self._n += 1
+            self._claves.append(clave)
+            indices.append(i)
+        self._filas[clave] = indices
+
+    def quitar(self, clave: str):
+        indices = self._filas.pop(clave, None)
+        if not indices:
+            return
+        self._vivo[indices] = False
+        self._muertas += len(indices)
+        if self._muertas > max(1024, len(self)):
+            self._compactar()
+
+    def _compactar(self):
+        vivas = np.flatnonzero(self._vivo[:self._n])
+        nuevo_indice = np.full(self._n, -1, dtype=np.int64)
+        nuevo_indice[vivas] = np.arange(len(vivas))
+        for col in self._cols.values():
+            col[:len(vivas)] = col[vivas]
+        self._vivo[:] = False
+        self._vivo[:len(vivas)] = True
+        self._n = len(vivas)
+        self._muertas = 0
+        self._filas = {k: [int(nuevo_indice[i]) for i in v] for k, v in self._filas.items()}
+        self._claves = [self._claves[i] for i in vivas]
+
+    def columnas(self) -> Dict[str, np.ndarray]:
+        """
+        Filas vivas de cada columna (copias), más "clave": la posición de la clave
+        de cada fila en orden alfabético. No depende del orden de llegada, así
+        que da lo mismo con la tabla mantenida de a una historia que recargada.
+        """
+        vivo = self._vivo[:self._n]
+        datos = {c: col[:self._n][vivo] for c, col in self._cols.items()}
+        claves = np.array(self._claves, dtype=object)[vivo]
+        datos["clave"] = np.unique(claves, return_inverse=True)[1].reshape(-1) if len(claves) else np.empty(0, np.int64)
+        return datos
+
+
+def ultima_por_grupo(grupo: np.ndarray, fecha: np.ndarray, clave: np.ndarray) -> np.ndarray:
+    """Índice de la fila más reciente de cada grupo (a igual fecha, la de menor clave)."""
+    if len(grupo) == 0:
+        return np.empty(0, dtype=np.int64)
+    orden = np.lexsort((-clave, fecha, grupo))
+    g = grupo[orden]
+    ultimas = np.flatnonzero(np.append(g[1:] != g[:-1], True))
+    return orden[ultimas]
+
+
+def primera_por_grupo(grupo: np.ndarray, valores: np.ndarray, cantidad: int) -> np.ndarray:
+    """Mínimo de `valores` (enteros) por código de grupo; int64 max donde no hay."""
+    minimo = np.full(cantidad, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(minimo, grupo, valores)
+    return minimo
@@ -0,0 +1,146 @@
+# backend/app/services/dedup_index.py
+"""
+Índice persistente de deduplicación.
+
+Mapea la huella clínica (`build_dedup_key`) y el hash SHA-256 de los bytes
+subidos al id de la historia que los registró. Se persiste como un log de
+solo-anexado (una línea JSON por alta/baja), que se compacta al cargar, así que
+verificar un duplicado es una búsqueda en un dict y nunca abre las historias.
+"""
+import os
+import json
+import threading
+from typing import Dict, Any, Optional
+
+from app.services import storage
+
+INDEX_DIR = "./data/indices"
+LOG_PATH = os.path.join(INDEX_DIR, "dedup.log")
+
+_lock = threading.RLock()
+_por_historia: Dict[str, Dict[str, Optional[str]]] = {}  # id -> {dedup_key, hash_contenido}
+_por_clave: Dict[str, str] = {}
+_por_contenido: Dict[str, str] = {}
+_cargado = False
+
+
+def _indexar(id_historia: str, dedup_key: Optional[str], hash_contenido: Optional[str]):
+    _por_historia[id_historia] = {"dedup_key": dedup_key, "hash_contenido": hash_contenido}
+    if dedup_key:
+        _por_clave[dedup_key] = id_historia
+    if hash_contenido:
+        _por_contenido[hash_contenido] = id_historia
+
+
+def _desindexar(id_historia: str):
+    entrada = _por_historia.pop(id_historia, None)
+    if not entrada:
+        return
+    if _por_clave.get(entrada["dedup_key"]) == id_historia:
+        del _por_clave[entrada["dedup_key"]]
+    if _por_contenido.get(entrada["hash_contenido"]) == id_historia:
+        del _por_contenido[entrada["hash_contenido"]]
+
+
+def _append(registro: Dict[str, Any]):
+    # Una línea por operación + fsync: el alta/baja queda en disco o no queda
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with open(LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _reconstruir_desde_historias():
+    """Sólo la primera vez (sin log): un recorrido único de las historias."""
+    for h in storage.iter_historias_livianas():
+        _indexar(h["id"], h.get("dedup_key"), h.get("hash_contenido"))
+
+
+def _compactar():
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp_path = LOG_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for id_historia, entrada in _por_historia.items():
+            f.write(json.dumps({"op": "+", "id": id_historia, **entrada}, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, LOG_PATH)
+
+
+def cargar():
+    global _cargado
+    with _lock:
+        _por_historia.clear()
+        _por_clave.clear()
+        _por_contenido.clear()
+
+        if os.path.exists(LOG_PATH):
+            with open(LOG_PATH, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        reg = json.loads(linea)
+                    except json.JSONDecodeError:
+                        # Última línea truncada por un corte: se descarta
+                        continue
+                    if reg.get("op") == "-":
+                        _desindexar(reg["id"])
+                    else:
+                        _indexar(reg["id"], reg.get("dedup_key"), reg.get("hash_contenido"))
+        else:
+            _reconstruir_desde_historias()
+
+        _compactar()
+        _cargado = True
+    print(f"INFO: Índice de deduplicación cargado ({len(_por_historia)} registros)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def buscar_contenido(hash_contenido: str) -> Optional[str]:
+    _asegurar_cargado()
+    return _por_contenido.get(hash_contenido)
+
+
+def buscar_clave(dedup_key: str) -> Optional[str]:
+    _asegurar_cargado()
+    return _por_clave.get(dedup_key)
+
+
+def registrar(id_historia: str, dedup_key: str, hash_contenido: Optional[str] = None) -> Optional[str]:
+    """
+    Reserva la huella para `id_historia` de forma atómica.
+    Si la huella o el contenido ya pertenecen a otra historia devuelve ese id
+    y no registra nada; si no, devuelve None.
+    """
+    _asegurar_cargado()
+    with _lock:
+        existente = _por_clave.get(dedup_key) or (hash_contenido and _por_contenido.get(hash_contenido))
+        if existente and existente != id_historia:
+            return existente
+        _append({"op": "+", "id": id_historia, "dedup_key": dedup_key, "hash_contenido": hash_contenido})
+        _indexar(id_historia, dedup_key, hash_contenido)
+        return None
+
+
+def quitar(id_historia: str):
+    _asegurar_cargado()
+    with _lock:
+        if id_historia not in _por_historia:
+            return
+        _append({"op": "-", "id": id_historia})
+        _desindexar(id_historia)
+
+
+def _on_cambio(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    # El alta se reserva con registrar() antes de escribir; aquí sólo las bajas
+    if evento == "eliminada":
+        quitar(id_historia)
+
+
+storage.suscribir_historias(_on_cambio)
@@ -0,0 +1,127 @@
+# backend/app/services/extraction_cache.py
+"""
+Caché por contenido de la extracción de texto y del NLP.
+
+La clave es el SHA-256 de los bytes subidos + la extensión + la versión del
+extractor (EXTRACTOR_VERSION) y, para el borrador, también la del parser
+(NLP_VERSION). Re-importar el mismo archivo (aunque tenga otro nombre) no vuelve
+a correr pdfplumber/antiword, y después de un cambio en el parser sólo se
+re-ejecuta el NLP sobre el texto guardado.
+
+Los archivos viven en CACHE_DIR/<2 primeros hex>/<clave>.json. El tamaño total
+se acota con desalojo LRU (la fecha de modificación se renueva en cada acierto).
+Es seguro entre procesos: escrituras atómicas y un archivo desalojado por otro
+proceso cuenta simplemente como fallo de caché.
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from app.core import config
+from app.utils.extract_text import EXTRACTOR_VERSION
+
+CACHE_DIR = "./data/cache"
+
+_lock = threading.Lock()
+_bytes_desde_poda = 0
+
+
+def sha256_archivo(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _clave_texto(sha: str, ext: str) -> str:
+    return f"{sha}-{ext.lstrip('.').lower()}-x{EXTRACTOR_VERSION}"
+
+
+def _path(clave: str) -> str:
+    return os.path.join(CACHE_DIR, clave[:2], f"{clave}.json")
+
+
+def _leer(clave: str) -> Optional[Dict[str, Any]]:
+    path = _path(clave)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        os.utime(path)  # recencia para el LRU
+        return data
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    except OSError:
+        return None
+
+
+def _escribir(clave: str, data: Dict[str, Any]):
+    global _bytes_desde_poda
+    path = _path(clave)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # pid + thread: con IMPORT_EXECUTOR=thread dos imports de los mismos bytes escriben a la vez
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+    with _lock:
+        _bytes_desde_poda += os.path.getsize(path)
+        # Podar cada ~5% del máximo escrito: el escaneo del directorio no es por request
+        if _bytes_desde_poda >= config.CACHE_MAX_BYTES // 20:
+            _bytes_desde_poda = 0
+            podar()
+
+
+def podar():
+    """Desaloja lo menos usado hasta dejar la caché en el 90% de CACHE_MAX_BYTES."""
+    if not os.path.exists(CACHE_DIR):
+        return
+    entradas = []
+    total = 0
+    for shard in os.listdir(CACHE_DIR):
+        shard_dir = os.path.join(CACHE_DIR, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for fname in os.listdir(shard_dir):
+            if not fname.endswith(".json"):
+                continue
+            path = os.path.join(shard_dir, fname)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    if total <= config.CACHE_MAX_BYTES:
+        return
+    objetivo = int(config.CACHE_MAX_BYTES * 0.9)
+    for _, size, path in sorted(entradas):
+        if total <= objetivo:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+def obtener_texto(sha: str, ext: str) -> Optional[Dict[str, Any]]:
+    """{"texto", "paginas", "tipo"} o None."""
+    return _leer(_clave_texto(sha, ext))
+
+
+def guardar_texto(sha: str, ext: str, texto: str, paginas: int, tipo: str):
+    _escribir(_clave_texto(sha, ext), {"texto": texto, "paginas": paginas, "tipo": tipo})
+
+
+def obtener_borrador(sha: str, ext: str, nlp_version: str) -> Optional[Dict[str, Any]]:
+    data = _leer(f"{_clave_texto(sha, ext)}-n{nlp_version}")
+    return data.get("borrador") if data else None
+
+
+def guardar_borrador(sha: str, ext: str, nlp_version: str, borrador: Dict[str, Any]):
+    _escribir(f"{_clave_texto(sha, ext)}-n{nlp_version}", {"borrador": borrador})
@@ -0,0 +1,274 @@
+# backend/app/services/filtro_index.py
+"""
+Índices secundarios en memoria para `GET /historias/filtrar`.
+
+Por cada criterio de FiltrosHistoria hay un índice:
+
+- Igualdad (estado, criticidad, forma, sexo): valor -> conjunto de ids.
+- Texto (patología sobre el diagnóstico, medicamento sobre molécula/droga):
+  valor -> ids; el "contiene" del frontend se evalúa sobre los valores
+  distintos (decenas), no sobre las historias.
+- Rango (fecha de consulta, fecha de nacimiento para la edad, EDSS): lista
+  ordenada de (valor, id) recorrida con bisect.
+
+Una consulta intersecta los conjuntos empezando por el más chico, así que cuesta
+del orden de su resultado y no de un recorrido de todas las historias. Se carga
+al iniciar y se mantiene escuchando las escrituras de app/services/storage.py.
+"""
+import re
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from typing import Dict, Any, List, Optional, Set, Iterable
+
+from app.services import storage
+
+CAMPOS_IGUALDAD = ("estado", "criticidad", "forma", "sexo")
+CAMPOS_TEXTO = ("diagnostico", "medicamento")
+CAMPOS_RANGO = ("fecha_consulta", "fecha_nacimiento", "edss")
+
+_RE_FECHA = re.compile(r"^\d{4}-\d{2}-\d{2}")
+_MAX_ID = "\U0010ffff"
+
+_lock = threading.RLock()
+_atributos: Dict[str, Dict[str, Any]] = {}
+_igualdad: Dict[str, Dict[str, Set[str]]] = {c: {} for c in CAMPOS_IGUALDAD + CAMPOS_TEXTO}
+_rango: Dict[str, List[tuple]] = {c: [] for c in CAMPOS_RANGO}
+_cargado = False
+
+
+def _norm(valor: Any) -> Optional[str]:
+    if valor is None:
+        return None
+    texto = str(valor).strip().lower()
+    return texto or None
+
+
+def _fecha(valor: Any) -> Optional[str]:
+    if isinstance(valor, str) and _RE_FECHA.match(valor):
+        return valor[:10]
+    return None
+
+
+def _numero(valor: Any) -> Optional[float]:
+    try:
+        numero = float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    # Un NaN en la lista ordenada rompería el bisect de los rangos
+    return numero if math.isfinite(numero) else None
+
+
+def atributos_historia(h: Dict[str, Any]) -> Dict[str, Any]:
+    """Valores indexables de una historia (prioridad a la data validada)."""
+    data = h.get("validada") or h.get("borrador") or {}
+    paciente = data.get("paciente", {}) or {}
+    consulta = data.get("consulta", {}) or {}
+    enf = data.get("enfermedad", {}) or {}
+
+    medicamentos = set()
+    for t in data.get("tratamientos", []) or []:
+        for clave in ("molecula", "droga"):
+            valor = _norm(t.get(clave)) if isinstance(t, dict) else None
+            if valor:
+                medicamentos.add(valor)
+
+    return {
+        "estado": _norm(h.get("estado", "pendiente")),
+        "criticidad": _norm(h.get("nivel_criticidad", "medio")),
+        "forma": _norm(enf.get("forma")),
+        "sexo": _norm(paciente.get("sexo")),
+        "diagnostico": {_norm(enf.get("diagnostico"))} - {None},
+        "medicamento": medicamentos,
+        "fecha_consulta": _fecha(consulta.get("fecha")),
+        "fecha_nacimiento": _fecha(paciente.get("fecha_nacimiento")),
+        "edss": _numero(enf.get("edss")),
+    }
+
+
+def _valores(attrs: Dict[str, Any], campo: str) -> Iterable[str]:
+    valor = attrs.get(campo)
+    if isinstance(valor, set):
+        return valor
+    return (valor,) if valor is not None else ()
+
+
+def _indexar(id_historia: str, attrs: Dict[str, Any]):
+    _atributos[id_historia] = attrs
+    for campo, indice in _igualdad.items():
+        for valor in _valores(attrs, campo):
+            indice.setdefault(valor, set()).add(id_historia)
+    for campo, lista in _rango.items():
+        if attrs.get(campo) is not None:
+            insort(lista, (attrs[campo], id_historia))
+
+
+def _desindexar(id_historia: str):
+    attrs = _atributos.pop(id_historia, None)
+    if attrs is None:
+        return
+    for campo, indice in _igualdad.items():
+        for valor in _valores(attrs, campo):
+            ids = indice.get(valor)
+            if ids is not None:
+                ids.discard(id_historia)
+                if not ids:
+                    del indice[valor]
+    for campo, lista in _rango.items():
+        if attrs.get(campo) is not None:
+            i = bisect_left(lista, (attrs[campo], id_historia))
+            if i < len(lista) and lista[i] == (attrs[campo], id_historia):
+                del lista[i]
+
+
+def cargar():
+    global _cargado
+    with _lock:
+        _atributos.clear()
+        for indice in _igualdad.values():
+            indice.clear()
+        for lista in _rango.values():
+            lista.clear()
+        for h in storage.iter_historias_livianas():
+            attrs = atributos_historia(h)
+            _atributos[h["id"]] = attrs
+            for campo, indice in _igualdad.items():
+                for valor in _valores(attrs, campo):
+                    indice.setdefault(valor, set()).add(h["id"])
+            for campo, lista in _rango.items():
+                if attrs.get(campo) is not None:
+                    lista.append((attrs[campo], h["id"]))
+        # Carga inicial: un sort por índice en vez de un insort por historia
+        for lista in _rango.values():
+            lista.sort()
+        _cargado = True
+    print(f"INFO: Índices de filtrado cargados ({len(_atributos)} registros)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def actualizar(h: Dict[str, Any]):
+    _asegurar_cargado()
+    with _lock:
+        _desindexar(h["id"])
+        _indexar(h["id"], atributos_historia(h))
+
+
+def quitar(id_historia: str):
+    _asegurar_cargado()
+    with _lock:
+        _desindexar(id_historia)
+
+
+def pendientes_de_validacion() -> List[str]:
+    """Ids cuyo estado no es "validada", ordenados (recorre sólo esos grupos del índice)."""
+    _asegurar_cargado()
+    with _lock:
+        ids: Set[str] = set()
+        for estado, grupo in _igualdad["estado"].items():
+            if estado != "validada":
+                ids |= grupo
+        return sorted(ids)
+
+
+def _en_rango(campo: str, desde=None, hasta=None) -> Set[str]:
+    lista = _rango[campo]
+    i = bisect_left(lista, (desde,)) if desde is not None else 0
+    j = bisect_right(lista, (hasta, _MAX_ID)) if hasta is not None else len(lista)
+    return {id_h for _, id_h in lista[i:j]}
+
+
+def _contiene(campo: str, terminos: List[str]) -> Set[str]:
+    resultado: Set[str] = set()
+    for valor, ids in _igualdad[campo].items():
+        if any(t in valor for t in terminos):
+            resultado |= ids
+    return resultado
+
+
+def _restar_anios(d: date, anios: int) -> date:
+    try:
+        return d.replace(year=d.year - anios)
+    except ValueError:  # 29 de febrero
+        return d.replace(year=d.year - anios, day=28)
+
+
+def _rango_nacimiento(edad_min: Optional[int], edad_max: Optional[int], hoy: date):
+    # edad >= n  <=>  nació a más tardar hoy - n años
+    # edad <= n  <=>  nació después de hoy - (n + 1) años
+    hasta = _restar_anios(hoy, edad_min).isoformat() if edad_min is not None else None
+    desde = None
+    if edad_max is not None:
+        limite = _restar_anios(hoy, edad_max + 1)
+        desde = date.fromordinal(limite.toordinal() + 1).isoformat()
+    return desde, hasta
+
+
+def _terminos(valor: Optional[str]) -> List[str]:
+    # Selección múltiple del frontend: "Migraña|Esclerosis"
+    return [t for t in (_norm(p) for p in (valor or "").split("|")) if t]
+
+
+def filtrar(
+    patologia: Optional[str] = None,
+    forma: Optional[str] = None,
+    estado: Optional[str] = None,
+    criticidad: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    edad_min: Optional[int] = None,
+    edad_max: Optional[int] = None,
+    sexo: Optional[str] = None,
+    medicamento: Optional[str] = None,
+    edss_min: Optional[float] = None,
+    edss_max: Optional[float] = None,
+    hoy: Optional[date] = None,
+) -> List[str]:
+    """Ids de las historias que cumplen todos los criterios dados, ordenados por id."""
+    _asegurar_cargado()
+    with _lock:
+        candidatos: List[Set[str]] = []
+
+        for campo, valor in (("estado", estado), ("criticidad", criticidad), ("forma", forma), ("sexo", sexo)):
+            if _norm(valor):
+                candidatos.append(_igualdad[campo].get(_norm(valor), set()))
+
+        for campo, valor in (("diagnostico", patologia), ("medicamento", medicamento)):
+            terminos = _terminos(valor)
+            if terminos:
+                candidatos.append(_contiene(campo, terminos))
+
+        if fecha_desde or fecha_hasta:
+            candidatos.append(_en_rango("fecha_consulta", fecha_desde or None, fecha_hasta or None))
+        if edad_min is not None or edad_max is not None:
+            desde, hasta = _rango_nacimiento(edad_min, edad_max, hoy or date.today())
+            candidatos.append(_en_rango("fecha_nacimiento", desde, hasta))
+        if edss_min is not None or edss_max is not None:
+            candidatos.append(_en_rango("edss", edss_min, edss_max))
+
+        if not candidatos:
+            return sorted(_atributos)
+
+        candidatos.sort(key=len)
+        resultado = set(candidatos[0])
+        for conjunto in candidatos[1:]:
+            if not resultado:
+                break
+            resultado &= conjunto
+        return sorted(resultado)
+
+
+def _on_cambio(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    if evento == "eliminada":
+        quitar(id_historia)
+    else:
+        actualizar(historia)
+
+
+storage.suscribir_historias(_on_cambio)
@@ -0,0 +1,182 @@
+# backend/app/services/formato_compacto.py
+"""
+Formato binario compacto de una historia (STORAGE_BACKEND=compacto).
+
+Cada historia ocupa dos archivos:
+
+- {id}.nsh: MAGIC, dos largos (uint32 big endian) y dos bloques.
+  1. Encabezado, JSON compacto sin comprimir: los campos de primer nivel, el
+     borrador sin texto libre y la validada como diferencia contra el borrador
+     (también sin texto libre). Alcanza para los índices (resumen, filtros,
+     deduplicación), que lo leen sin tocar el resto del archivo.
+  2. Texto libre, JSON comprimido con zlib: las secciones de texto del
+     borrador y la parte de texto de la diferencia de la validada.
+- {id}.texto.z: el texto_original del borrador comprimido, que sólo se lee al
+  pedir la historia completa.
+
+La validada casi siempre es el borrador con pocas correcciones, así que se
+guarda como {"s": [[ruta, valor], ...], "d": [ruta, ...]} (claves a fijar y a
+borrar) en lugar de una segunda copia.
+"""
+import copy
+import json
+import zlib
+import struct
+from typing import Dict, Any, List, Optional, Tuple
+
+MAGIC = b"NSH1"
+_LARGOS = struct.Struct(">II")
+NIVEL_ZLIB = 6
+
+# Claves de borrador / validada que son texto libre (no van en el encabezado)
+TEXTO_LIBRE = ("secciones_texto", "texto_original")
+
+
+def _json(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def diferencia(base: Dict[str, Any], nuevo: Dict[str, Any], ruta: Tuple[str, ...] = ()) -> Dict[str, list]:
+    """Operaciones que convierten `base` en `nuevo` (recorre sólo dicts anidados)."""
+    fijar, borrar = [], []
+    for clave, valor in nuevo.items():
+        camino = ruta + (clave,)
+        if clave not in base:
+            fijar.append([list(camino), valor])
+        elif isinstance(valor, dict) and isinstance(base[clave], dict):
+            sub = diferencia(base[clave], valor, camino)
+            fijar.extend(sub["s"])
+            borrar.extend(sub["d"])
+        elif type(valor) is not type(base[clave]) or valor != base[clave]:
+            fijar.append([list(camino), valor])
+    for clave in base:
+        if clave not in nuevo:
+            borrar.append(list(ruta + (clave,)))
+    return {"s": fijar, "d": borrar}
+
+
+def aplicar_diferencia(base: Dict[str, Any], dif: Dict[str, list]) -> Dict[str, Any]:
+    """Copia de `base` con las operaciones de `diferencia` aplicadas."""
+    resultado = copy.deepcopy(base)
+    for camino in dif.get("d", []):
+        destino = resultado
+        for parte in camino[:-1]:
+            destino = destino.get(parte, {})
+        if isinstance(destino, dict):
+            destino.pop(camino[-1], None)
+    for camino, valor in dif.get("s", []):
+        destino = resultado
+        for parte in camino[:-1]:
+            if not isinstance(destino.get(parte), dict):
+                destino[parte] = {}
+            destino = destino[parte]
+        destino[camino[-1]] = valor
+    return resultado
+
+
+def _partir(dif: Dict[str, list]) -> Tuple[Dict[str, list], Dict[str, list]]:
+    """(estructurada, texto libre) según la primera clave de cada ruta."""
+    def libre(camino):
+        return camino[0] in TEXTO_LIBRE
+    return (
+        {"s": [o for o in dif["s"] if not libre(o[0])], "d": [c for c in dif["d"] if not libre(c)]},
+        {"s": [o for o in dif["s"] if libre(o[0])], "d": [c for c in dif["d"] if libre(c)]},
+    )
+
+
+def codificar(historia: Dict[str, Any]) -> Tuple[bytes, Optional[bytes]]:
+    """Bytes del .nsh y del texto original comprimido (None si no hay)."""
+    borrador = historia.get("borrador")
+    borrador = borrador if isinstance(borrador, dict) else None
+    validada = historia.get("validada")
+
+    encabezado = {k: v for k, v in historia.items() if k not in ("borrador", "validada")}
+    libre: Dict[str, Any] = {}
+    texto_original = None
+    if borrador is not None:
+        encabezado["borrador"] = {k: v for k, v in borrador.items() if k not in TEXTO_LIBRE}
+        libre["borrador"] = {k: v for k, v in borrador.items() if k == "secciones_texto"}
+        texto_original = borrador.get("texto_original")
+        if "texto_original" in borrador and not isinstance(texto_original, str):
+            libre["borrador"]["texto_original"] = texto_original  # raro: se guarda tal cual
+            texto_original = None
+    else:
+        encabezado["borrador"] = historia.get("borrador")
+
+    if isinstance(validada, dict):
+        estructurada, de_texto = _partir(diferencia(borrador or {}, validada))
+        encabezado["validada"] = estructurada
+        libre["validada"] = de_texto
+    else:
+        encabezado["validada"] = None
+        encabezado["validada_valor"] = validada  # None o un valor no dict, sin diferencia
+
+    crudo_encabezado = _json(encabezado)
+    crudo_libre = zlib.compress(_json(libre), NIVEL_ZLIB)
+    nsh = MAGIC + _LARGOS.pack(len(crudo_encabezado), len(crudo_libre)) + crudo_encabezado + crudo_libre
+    texto = zlib.compress(texto_original.encode("utf-8"), NIVEL_ZLIB) if isinstance(texto_original, str) else None
+    return nsh, texto
+
+
+def _partes(f, con_libre: bool) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("No es un registro compacto de historia")
+    largo_encabezado, largo_libre = _LARGOS.unpack(f.read(_LARGOS.size))
+    encabezado = json.loads(f.read(largo_encabezado).decode("utf-8"))
+    libre = json.loads(zlib.decompress(f.read(largo_libre)).decode("utf-8")) if con_libre else None
+    return encabezado, libre
+
+
+def _historia(encabezado: Dict[str, Any], libre: Optional[Dict[str, Any]], texto_original: Optional[str]) -> Dict[str, Any]:
+    historia = {k: v for k, v in encabezado.items() if k not in ("validada", "validada_valor")}
+    borrador = encabezado.get("borrador")
+    if isinstance(borrador, dict) and libre is not None:
+        borrador = {**borrador, **libre.get("borrador", {})}
+        if texto_original is not None:
+            borrador["texto_original"] = texto_original
+    historia["borrador"] = borrador
+    dif = encabezado.get("validada")
+    if dif is None:
+        historia["validada"] = encabezado.get("validada_valor")
+    else:
+        if libre is not None:
+            de_texto = libre.get("validada", {})
+            dif = {"s": dif["s"] + de_texto.get("s", []), "d": dif["d"] + de_texto.get("d", [])}
+        historia["validada"] = aplicar_diferencia(borrador if isinstance(borrador, dict) else {}, dif)
+    return historia
+
+
+def leer_liviana(path: str) -> Dict[str, Any]:
+    """Historia sin texto libre (sin secciones_texto ni texto_original): sólo el encabezado."""
+    with open(path, "rb") as f:
+        encabezado, _ = _partes(f, con_libre=False)
+    return _historia(encabezado, None, None)
+
+
+def leer(path: str, path_texto: str) -> Dict[str, Any]:
+    """Historia completa; el texto original sale de su archivo aparte."""
+    with open(path, "rb") as f:
+        encabezado, libre = _partes(f, con_libre=True)
+    texto_original = None
+    try:
+        with open(path_texto, "rb") as f:
+            texto_original = zlib.decompress(f.read()).decode("utf-8")
+    except FileNotFoundError:
+        pass
+    return _historia(encabezado, libre, texto_original)
+
+
+def version(path: str) -> int:
+    with open(path, "rb") as f:
+        encabezado, _ = _partes(f, con_libre=False)
+    return encabezado.get("version", 0)
+
+
+def liviana(historia: Dict[str, Any]) -> Dict[str, Any]:
+    """La misma proyección que leer_liviana, a partir de una historia completa."""
+    resultado = dict(historia)
+    for clave in ("borrador", "validada"):
+        data = historia.get(clave)
+        if isinstance(data, dict):
+            resultado[clave] = {k: v for k, v in data.items() if k not in TEXTO_LIBRE}
+    return resultado
@@ -0,0 +1,181 @@
+# backend/app/services/historia_index.py
+"""
+Índice en memoria de historias clínicas.
+
+Se carga una sola vez al iniciar el proceso y guarda únicamente la proyección
+resumida que devuelve `GET /historias`. Se mantiene actualizado escuchando las
+escrituras de la capa de persistencia (app/services/storage.py), de modo que el
+listado se sirve sin tocar el disco.
+
+Además mantiene una lista ordenada de claves por cada orden de listado
+("fecha": consulta más reciente primero; "id": ascendente) para paginar por
+cursor sin ordenar en cada pedido, y el índice DNI -> ids de historias que usan
+`GET /pacientes/{id}/historias` y el borrado en cascada de pacientes.
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from app.services import storage
+from app.utils import paginacion
+
+ORDENES = ("fecha", "id")
+
+_lock = threading.RLock()
+_resumenes: Dict[str, Dict[str, Any]] = {}
+_claves: Dict[str, List[tuple]] = {o: [] for o in ORDENES}
+_por_dni: Dict[str, Set[str]] = {}
+_cargado = False
+
+
+def resumen_historia(h: Dict[str, Any]) -> Dict[str, Any]:
+    # Priorizamos la data validada
+    data_source = h.get("validada") or h.get("borrador") or {}
+    enf = data_source.get("enfermedad", {}) or {}
+    paciente = data_source.get("paciente", {}) or {}
+    consulta = data_source.get("consulta", {}) or {}
+
+    return {
+        "id": h.get("id"),
+        "estado": h.get("estado", "pendiente"),
+        "nivel_criticidad": h.get("nivel_criticidad", "medio"),
+        "paciente": paciente,
+        "diagnostico": enf.get("diagnostico"),
+        "forma": enf.get("forma"),
+        "fecha_consulta": consulta.get("fecha"),
+    }
+
+
+def _clave(orden: str, resumen: Dict[str, Any]) -> tuple:
+    if orden == "fecha":
+        # Sin fecha queda al principio de la lista, es decir al final del listado
+        return (str(resumen.get("fecha_consulta") or ""), resumen["id"])
+    return (resumen["id"],)
+
+
+def _dni(resumen: Dict[str, Any]) -> str:
+    return storage.limpiar_dni((resumen.get("paciente") or {}).get("dni"))
+
+
+def _indexar(resumen: Dict[str, Any]):
+    _resumenes[resumen["id"]] = resumen
+    for orden, lista in _claves.items():
+        insort(lista, _clave(orden, resumen))
+    dni = _dni(resumen)
+    if dni:
+        _por_dni.setdefault(dni, set()).add(resumen["id"])
+
+
+def _desindexar(id_historia: str):
+    resumen = _resumenes.pop(id_historia, None)
+    if resumen is None:
+        return
+    for orden, lista in _claves.items():
+        clave = _clave(orden, resumen)
+        i = bisect_left(lista, clave)
+        if i < len(lista) and lista[i] == clave:
+            del lista[i]
+    dni = _dni(resumen)
+    ids = _por_dni.get(dni)
+    if ids is not None:
+        ids.discard(id_historia)
+        if not ids:
+            del _por_dni[dni]
+
+
+def cargar():
+    """Recorre las historias una única vez y reconstruye el índice completo."""
+    global _cargado
+    nuevos: Dict[str, Dict[str, Any]] = {}
+    # Sólo datos estructurados: en el formato compacto no se descomprime el texto libre
+    for h in storage.iter_historias_livianas():
+        nuevos[h["id"]] = resumen_historia(h)
+
+    claves = {o: sorted(_clave(o, r) for r in nuevos.values()) for o in ORDENES}
+    por_dni: Dict[str, Set[str]] = {}
+    for r in nuevos.values():
+        if _dni(r):
+            por_dni.setdefault(_dni(r), set()).add(r["id"])
+
+    with _lock:
+        _resumenes.clear()
+        _resumenes.update(nuevos)
+        _claves.update(claves)
+        _por_dni.clear()
+        _por_dni.update(por_dni)
+        _cargado = True
+    print(f"INFO: Índice de historias cargado ({len(nuevos)} registros)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def actualizar(h: Dict[str, Any]):
+    """Inserta o reemplaza el resumen de una historia recién escrita."""
+    _asegurar_cargado()
+    resumen = resumen_historia(h)
+    with _lock:
+        _desindexar(h["id"])
+        _indexar(resumen)
+
+
+def quitar(id_historia: str):
+    _asegurar_cargado()
+    with _lock:
+        _desindexar(id_historia)
+
+
+def listar() -> List[Dict[str, Any]]:
+    _asegurar_cargado()
+    with _lock:
+        return list(_resumenes.values())
+
+
+def total() -> int:
+    _asegurar_cargado()
+    return len(_resumenes)
+
+
+def pagina(
+    orden: str = "fecha",
+    despues: Optional[tuple] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[tuple]]:
+    """Resúmenes siguientes a la clave `despues` y la clave para pedir la próxima página (o None)."""
+    _asegurar_cargado()
+    with _lock:
+        claves, hay_mas = paginacion.cortar(_claves[orden], despues, limit, descendente=(orden == "fecha"))
+        items = [_resumenes[c[-1]] for c in claves]
+    siguiente = claves[-1] if hay_mas and claves else None
+    return items, siguiente
+
+
+def ids_por_dni(dni: Any) -> List[str]:
+    """Ids de las historias del paciente, consulta más reciente primero (sin fecha al final)."""
+    _asegurar_cargado()
+    objetivo = storage.limpiar_dni(dni)
+    with _lock:
+        resumenes = [_resumenes[i] for i in _por_dni.get(objetivo, ())]
+    resumenes.sort(key=lambda r: _clave("fecha", r), reverse=True)
+    return [r["id"] for r in resumenes]
+
+
+def obtener(ids: List[str]) -> List[Dict[str, Any]]:
+    """Resúmenes de los ids dados (los que ya no existen se omiten)."""
+    _asegurar_cargado()
+    with _lock:
+        return [_resumenes[i] for i in ids if i in _resumenes]
+
+
+def _on_cambio(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    if evento == "eliminada":
+        quitar(id_historia)
+    else:
+        actualizar(historia)
+
+
+storage.suscribir_historias(_on_cambio)
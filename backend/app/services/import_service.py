@@ -1 +1,316 @@
-# Servicio de importación (placeholder)
+# backend/app/services/import_service.py
+# Orquestación de importaciones: lo comparten la importación individual y la de lotes.
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from app.core import config
+from app.services import nlp_service, patient_service, dedup_index, job_queue, extraction_cache, storage
+from app.utils.extract_text import (
+    extract_text, paginas_pdf, tiempos_antiword, marcar_worker_importacion, shutdown_pdf_pool
+)
+
+UPLOAD_DIR = "./uploads"
+EXTENSIONES_PERMITIDAS = [".docx", ".pdf", ".doc"]
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Reintentos de la unidad historia + paciente cuando otro escritor cambia al paciente
+REINTENTOS_CONFLICTO = 3
+
+
+class DocumentoDuplicado(Exception):
+    """La huella o el contenido del documento ya pertenecen a otra historia."""
+
+
+class ArchivoDemasiadoGrande(Exception):
+    """El upload supera el tamaño máximo configurado."""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_semaforo: Optional[asyncio.Semaphore] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Pool de procesos compartido para extract_text + nlp_service.process."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=config.IMPORT_WORKERS, initializer=marcar_worker_importacion)
+    return _pool
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Pool de threads para la E/S del pipeline (o para el NLP si IMPORT_EXECUTOR=thread)."""
+    global _thread_pool
+    if _thread_pool is None:
+        with _pool_lock:
+            if _thread_pool is None:
+                _thread_pool = ThreadPoolExecutor(max_workers=config.IMPORT_CONCURRENCY, thread_name_prefix="import")
+    return _thread_pool
+
+
+def shutdown_process_pool():
+    global _pool, _thread_pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=False, cancel_futures=True)
+            _thread_pool = None
+    shutdown_pdf_pool()
+
+
+def build_dedup_key(borrador: dict) -> str:
+    paciente = borrador.get("paciente", {}) or {}
+    consulta = borrador.get("consulta", {}) or {}
+    enf = borrador.get("enfermedad", {}) or {}
+
+    dni = (paciente.get("dni") or "").strip()
+    fecha_consulta = (consulta.get("fecha") or "").strip()
+    dx = (enf.get("diagnostico") or "").strip().lower()
+
+    texto = (borrador.get("texto_original") or "").strip().lower()
+    h = hashlib.sha256(texto.encode("utf-8")).hexdigest()[:10] if texto else "vac"
+
+    if dni and fecha_consulta:
+        return f"DNI:{dni}|F:{fecha_consulta}|H:{h}"
+
+    return f"F:{fecha_consulta}|DX:{dx}|H:{h}"
+
+
+def nuevo_archivo_upload(nombre_original: str, ext: str):
+    """Devuelve (id_historia, nombre_archivo, ruta) para un upload nuevo."""
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # time_ns evita colisiones cuando un lote guarda varios archivos en el mismo segundo
+    random_suffix = hashlib.md5(f"{nombre_original}{time.time_ns()}".encode()).hexdigest()[:4]
+    new_filename = f"historia_{ts}_{random_suffix}{ext}"
+    return f"{ts}_{random_suffix}", new_filename, os.path.join(UPLOAD_DIR, new_filename)
+
+
+def extraer_en_principal(file_path: str, hash_contenido: Optional[str] = None) -> Optional[Tuple[str, int, str]]:
+    """
+    Con IMPORT_EXECUTOR=process los workers de importación no reparten páginas.
+    Un PDF de PDF_PARALLEL_MIN_PAGES o más se extrae acá, en el proceso principal,
+    con el pool de páginas compartido; al worker le queda sólo el NLP. Devuelve
+    (texto, paginas, tipo) o None si el documento sigue el camino normal.
+    """
+    if config.IMPORT_EXECUTOR == "thread" or config.PDF_WORKERS < 2:
+        return None  # con threads la extracción ya corre en este proceso y reparte sola
+    ext = os.path.splitext(file_path)[1]
+    if ext.lower() != ".pdf":
+        return None
+    if hash_contenido and extraction_cache.obtener_texto(hash_contenido, ext) is not None:
+        return None
+    if paginas_pdf(file_path) < config.PDF_PARALLEL_MIN_PAGES:
+        return None
+    return extract_text(file_path, paralelo=True)
+
+
+def procesar_archivo(file_path: str, hash_contenido: Optional[str] = None,
+                     extraccion: Optional[Tuple[str, int, str]] = None) -> Dict[str, Any]:
+    """
+    Parte CPU-bound del pipeline. Corre en un proceso del pool (debe ser picklable).
+    Pasa por la caché por contenido: mismos bytes -> ni extracción ni NLP de nuevo.
+    extraccion: (texto, paginas, tipo) ya extraído por extraer_en_principal.
+    """
+    return procesar_archivo_medido(file_path, hash_contenido, extraccion)[0]
+
+
+def procesar_archivo_medido(file_path: str, hash_contenido: Optional[str] = None,
+                            extraccion: Optional[Tuple[str, int, str]] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    procesar_archivo más los tiempos de extracción que sólo se ven dentro del
+    worker (antiword: espera, spawn, run). Vacíos si no hubo que extraer.
+    """
+    sha = hash_contenido or extraction_cache.sha256_archivo(file_path)
+    ext = os.path.splitext(file_path)[1]
+    nombre_archivo = os.path.basename(file_path)
+    tiempos: Dict[str, float] = {}
+
+    borrador = extraction_cache.obtener_borrador(sha, ext, nlp_service.NLP_VERSION)
+    if borrador is not None:
+        borrador["fuente"]["nombre_archivo"] = nombre_archivo
+        return borrador, tiempos
+
+    cacheado = extraction_cache.obtener_texto(sha, ext) if extraccion is None else None
+    if cacheado is not None:
+        texto, tipo = cacheado["texto"], cacheado["tipo"]
+    else:
+        if extraccion is None:
+            tiempos_antiword()  # descarta una medición vieja de este thread
+            extraccion = extract_text(file_path)
+            tiempos = tiempos_antiword()
+        texto, paginas, tipo = extraccion
+        # Los errores de extracción (antiword ausente, PDF roto) no se cachean
+        if not tipo.startswith("Error"):
+            extraction_cache.guardar_texto(sha, ext, texto, paginas, tipo)
+
+    borrador = nlp_service.process_text(texto, tipo, nombre_archivo)
+    if not tipo.startswith("Error"):
+        extraction_cache.guardar_borrador(sha, ext, nlp_service.NLP_VERSION, borrador)
+    return borrador, tiempos
+
+
+async def procesar_archivo_async(file_path: str, hash_contenido: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Corre procesar_archivo fuera del event loop (pool de procesos o de threads
+    según IMPORT_EXECUTOR), con a lo sumo IMPORT_CONCURRENCY documentos en curso.
+    """
+    global _semaforo
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(config.IMPORT_CONCURRENCY)
+    pool = get_thread_pool() if config.IMPORT_EXECUTOR == "thread" else get_process_pool()
+    async with _semaforo:
+        extraccion = await run_io(extraer_en_principal, file_path, hash_contenido)
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, procesar_archivo, file_path, hash_contenido, extraccion)
+
+
+async def run_io(fn, *args):
+    """E/S bloqueante del pipeline (escritura de archivos, upsert, dedup) en el pool de threads."""
+    return await asyncio.get_running_loop().run_in_executor(get_thread_pool(), fn, *args)
+
+
+async def guardar_upload(upload, file_path: str, max_bytes: int) -> Tuple[int, str]:
+    """
+    Copia el UploadFile a disco en bloques de UPLOAD_CHUNK_SIZE calculando el
+    SHA-256 al vuelo (dedup y caché lo usan sin releer el archivo). Corta con
+    ArchivoDemasiadoGrande apenas se pasa de max_bytes. Devuelve (bytes, sha256).
+    """
+    size = getattr(upload, "size", None)
+    if size is not None and size > max_bytes:
+        raise ArchivoDemasiadoGrande(upload.filename)
+
+    h = hashlib.sha256()
+    total = 0
+    buffer = await run_io(open, file_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise ArchivoDemasiadoGrande(upload.filename)
+            h.update(chunk)
+            await run_io(buffer.write, chunk)
+    except BaseException:
+        buffer.close()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    buffer.close()
+    return total, h.hexdigest()
+
+
+def extraer_de_zip(zf, info, file_path: str, max_bytes: int) -> Tuple[int, str]:
+    """Igual que guardar_upload pero para un miembro de un .zip (síncrono: correr con run_io)."""
+    if info.file_size > max_bytes:
+        raise ArchivoDemasiadoGrande(info.filename)
+    h = hashlib.sha256()
+    total = 0
+    try:
+        with zf.open(info) as origen, open(file_path, "wb") as buffer:
+            for chunk in iter(lambda: origen.read(UPLOAD_CHUNK_SIZE), b""):
+                total += len(chunk)
+                if total > max_bytes:
+                    raise ArchivoDemasiadoGrande(info.filename)
+                h.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return total, h.hexdigest()
+
+
+def registrar_historia(id_historia: str, borrador: Dict[str, Any], hash_contenido: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parte de persistencia del pipeline: paciente maestro, deduplicación y guardado.
+    Lanza DocumentoDuplicado si la huella ya existe.
+    """
+    # Construir huella clínica
+    dedup_key = build_dedup_key(borrador)
+
+    historia = {
+        "id": id_historia,
+        "estado": "pendiente_validacion",
+        "dedup_key": dedup_key,
+        "hash_contenido": hash_contenido,
+        "borrador": borrador,
+        "validada": None
+    }
+
+    # Verificar duplicados y reservar la huella en una sola operación
+    if dedup_index.registrar(historia["id"], dedup_key, hash_contenido):
+        raise DocumentoDuplicado(dedup_key)
+
+    try:
+        for intento in range(REINTENTOS_CONFLICTO):
+            try:
+                # Historia + paciente maestro en una sola unidad del journal
+                with storage.transaccion():
+                    # --- CREAR O ACTUALIZAR PACIENTE ---
+                    try:
+                        if borrador.get("paciente"):
+                            patient_service.upsert_paciente_from_nlp(borrador["paciente"])
+                    except Exception as e:
+                        print(f"Advertencia: No se pudo guardar el paciente maestro: {e}")
+
+                    storage.save_historia(historia)
+                break
+            except storage.ConflictoVersion:
+                # Otro import o una edición tocó al paciente: se vuelve a mezclar sobre lo nuevo
+                if intento == REINTENTOS_CONFLICTO - 1:
+                    raise
+    except Exception:
+        dedup_index.quitar(historia["id"])
+        raise
+    return historia
+
+
+def ejecutar_job_importacion(job: Dict[str, Any]):
+    """Handler de la cola para POST /importaciones/historias?modo=async."""
+    file_path = job["file_path"]
+    pool = get_thread_pool() if config.IMPORT_EXECUTOR == "thread" else get_process_pool()
+
+    with job_queue.Etapa(job, "extraccion_nlp"):
+        try:
+            extraccion = extraer_en_principal(file_path, job.get("hash_contenido"))
+            borrador, tiempos_extraccion = pool.submit(
+                procesar_archivo_medido, file_path, job.get("hash_contenido"), extraccion).result()
+        except Exception:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+    if tiempos_extraccion:
+        job_queue.actualizar(job, tiempos={**(job.get("tiempos") or {}), **tiempos_extraccion})
+
+    with job_queue.Etapa(job, "registro"):
+        try:
+            # Idempotente ante un re-encolado: la huella ya reservada por este id no es duplicado
+            registrar_historia(job["id_historia"], borrador, job.get("hash_contenido"))
+        except DocumentoDuplicado:
+            os.remove(file_path)
+            job_queue.actualizar(job, estado="duplicado", etapa="completado",
+                                 error="Este documento exacto ya fue importado previamente.")
+            return
+        except Exception:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+    job_queue.actualizar(job, historia_id=job["id_historia"])
+
+
+job_queue.registrar_handler("importacion", ejecutar_job_importacion)
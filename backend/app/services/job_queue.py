@@ -0,0 +1,323 @@
+# backend/app/services/job_queue.py
+"""
+Cola local de trabajos en segundo plano, persistida en disco.
+
+Cada trabajo es un JSON en JOBS_DIR que se reescribe en cada cambio de etapa.
+Un worker toma un trabajo reservándolo a nombre de su proceso ("duenio",
+"reserva_hasta") bajo el bloqueo entre procesos de storage, y un thread
+vigilante renueva la reserva cada JOB_LEASE / 3 segundos mientras corre. Al
+iniciar se vuelven a encolar los trabajos "en_cola" y los "procesando" cuya
+reserva venció o cuyo proceso ya no existe (p. ej. por un reinicio); los que
+otro proceso sigue renovando sólo se vigilan. Los tipos de trabajo se
+registran con `registrar_handler(tipo, fn)`; el handler recibe el dict del
+trabajo y reporta avances con `actualizar(job, ...)`.
+
+Los trabajos terminados se borran JOB_RETENCION_HORAS después de su último
+cambio (`podar()`, al iniciar y cada hora desde el vigilante). Los pendientes
+se siguen en memoria para que `activo()` no recorra todo el directorio.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import threading
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, Set
+
+from app.core import config
+from app.services import storage
+
+JOBS_DIR = "./data/jobs"
+ESTADOS_PENDIENTES = ("en_cola", "procesando")
+PODAR_CADA = 3600  # segundos entre podas desde el vigilante
+
+_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+_cola: "queue.Queue[str]" = queue.Queue()
+_lock = threading.Lock()
+_workers = []
+_en_curso: Dict[str, Dict[str, Any]] = {}  # trabajos que corre este proceso (se renuevan)
+_ajenos: Set[str] = set()                   # reservados por otro proceso al iniciar (se vigilan)
+_pendientes: Optional[Dict[str, str]] = None  # id -> tipo de los que siguen en cola o procesándose
+_pendientes_lock = threading.Lock()
+
+
+def _path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _guardar(job: Dict[str, Any]):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _path(job["id"])
+    # Temporal propio de cada thread: el vigilante y el worker pueden guardar a la vez
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    with _pendientes_lock:
+        if _pendientes is not None:
+            if job.get("estado") in ESTADOS_PENDIENTES:
+                _pendientes[job["id"]] = job.get("tipo")
+            else:
+                _pendientes.pop(job["id"], None)
+
+
+def _leer_directorio():
+    """(id, trabajo) de cada JSON legible en JOBS_DIR."""
+    if not os.path.exists(JOBS_DIR):
+        return
+    for fname in os.listdir(JOBS_DIR):
+        if not fname.endswith(".json"):
+            continue
+        try:
+            job = obtener(fname[:-5])
+        except Exception:
+            continue
+        if job:
+            yield fname[:-5], job
+
+
+def _indice_pendientes() -> Dict[str, str]:
+    """Pendientes conocidos por este proceso; la primera vez sale del disco."""
+    global _pendientes
+    with _pendientes_lock:
+        if _pendientes is None:
+            _pendientes = {
+                job_id: job.get("tipo") for job_id, job in _leer_directorio()
+                if job.get("estado") in ESTADOS_PENDIENTES
+            }
+        return dict(_pendientes)
+
+
+def registrar_handler(tipo: str, fn: Callable[[Dict[str, Any]], None]):
+    _handlers[tipo] = fn
+
+
+def obtener(job_id: str) -> Optional[Dict[str, Any]]:
+    path = _path(job_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def activo(tipo: str) -> Optional[Dict[str, Any]]:
+    """El trabajo de ese tipo que sigue en cola o procesándose, si hay uno."""
+    for job_id, tipo_job in _indice_pendientes().items():
+        if tipo_job != tipo:
+            continue
+        try:
+            job = obtener(job_id)
+        except Exception:
+            continue
+        if job and job.get("estado") in ESTADOS_PENDIENTES:
+            return job
+    return None
+
+
+def podar() -> int:
+    """
+    Borra los trabajos terminados sin cambios desde hace más de
+    JOB_RETENCION_HORAS y los temporales de escrituras cortadas. Devuelve
+    cuántos trabajos borró.
+    """
+    if config.JOB_RETENCION_HORAS <= 0 or not os.path.exists(JOBS_DIR):
+        return 0
+    limite = time.time() - config.JOB_RETENCION_HORAS * 3600
+    borrados = 0
+    for fname in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, fname)
+        try:
+            if os.path.getmtime(path) >= limite:
+                continue
+            if fname.endswith(".tmp"):
+                os.remove(path)
+            elif fname.endswith(".json"):
+                job = obtener(fname[:-5])
+                if job and job.get("estado") not in ESTADOS_PENDIENTES:
+                    os.remove(path)
+                    borrados += 1
+        except (OSError, ValueError):
+            continue
+    return borrados
+
+
+def encolar(tipo: str, datos: Dict[str, Any]) -> Dict[str, Any]:
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "tipo": tipo,
+        "estado": "en_cola",
+        "etapa": "en_cola",
+        "creado": datetime.now().isoformat(),
+        "actualizado": datetime.now().isoformat(),
+        "tiempos": {},
+        "error": None,
+        **datos,
+    }
+    _guardar(job)
+    _cola.put(job["id"])
+    return job
+
+
+def actualizar(job: Dict[str, Any], **campos):
+    """Aplica los cambios al trabajo y los persiste (lo llaman los handlers)."""
+    with _lock:
+        job.update(campos)
+        job["actualizado"] = datetime.now().isoformat()
+        _guardar(job)
+
+
+class Etapa:
+    """`with Etapa(job, "extraccion_nlp"):` marca la etapa y registra su duración."""
+
+    def __init__(self, job: Dict[str, Any], nombre: str):
+        self.job = job
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        actualizar(self.job, etapa=self.nombre)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        tiempos = dict(self.job.get("tiempos") or {})
+        tiempos[self.nombre] = round(time.perf_counter() - self.inicio, 3)
+        actualizar(self.job, tiempos=tiempos)
+        return False
+
+
+def _duenio() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _proceso_vivo(pid: int) -> bool:
+    if pid == os.getpid() or os.name == "nt":
+        return True  # en Windows os.kill terminaría el proceso: sólo cuenta el vencimiento
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # existe pero es de otro usuario
+    return True
+
+
+def _reserva_vigente(job: Dict[str, Any]) -> bool:
+    """Un trabajo "procesando" cuyo proceso sigue vivo y renovando la reserva."""
+    if job.get("estado") != "procesando" or job.get("reserva_hasta", 0) < time.time():
+        return False
+    host, _, pid = (job.get("duenio") or "").rpartition(":")
+    if host == socket.gethostname() and pid.isdigit():
+        return _proceso_vivo(int(pid))
+    return True
+
+
+def _reservar(job_id: str) -> Optional[Dict[str, Any]]:
+    """Pasa el trabajo a "procesando" a nombre de este proceso, salvo que ya lo tenga alguien."""
+    with storage.bloqueo_entre_procesos():
+        job = obtener(job_id)
+        if not job or job.get("estado") not in ESTADOS_PENDIENTES or _reserva_vigente(job):
+            return None
+        actualizar(job, estado="procesando", duenio=_duenio(), reserva_hasta=time.time() + config.JOB_LEASE)
+    with _lock:
+        _en_curso[job_id] = job
+    return job
+
+
+def _ejecutar(job_id: str):
+    job = _reservar(job_id)
+    if job is None:
+        return
+    try:
+        handler = _handlers.get(job.get("tipo"))
+        if handler is None:
+            actualizar(job, estado="error", error=f"Tipo de trabajo desconocido: {job.get('tipo')}")
+            return
+
+        inicio = time.perf_counter()
+        try:
+            handler(job)
+            if job.get("estado") == "procesando":
+                actualizar(job, estado="completado", etapa="completado")
+        except Exception as e:
+            print(f"ERROR: Trabajo {job_id} falló: {e}")
+            actualizar(job, estado="error", error=str(e))
+        finally:
+            tiempos = dict(job.get("tiempos") or {})
+            tiempos["total"] = round(time.perf_counter() - inicio, 3)
+            actualizar(job, tiempos=tiempos)
+    finally:
+        with _lock:
+            _en_curso.pop(job_id, None)
+
+
+def _worker():
+    while True:
+        job_id = _cola.get()
+        try:
+            _ejecutar(job_id)
+        except Exception as e:
+            print(f"ERROR: Worker de trabajos: {e}")
+        finally:
+            _cola.task_done()
+
+
+def _renovar_reservas():
+    with _lock:
+        propios = list(_en_curso.values())
+    for job in propios:
+        actualizar(job, reserva_hasta=time.time() + config.JOB_LEASE)
+
+
+def _reencolar_vencidos():
+    """Los trabajos de otro proceso vuelven a la cola cuando su reserva vence."""
+    for job_id in list(_ajenos):
+        job = obtener(job_id)
+        if not job or job.get("estado") not in ESTADOS_PENDIENTES:
+            _ajenos.discard(job_id)
+        elif not _reserva_vigente(job):
+            _ajenos.discard(job_id)
+            _cola.put(job_id)
+
+
+def _vigilar():
+    ultima_poda = time.monotonic()
+    while True:
+        time.sleep(max(1, config.JOB_LEASE // 3))
+        try:
+            _renovar_reservas()
+            _reencolar_vencidos()
+            if time.monotonic() - ultima_poda >= PODAR_CADA:
+                ultima_poda = time.monotonic()
+                podar()
+        except Exception as e:
+            print(f"ERROR: Vigilante de trabajos: {e}")
+
+
+def iniciar():
+    """Arranca los workers y re-encola lo que quedó pendiente de una ejecución anterior."""
+    if _workers:
+        return
+    borrados = podar()
+    if borrados:
+        print(f"INFO: {borrados} trabajos terminados borrados (retención {config.JOB_RETENCION_HORAS} h)")
+    if os.path.exists(JOBS_DIR):
+        pendientes = [job for _, job in _leer_directorio() if job.get("estado") in ESTADOS_PENDIENTES]
+        reencolados = 0
+        for job in sorted(pendientes, key=lambda j: j.get("creado") or ""):
+            if _reserva_vigente(job):
+                _ajenos.add(job["id"])  # lo está procesando otro proceso
+            else:
+                _cola.put(job["id"])
+                reencolados += 1
+        if reencolados:
+            print(f"INFO: {reencolados} trabajos pendientes re-encolados")
+
+    for i in range(config.JOB_WORKERS):
+        t = threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+    t = threading.Thread(target=_vigilar, name="job-vigilante", daemon=True)
+    t.start()
+    _workers.append(t)
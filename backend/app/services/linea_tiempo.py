@@ -0,0 +1,207 @@
+# backend/app/services/linea_tiempo.py
+"""
+Línea de tiempo por paciente para `GET /pacientes/{id}/linea-tiempo` y
+`GET /pacientes/{id}/analisis`.
+
+Por cada DNI se guarda una entrada compacta por historia (fecha, estado,
+diagnóstico, EDSS, DMT, tratamientos de soporte, motivo de cambio), calculada
+al guardar la historia: se mantiene escuchando las escrituras de
+app/services/storage.py (importación, validación, borrado). La línea de tiempo
+armada de cada paciente se reutiliza hasta que cambia una de sus historias, así
+que abrir el análisis de un paciente no recorre la cohorte.
+"""
+import math
+import threading
+from typing import Dict, Any, List, Optional
+
+from app.services import storage
+from app.services.report_service import MOTIVOS, clasificar_potencia
+
+_lock = threading.RLock()
+_entradas: Dict[str, Dict[str, Dict[str, Any]]] = {}  # dni -> {id historia -> entrada}
+_dni_de: Dict[str, str] = {}                          # id historia -> dni
+_armadas: Dict[str, List[Dict[str, Any]]] = {}        # dni -> entradas ordenadas por fecha
+_cargado = False
+
+
+def _edss(valor: Any) -> Optional[float]:
+    try:
+        edss = float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    # "nan" / "inf" también parsean: no son un puntaje (ni JSON válido)
+    return edss if math.isfinite(edss) else None
+
+
+def entrada_historia(h: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Lo que la historia aporta a la línea de tiempo de su paciente (None sin DNI)."""
+    data = h.get("validada") or h.get("borrador") or {}
+    paciente = data.get("paciente", {}) or {}
+    dni = storage.limpiar_dni(paciente.get("dni"))
+    if not dni:
+        return None
+    enf = data.get("enfermedad", {}) or {}
+    secciones = data.get("secciones_texto", {}) or {}
+    tratamientos = [t for t in data.get("tratamientos", []) or [] if isinstance(t, dict)]
+
+    dmt, soporte = [], []
+    for t in tratamientos:
+        droga = t.get("droga") or t.get("molecula")
+        if not droga:
+            continue
+        # Lo que no es un DMT conocido (kinesiología, sintomáticos...) es soporte
+        destino = soporte if clasificar_potencia(droga) == "sin_tratamiento" else dmt
+        if droga not in destino:
+            destino.append(droga)
+
+    com = (secciones.get("comentario") or "").lower()
+    motivo = next((nombre for nombre, claves, _ in MOTIVOS if any(x in com for x in claves)), None)
+
+    return {
+        "id": h.get("id"),
+        "dni": dni,
+        "fecha": (data.get("consulta", {}) or {}).get("fecha"),
+        "estado": h.get("estado", "pendiente"),
+        "diagnostico": enf.get("diagnostico"),
+        "forma": enf.get("forma"),
+        "edss": _edss(enf.get("edss")),
+        "dmt": dmt,
+        "soporte": soporte,
+        "suspendidos": [t.get("droga") for t in tratamientos if t.get("estado") == "Suspendido" and t.get("droga")],
+        "motivo": motivo,
+    }
+
+
+def cargar():
+    global _cargado
+    with _lock:
+        _entradas.clear()
+        _dni_de.clear()
+        _armadas.clear()
+        for h in storage.iter_historias():
+            e = entrada_historia(h)
+            if e is not None:
+                _entradas.setdefault(e["dni"], {})[e["id"]] = e
+                _dni_de[e["id"]] = e["dni"]
+        _cargado = True
+    print(f"INFO: Líneas de tiempo cargadas ({len(_entradas)} pacientes)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def quitar(id_historia: str):
+    _asegurar_cargado()
+    with _lock:
+        dni = _dni_de.pop(id_historia, None)
+        if dni is None:
+            return
+        historias = _entradas.get(dni, {})
+        historias.pop(id_historia, None)
+        if not historias:
+            _entradas.pop(dni, None)
+        _armadas.pop(dni, None)
+
+
+def actualizar(h: Dict[str, Any]):
+    _asegurar_cargado()
+    e = entrada_historia(h)
+    with _lock:
+        quitar(h["id"])
+        if e is not None:
+            _entradas.setdefault(e["dni"], {})[e["id"]] = e
+            _dni_de[e["id"]] = e["dni"]
+            _armadas.pop(e["dni"], None)
+
+
+def _ordenadas(dni: Any) -> List[Dict[str, Any]]:
+    """Entradas del paciente de la consulta más vieja a la más reciente (sin fecha al principio)."""
+    _asegurar_cargado()
+    dni = storage.limpiar_dni(dni)
+    with _lock:
+        armada = _armadas.get(dni)
+        if armada is None:
+            armada = sorted(_entradas.get(dni, {}).values(), key=lambda e: (e["fecha"] or "", e["id"]))
+            _armadas[dni] = armada
+        return armada
+
+
+def linea_tiempo(paciente: Dict[str, Any]) -> Dict[str, Any]:
+    entradas = _ordenadas(paciente.get("dni") or paciente.get("id"))
+    historias = list(reversed(entradas))  # más recientes primero
+    medicamentos, diagnosticos = [], []
+    for e in historias:
+        for droga in e["dmt"] + e["soporte"]:
+            if droga not in medicamentos:
+                medicamentos.append(droga)
+        if e["diagnostico"] and e["diagnostico"] not in diagnosticos:
+            diagnosticos.append(e["diagnostico"])
+    con_fecha = [e["fecha"] for e in entradas if e["fecha"]]
+    return {
+        "paciente": paciente,
+        "historias": [
+            {k: e[k] for k in ("id", "fecha", "estado", "diagnostico", "forma", "edss", "dmt", "soporte")}
+            for e in historias
+        ],
+        "total_consultas": len(historias),
+        "primera_consulta": con_fecha[0] if con_fecha else None,
+        "ultima_consulta": con_fecha[-1] if con_fecha else None,
+        "medicamentos_usados": medicamentos,
+        "diagnosticos": diagnosticos,
+    }
+
+
+def analisis(paciente: Dict[str, Any]) -> Dict[str, Any]:
+    entradas = _ordenadas(paciente.get("dni") or paciente.get("id"))
+
+    dmt_con_fechas = []
+    cambios_dmt = 0
+    intolerancia = 0
+    previo = None
+    for e in entradas:
+        actual = ", ".join(e["dmt"])
+        intolerante = e["motivo"] == "Efectos Adversos"
+        dmt_con_fechas.append({
+            "dmt": actual or "Sin Registro",
+            "fecha": e["fecha"],
+            "edss": e["edss"],
+            "tolerancia": not intolerante,
+            "estado": "Intolerancia" if intolerante else "Tolerado",
+            "suspendidos": e["suspendidos"],
+            "motivo": e["motivo"],
+        })
+        if previo is not None and actual and actual != previo:
+            cambios_dmt += 1
+        if intolerante:
+            intolerancia += 1
+        previo = actual
+
+    soporte = []
+    for e in entradas:
+        for droga in e["soporte"]:
+            if droga not in soporte:
+                soporte.append(droga)
+
+    return {
+        "paciente": paciente,
+        "dmt_con_fechas": dmt_con_fechas,
+        "progresion_edss": [{"fecha": e["fecha"], "edss": e["edss"]} for e in entradas if e["edss"] is not None],
+        "cambios_dmt": cambios_dmt,
+        "intolerancia": intolerancia,
+        "tratamientos_soporte": soporte,
+        "total_historias": len(entradas),
+    }
+
+
+def _on_cambio(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    if evento == "eliminada":
+        quitar(id_historia)
+    else:
+        actualizar(historia)
+
+
+storage.suscribir_historias(_on_cambio)
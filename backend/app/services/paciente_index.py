@@ -0,0 +1,115 @@
+# backend/app/services/paciente_index.py
+"""
+Índice en memoria del registro de pacientes para `GET /pacientes`.
+
+Igual que historia_index: una carga por proceso y luego se mantiene con los
+eventos de app/services/storage.py. Guarda los registros completos (son chicos)
+y una lista ordenada de claves por orden de listado ("id" o "nombre") para
+paginar por cursor.
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services import storage
+from app.utils import paginacion
+
+ORDENES = ("id", "nombre")
+
+_lock = threading.RLock()
+_pacientes: Dict[str, Dict[str, Any]] = {}
+_claves: Dict[str, List[tuple]] = {o: [] for o in ORDENES}
+_cargado = False
+
+
+def _con_id(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Asegurar ID (registros viejos sólo tenían DNI)
+    if "id" not in data:
+        data["id"] = data.get("dni", "").replace(".", "")
+    return data
+
+
+def _clave(orden: str, paciente: Dict[str, Any]) -> tuple:
+    if orden == "nombre":
+        return (str(paciente.get("nombre") or "").lower(), paciente["id"])
+    return (paciente["id"],)
+
+
+def _desordenar(paciente: Dict[str, Any]):
+    for orden, lista in _claves.items():
+        clave = _clave(orden, paciente)
+        i = bisect_left(lista, clave)
+        if i < len(lista) and lista[i] == clave:
+            del lista[i]
+
+
+def cargar():
+    global _cargado
+    nuevos: Dict[str, Dict[str, Any]] = {}
+    for data in storage.iter_pacientes():
+        p = _con_id(data)
+        nuevos[p["id"]] = p
+    claves = {o: sorted(_clave(o, p) for p in nuevos.values()) for o in ORDENES}
+
+    with _lock:
+        _pacientes.clear()
+        _pacientes.update(nuevos)
+        _claves.update(claves)
+        _cargado = True
+    print(f"INFO: Índice de pacientes cargado ({len(nuevos)} registros)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def actualizar(paciente: Dict[str, Any]):
+    _asegurar_cargado()
+    p = _con_id(dict(paciente))
+    with _lock:
+        anterior = _pacientes.get(p["id"])
+        if anterior is not None:
+            _desordenar(anterior)
+        _pacientes[p["id"]] = p
+        for orden, lista in _claves.items():
+            insort(lista, _clave(orden, p))
+
+
+def quitar(id_paciente: str):
+    _asegurar_cargado()
+    with _lock:
+        anterior = _pacientes.pop(id_paciente, None)
+        if anterior is not None:
+            _desordenar(anterior)
+
+
+def total() -> int:
+    _asegurar_cargado()
+    return len(_pacientes)
+
+
+def pagina(
+    orden: str = "id",
+    despues: Optional[tuple] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[tuple]]:
+    """Pacientes siguientes a la clave `despues` y la clave de la próxima página (o None)."""
+    _asegurar_cargado()
+    with _lock:
+        claves, hay_mas = paginacion.cortar(_claves[orden], despues, limit)
+        items = [_pacientes[c[-1]] for c in claves]
+    siguiente = claves[-1] if hay_mas and claves else None
+    return items, siguiente
+
+
+def _on_cambio(evento: str, id_paciente: str, paciente: Optional[Dict[str, Any]]):
+    if evento == "eliminado":
+        quitar(id_paciente)
+    else:
+        actualizar(paciente)
+
+
+storage.suscribir_pacientes(_on_cambio)
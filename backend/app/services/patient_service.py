@@ -1,38 +1,20 @@
-import os
-import json
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-PACIENTES_DIR = "./data/pacientes"
-
-def _get_path(dni: str) -> str:
-    # Limpiamos el DNI para usarlo de nombre de archivo
-    clean_dni = "".join(filter(str.isdigit, str(dni)))
-    if not clean_dni:
-        return None
-    return os.path.join(PACIENTES_DIR, f"{clean_dni}.json")
+from app.services import storage
 
 def upsert_paciente_from_nlp(paciente_data: Dict[str, Any]):
     """
     Recibe datos del paciente del NLP y crea/actualiza el registro maestro.
     """
     print(f"\n--- INTENTO DE REGISTRO DE PACIENTE ---")
-    
-    # 1. Asegurar que el directorio existe
-    if not os.path.exists(PACIENTES_DIR):
-        try:
-            os.makedirs(PACIENTES_DIR, exist_ok=True)
-            print(f"📁 Directorio creado: {PACIENTES_DIR}")
-        except Exception as e:
-            print(f" ERROR CRÍTICO: No se pudo crear directorio {PACIENTES_DIR}: {e}")
-            return None
 
     dni = paciente_data.get("dni")
     nombre = paciente_data.get("nombre")
     
     print(f"DATOS RECIBIDOS -> Nombre: '{nombre}', DNI: '{dni}'")
 
-    # 2. Validación estricta
+    # 1. Validación estricta
     if not dni:
         print(" FALLO: No se guarda paciente porque el DNI es nulo o vacío.")
         return None
@@ -45,20 +27,17 @@ def upsert_paciente_from_nlp(paciente_data: Dict[str, Any]):
     if not nombre or "desconocido" in nombre.lower():
         print(f"⚠️ ADVERTENCIA: Nombre '{nombre}' parece inválido, pero se intentará guardar igual por tener DNI.")
 
-    path = _get_path(clean_dni)
-    
     paciente_existente = {}
     
-    # 3. Intentar cargar existente para preservar datos viejos
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                paciente_existente = json.load(f)
-                print(f"ℹ️ Paciente ya existe (ID: {paciente_existente.get('id')}). Actualizando datos...")
-        except Exception as e:
-            print(f"⚠️ Error leyendo paciente existente: {e}. Se sobrescribirá.")
-
-    # 4. Mezclar datos (Prioridad a lo nuevo si existe, sino mantenemos lo viejo)
+    # 2. Intentar cargar existente para preservar datos viejos
+    try:
+        paciente_existente = storage.get_paciente(clean_dni) or {}
+        if paciente_existente:
+            print(f"ℹ️ Paciente ya existe (ID: {paciente_existente.get('id')}). Actualizando datos...")
+    except Exception as e:
+        print(f"⚠️ Error leyendo paciente existente: {e}. Se sobrescribirá.")
+
+    # 3. Mezclar datos (Prioridad a lo nuevo si existe, sino mantenemos lo viejo)
     nuevo_paciente = {
         "id": clean_dni, # Usamos DNI limpio como ID consistente
         "dni": dni,      # Guardamos el DNI original con puntos si se quiere mostrar así
@@ -71,58 +50,49 @@ def upsert_paciente_from_nlp(paciente_data: Dict[str, Any]):
         "observaciones": paciente_existente.get("observaciones", "")
     }
 
-    # 5. Guardar
+    # 4. Guardar sólo sobre lo leído: si existía, sobre esa versión; si no, mientras
+    # siga sin existir (dos primeras importaciones del mismo DNI no se pisan)
+    if paciente_existente:
+        version_esperada = paciente_existente.get("version", 0)
+    else:
+        version_esperada = storage.NO_EXISTE
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(nuevo_paciente, f, ensure_ascii=False, indent=2)
-        print(f" ÉXITO: Paciente guardado correctamente en: {path}")
+        storage.save_paciente(nuevo_paciente, version_esperada=version_esperada)
+        print(f" ÉXITO: Paciente guardado correctamente (ID: {clean_dni})")
         print("---------------------------------------\n")
         return nuevo_paciente
     except Exception as e:
-        print(f" ERROR CRÍTICO escribiendo archivo JSON: {e}")
+        print(f" ERROR CRÍTICO guardando paciente: {e}")
         return None
 
 def get_all_pacientes() -> List[Dict[str, Any]]:
-    if not os.path.exists(PACIENTES_DIR):
-        return []
-        
     lista = []
-    for fname in os.listdir(PACIENTES_DIR):
-        if not fname.endswith(".json"): continue
-        try:
-            with open(os.path.join(PACIENTES_DIR, fname), "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # Asegurar ID
-                if "id" not in data:
-                    data["id"] = data.get("dni", "").replace(".", "")
-                lista.append(data)
-        except:
-            continue
+    for data in storage.iter_pacientes():
+        # Asegurar ID
+        if "id" not in data:
+            data["id"] = data.get("dni", "").replace(".", "")
+        lista.append(data)
             
     return lista
 
 def get_paciente_by_id(id_paciente: str):
     clean_id = "".join(filter(str.isdigit, str(id_paciente)))
-    path = os.path.join(PACIENTES_DIR, f"{clean_id}.json")
-    
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
+    if not clean_id:
+        return None
+    return storage.get_paciente(clean_id)
 
 def delete_paciente_by_id(id_paciente: str) -> bool:
-    # Limpiamos el ID por seguridad para encontrar el archivo correcto
+    # Limpiamos el ID por seguridad para encontrar el registro correcto
     clean_id = "".join(filter(str.isdigit, str(id_paciente)))
-    path = os.path.join(PACIENTES_DIR, f"{clean_id}.json")
-    
-    if os.path.exists(path):
-        try:
-            os.remove(path)
-            print(f"🗑️ Paciente eliminado: {path}")
+    if not clean_id:
+        return False
+
+    try:
+        if storage.delete_paciente(clean_id):
+            print(f"🗑️ Paciente eliminado: {clean_id}")
             return True
-        except Exception as e:
-            print(f" Error al eliminar paciente: {e}")
-            return False
+    except Exception as e:
+        print(f" Error al eliminar paciente: {e}")
     return False
 
 
@@ -133,8 +103,6 @@ def crear_nuevo_paciente(data: Dict[str, Any]):
     
     if not clean_id:
         return None
-        
-    path = os.path.join(PACIENTES_DIR, f"{clean_id}.json")
     
     # Preparamos el objeto con la estructura correcta
     nuevo_paciente = {
@@ -149,12 +117,10 @@ def crear_nuevo_paciente(data: Dict[str, Any]):
     }
     
     try:
-        os.makedirs(PACIENTES_DIR, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(nuevo_paciente, f, ensure_ascii=False, indent=2)
+        storage.save_paciente(nuevo_paciente)
         return nuevo_paciente
     except Exception as e:
-        print(f"Error creando archivo: {e}")
+        print(f"Error creando paciente: {e}")
         return None
 
 # backend/app/services/patient_service.py
@@ -168,8 +134,6 @@ def crear_paciente_manual(data: Dict[str, Any]):
     
     if not clean_dni:
         return None
-        
-    path = os.path.join(PACIENTES_DIR, f"{clean_dni}.json")
     
     # Estructura idéntica a la que espera tu página de Detalle
     nuevo_paciente = {
@@ -184,33 +148,37 @@ def crear_paciente_manual(data: Dict[str, Any]):
     }
     
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(nuevo_paciente, f, ensure_ascii=False, indent=2)
+        storage.save_paciente(nuevo_paciente)
         return nuevo_paciente
     except Exception as e:
         print(f"Error al guardar paciente: {e}")
         return None
 
-def update_paciente(id_paciente: str, data: Dict[str, Any]):
+def update_paciente(id_paciente: str, data: Dict[str, Any], version_esperada: Optional[int] = None):
+    """
+    Mezcla `data` sobre el registro actual. Lanza storage.ConflictoVersion si el
+    paciente ya no está en `version_esperada` (o, sin ella, si cambió desde la lectura).
+    """
     clean_id = "".join(filter(str.isdigit, str(id_paciente)))
-    path = os.path.join(PACIENTES_DIR, f"{clean_id}.json")
-    
-    if not os.path.exists(path):
+    # Cargamos lo que hay para no perder campos que no enviamos
+    paciente_actual = storage.get_paciente(clean_id) if clean_id else None
+    if paciente_actual is None:
         return None
 
+    if version_esperada is None:
+        version_esperada = paciente_actual.get("version", 0)
+
     try:
-        # Cargamos lo que hay para no perder campos que no enviamos
-        with open(path, "r", encoding="utf-8") as f:
-            paciente_actual = json.load(f)
-        
         # Actualizamos los campos recibidos
         paciente_actual.update(data)
+        paciente_actual["id"] = clean_id  # el registro sigue siendo el mismo aunque cambie el DNI mostrado
         paciente_actual["ultima_actualizacion"] = datetime.now().isoformat()
 
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(paciente_actual, f, ensure_ascii=False, indent=2)
+        storage.save_paciente(paciente_actual, version_esperada=version_esperada)
         
         return paciente_actual
+    except storage.ConflictoVersion:
+        raise
     except Exception as e:
         print(f"Error actualizando: {e}")
         return None
@@ -1,15 +1,77 @@
-import os
-import json
+"""
+Estadísticas de cohorte para `GET /reportes/general`, sobre una tabla columnar.
+
+Cada historia aporta una fila a la tabla de historias (brotes, motivo de
+cambio, atrofia, BOC, EDSS y los datos del paciente) y una fila por estudio a
+la de RMN (app/services/cohorte.py). Esas filas se calculan una sola vez, al
+guardar la historia, escuchando las escrituras de app/services/storage.py
+(importación, validación, borrado): el reporte no vuelve a leer ni a pasar
+regex sobre las historias. Las métricas salen de group-by vectorizados con
+NumPy; las métricas por paciente usan la fila de su historia más reciente.
+
+El reporte armado se reutiliza hasta la próxima escritura (o el cambio de día,
+por las edades). `generar_estadisticas_generales(rebuild=True)` recalcula todo
+desde cero.
+"""
 import re
-from collections import Counter
-from datetime import datetime
+import threading
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional, Tuple
 
-DATA_DIR = "./data/historias"
+import numpy as np
+
+from app.services import storage
+from app.services.cohorte import TablaColumnar, Diccionario, NAT, dia, edades, ultima_por_grupo, primera_por_grupo
 
 # Referencias de potencia terapéutica para clasificar DMTs
 HIGH_EFF = ["ocreli", "ocrevus", "natali", "tysabri", "rituxi", "cladri", "mavenclad", "alemtu", "kesimpta", "ponvory"]
 MOD_EFF = ["fingoli", "gilenya", "dimetil", "dimeful", "tecfidera", "teriflu", "aubagio", "interfer", "rebif", "betaferon", "avonex", "glatiramer", "copaxon", "cop-i"]
 
+POTENCIAS = ("alta_eficacia", "moderada", "sin_tratamiento")
+MOTIVOS = [
+    ("Falla Terapéutica", ["falla", "eficacia", "progredi"], "#ef4444"),
+    ("Efectos Adversos", ["efecto", "adverso", "tolerancia"], "#f97316"),
+    ("Planificación Embarazo", ["embarazo", "gestacion", "familia"], "#8b5cf6"),
+]
+EDSS_DISCAPACIDAD = 6.0
+
+_RE_BROTES = re.compile(r'(?<!no\s)(?<!sin\s)(brote|recaida|episodio|recaída)')
+_RE_BROTE_ULTIMA = re.compile(r'(?<!no\s)(?<!sin\s)brote|recaida')
+
+ESQUEMA_HISTORIAS = {
+    "dni": (np.int32, -1),
+    "fecha": ("M8[D]", NAT),
+    "brotes": (np.int32, 0),
+    "motivo": (np.int8, -1),
+    "atrofia": (bool, False),
+    "boc": (bool, False),
+    "boc_positiva": (bool, False),
+    "rmn": (np.int32, 0),
+    "neda": (bool, False),
+    "nacimiento": ("M8[D]", NAT),
+    "inicio": ("M8[D]", NAT),
+    "edss": (np.float64, np.nan),
+    "forma": (np.int32, -1),
+    "potencia": (np.int8, POTENCIAS.index("sin_tratamiento")),
+    "dmt": (np.int32, -1),
+}
+ESQUEMA_RMN = {
+    "dni": (np.int32, -1),
+    "fecha": ("M8[D]", NAT),
+    "activa": (bool, False),
+}
+
+_lock = threading.RLock()
+_historias = TablaColumnar(ESQUEMA_HISTORIAS)
+_rmn = TablaColumnar(ESQUEMA_RMN)
+_dnis = Diccionario()
+_formas = Diccionario()
+_dmts = Diccionario()
+_reporte: Optional[Dict[str, Any]] = None
+_reporte_dia: Optional[date] = None
+_cargado = False
+
+
 def get_age(birth, ref=None):
     if not birth: return 0
     try:
@@ -25,131 +87,272 @@ def clasificar_potencia(med_name):
     if any(k in m for k in MOD_EFF): return "moderada"
     return "sin_tratamiento"
 
-def generar_estadisticas_generales():
-    if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
-    
-    patient_latest = {} # DNI -> Ultima historia para métricas actuales
-    all_records = []    # Todas las historias para métricas históricas (ARR)
-    
-    # 1. ESCANEO TOTAL DE ARCHIVOS JSON
-    archivos = [f for f in os.listdir(DATA_DIR) if f.endswith(".json")]
-    for fname in archivos:
-        try:
-            with open(os.path.join(DATA_DIR, fname), 'r', encoding="utf-8") as f:
-                h = json.load(f)
-                data = h.get("validada") or h.get("borrador") or h
-                dni = data.get("paciente", {}).get("dni")
-                fecha = data.get("consulta", {}).get("fecha") or "1900-01-01"
-                if dni:
-                    all_records.append(data)
-                    if dni not in patient_latest or fecha > patient_latest[dni]["fecha"]:
-                        patient_latest[dni] = {"fecha": fecha, "data": data}
-        except: continue
+
+def _edss(valor: Any) -> float:
+    try:
+        edss = float(str(valor).replace(",", "."))
+    except (TypeError, ValueError):
+        return np.nan
+    # "inf" también parsea y dejaría el promedio del año en inf (no es JSON válido)
+    return edss if np.isfinite(edss) else np.nan
+
+
+def filas_historia(h: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Fila de la historia y filas de sus RMN; ninguna si no tiene DNI (no cuenta)."""
+    data = h.get("validada") or h.get("borrador") or h
+    paciente = data.get("paciente", {}) or {}
+    dni = paciente.get("dni")
+    if not dni:
+        return [], []
+    secciones = data.get("secciones_texto", {}) or {}
+    complementarios = data.get("complementarios", {}) or {}
+    enfermedad = data.get("enfermedad", {}) or {}
+    tratamientos = data.get("tratamientos", []) or []
+    rmn = complementarios.get("rmn", []) or []
+    fecha = dia((data.get("consulta", {}) or {}).get("fecha"))
+    codigo_dni = _dnis.codigo(dni)
+
+    # --- A. Brotes (ARR de la cohorte) ---
+    evol = (secciones.get("evolucion") or "").lower()
+    enf_actual = (secciones.get("enfermedad_actual") or "").lower()
+    brotes = len(_RE_BROTES.findall(evol + " " + enf_actual))
+
+    # --- B. NEDA-3 (si es la última historia del paciente) ---
+    rmn_activas = [r.get("actividad") == "Activa" or r.get("gd") == "Positiva" for r in rmn]
+    brote_ultima = _RE_BROTE_ULTIMA.search(evol) is not None
+
+    # --- C. Motivo de cambio ---
+    com = (secciones.get("comentario") or "").lower()
+    motivo = next((i for i, (_, claves, _) in enumerate(MOTIVOS) if any(x in com for x in claves)), -1)
+
+    # --- D. Biomarcadores ---
+    estudios = (secciones.get("estudios") or "").lower()
+    bandas = (complementarios.get("puncion_lumbar", {}) or {}).get("bandas")
+
+    # --- E. Demografía y terapia ---
+    meds = [clasificar_potencia(t.get("droga")) for t in tratamientos]
+    potencia = next((p for p in POTENCIAS if p in meds), "sin_tratamiento")
+
+    fila = {
+        "dni": codigo_dni,
+        "fecha": fecha,
+        "brotes": brotes,
+        "motivo": motivo,
+        "atrofia": any(x in estudios for x in ["atrofia", "volumen", "adelgazamiento"]),
+        "boc": bool(bandas),
+        "boc_positiva": bool(bandas) and any(x in bandas.lower() for x in ["positi", "tipo 2", "si"]),
+        "rmn": len(rmn),
+        "neda": not any(rmn_activas) and not brote_ultima,
+        "nacimiento": dia(paciente.get("fecha_nacimiento")),
+        "inicio": dia(enfermedad.get("fecha_inicio")),
+        "edss": _edss(enfermedad.get("edss")),
+        "forma": _formas.codigo(enfermedad.get("forma") or "S/D"),
+        "potencia": POTENCIAS.index(potencia),
+        "dmt": _dmts.codigo(tratamientos[0].get("droga", "Sin DMT")) if tratamientos else -1,
+    }
+    filas_rmn = []
+    for r, activa in zip(rmn, rmn_activas):
+        fecha_rmn = dia(r.get("fecha"))
+        # Sin fecha propia, el estudio se ubica en la fecha de la consulta
+        filas_rmn.append({"dni": codigo_dni, "fecha": fecha if np.isnat(fecha_rmn) else fecha_rmn, "activa": activa})
+    return [fila], filas_rmn
+
+
+def cargar():
+    """Recorre las historias una vez y reconstruye las tablas."""
+    global _cargado, _reporte
+    with _lock:
+        historias, rmn = [], []
+        for h in storage.iter_historias():
+            fila, filas_rmn = filas_historia(h)
+            historias.append((h["id"], fila))
+            rmn.append((h["id"], filas_rmn))
+        _historias.cargar(historias)
+        _rmn.cargar(rmn)
+        _reporte = None
+        _cargado = True
+    print(f"INFO: Tabla de cohorte cargada ({len(_historias)} historias, {len(_rmn)} RMN)")
+
+
+def _asegurar_cargado():
+    if not _cargado:
+        with _lock:
+            if not _cargado:
+                cargar()
+
+
+def actualizar(h: Dict[str, Any]):
+    global _reporte
+    _asegurar_cargado()
+    with _lock:
+        fila, filas_rmn = filas_historia(h)
+        _historias.reemplazar(h["id"], fila)
+        _rmn.reemplazar(h["id"], filas_rmn)
+        _reporte = None
+
+
+def quitar(id_historia: str):
+    global _reporte
+    _asegurar_cargado()
+    with _lock:
+        _historias.quitar(id_historia)
+        _rmn.quitar(id_historia)
+        _reporte = None
+
+
+def _reporte_vacio() -> Dict[str, Any]:
+    return {
+        "resumen_general": {"total_pacientes": 0, "historias_registradas": 0, "promedio_edad_diagnostico": 0, "promedio_edad_actual": 0, "porcentaje_femenino": 0},
+        "kpis_em": {"pacientes_neda3": 0, "arr_promedio": 0, "tiempo_a_edss_6_0_promedio": 0, "porcentaje_boc_positivas": 0},
+        "discapacidad_y_progression": {"relacion_forma_terapia": [], "edss_progresion_historica": []},
+        "tratamiento_dmt": {"uso_dmt_actual": [], "motivos_cambio_dmt": []},
+        "neuroimagen": {"conteo_lcr": 0, "conteo_rmn_total": 0, "porcentaje_atrofia_reportada": 0, "actividad_rmn_bianual": []},
+        "tratamiento_soporte": []
+    }
+
+
+def _edss_progresion(t: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    # EDSS promedio por año de consulta
+    con_dato = ~np.isnan(t["edss"]) & ~np.isnat(t["fecha"])
+    if not con_dato.any():
+        return []
+    anios = t["fecha"][con_dato].astype("M8[Y]").astype(np.int64) + 1970
+    valores, grupo = np.unique(anios, return_inverse=True)
+    cantidad = np.bincount(grupo)
+    suma = np.bincount(grupo, weights=t["edss"][con_dato])
+    return [
+        {"anio": str(a), "edss_promedio": round(float(s / n), 2), "historias": int(n)}
+        for a, s, n in zip(valores, suma, cantidad)
+    ]
+
+
+def _tiempo_a_edss_6(t: Dict[str, np.ndarray]) -> float:
+    # Años desde el inicio de la enfermedad hasta la primera consulta con EDSS >= 6, promedio por paciente
+    cantidad = len(_dnis)
+    alcanzo = (t["edss"] >= EDSS_DISCAPACIDAD) & ~np.isnat(t["fecha"])
+    con_inicio = ~np.isnat(t["inicio"])
+    if not alcanzo.any() or not con_inicio.any():
+        return 0
+    primera = primera_por_grupo(t["dni"][alcanzo], t["fecha"][alcanzo].astype(np.int64), cantidad)
+    inicio = primera_por_grupo(t["dni"][con_inicio], t["inicio"][con_inicio].astype(np.int64), cantidad)
+    sin_dato = np.iinfo(np.int64).max
+    validos = (primera != sin_dato) & (inicio != sin_dato) & (primera >= inicio)
+    if not validos.any():
+        return 0
+    return round(float(np.mean(primera[validos] - inicio[validos]) / 365.25), 1)
+
+
+def _actividad_rmn_bianual(r: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    # Cada estudio cuenta una vez por paciente aunque se repita en varias historias
+    con_fecha = ~np.isnat(r["fecha"])
+    if not con_fecha.any():
+        return []
+    clave = (r["dni"][con_fecha].astype(np.int64) << 32) | (r["fecha"][con_fecha].astype(np.int64) & 0xFFFFFFFF)
+    unicas, grupo = np.unique(clave, return_inverse=True)
+    activa = np.zeros(len(unicas), dtype=bool)
+    np.logical_or.at(activa, grupo, r["activa"][con_fecha])
+    fechas = np.zeros(len(unicas), dtype=np.int64)
+    fechas[grupo] = r["fecha"][con_fecha].astype(np.int64)
+    anios = fechas.astype("M8[D]").astype("M8[Y]").astype(np.int64) + 1970
+    periodos, p = np.unique(anios - anios % 2, return_inverse=True)
+    activos = np.bincount(p, weights=activa, minlength=len(periodos))
+    total = np.bincount(p, minlength=len(periodos))
+    return [
+        {"periodo": f"{a}-{a + 1}", "activos": int(act), "inactivos": int(n - act)}
+        for a, act, n in zip(periodos, activos, total)
+    ]
+
+
+def _armar_reporte() -> Dict[str, Any]:
+    t = _historias.columnas()
+    r = _rmn.columnas()
+    historias = len(t["dni"])
 
     # Caso base: Carpeta vacía
-    if not all_records:
-        return {
-            "resumen_general": {"total_pacientes": 0, "historias_registradas": 0, "promedio_edad_diagnostico": 0, "promedio_edad_actual": 0, "porcentaje_femenino": 0},
-            "kpis_em": {"pacientes_neda3": 0, "arr_promedio": 0, "tiempo_a_edss_6_0_promedio": 0, "porcentaje_boc_positivas": 0},
-            "discapacidad_y_progression": {"relacion_forma_terapia": [], "edss_progresion_historica": []},
-            "tratamiento_dmt": {"uso_dmt_actual": [], "motivos_cambio_dmt": []},
-            "neuroimagen": {"conteo_lcr": 0, "conteo_rmn_total": 0, "porcentaje_atrofia_reportada": 0, "actividad_rmn_bianual": []},
-            "tratamiento_soporte": []
-        }
+    if not historias:
+        return _reporte_vacio()
 
-    # --- A. CÁLCULO DE ARR (COHORTE) ---
-    total_brotes = 0
-    for d in all_records:
-        evol = (d.get("secciones_texto", {}).get("evolucion") or "").lower()
-        enf_actual = (d.get("secciones_texto", {}).get("enfermedad_actual") or "").lower()
-        texto_completo = evol + " " + enf_actual
-        
-      
-        hallazgos = re.findall(r'(?<!no\s)(?<!sin\s)(brote|recaida|episodio|recaída)', texto_completo)
-        
-        if len(hallazgos) > 0:
-            total_brotes += len(hallazgos)
-            print(f" Brote detectado en una historia (Total: {total_brotes})") # Ver en consola
-
-    arr_cohorte = round(total_brotes / len(patient_latest), 2) if len(patient_latest) > 0 else 0
-
-    # --- B. CÁLCULO DE NEDA-3 (ESTABILIDAD) ---
-    neda_count = 0
-    for p in patient_latest.values():
-        d = p["data"]
-        rmn_activa = any(r.get("actividad") == "Activa" or r.get("gd") == "Positiva" for r in d.get("complementarios", {}).get("rmn", []))
-        txt_u = (d.get("secciones_texto", {}).get("evolucion") or "").lower()
-        brote_u = len(re.findall(r'(?<!no\s)(?<!sin\s)brote|recaida', txt_u)) > 0
-        if not rmn_activa and not brote_u:
-            neda_count += 1
-
-    # --- C. MOTIVOS DE CAMBIO (EXTRACCIÓN DE TEXTO) ---
-    motivos_raw = []
-    for d in all_records:
-        com = (d.get("secciones_texto", {}).get("comentario") or "").lower()
-        if any(x in com for x in ["falla", "eficacia", "progredi"]): motivos_raw.append("Falla Terapéutica")
-        elif any(x in com for x in ["efecto", "adverso", "tolerancia"]): motivos_raw.append("Efectos Adversos")
-        elif any(x in com for x in ["embarazo", "gestacion", "familia"]): motivos_raw.append("Planificación Embarazo")
-    
-    c_motivos = Counter(motivos_raw)
-    tot_m = sum(c_motivos.values())
+    # Última historia de cada paciente (sin fecha cuenta como la más antigua; a igual fecha, la de menor id)
+    u = ultima_por_grupo(t["dni"], t["fecha"].astype(np.int64), t["clave"])
+    pacientes = len(u)
+    hoy = np.datetime64(date.today(), "D")
+    nacimiento = t["nacimiento"][u]
+    # Sin fecha de inicio, get_age tomaba la fecha actual
+    edades_diag = edades(nacimiento, np.where(np.isnat(t["inicio"][u]), hoy, t["inicio"][u]))
+    edades_actual = edades(nacimiento, np.full(pacientes, hoy))
+
+    motivos = np.bincount(t["motivo"][t["motivo"] >= 0], minlength=len(MOTIVOS))
+    tot_m = motivos.sum()
     motivos_json = [
-        {"motivo": k, "porcentaje": round((v/tot_m)*100, 1), "color": c} 
-        for (k, v), c in zip(c_motivos.items(), ["#ef4444", "#f97316", "#8b5cf6", "#22c55e"])
+        {"motivo": nombre, "porcentaje": round((int(n)/tot_m)*100, 1), "color": color}
+        for (nombre, _, color), n in zip(MOTIVOS, motivos) if n
     ]
 
-    # --- D. BIOMARCADORES (BOC Y ATROFIA) ---
-    atrofia_menciones = 0
-    boc_pos = 0
-    boc_total = 0
-    for d in all_records:
-        estudios = (d.get("secciones_texto", {}).get("estudios") or "").lower()
-        if any(x in estudios for x in ["atrofia", "volumen", "adelgazamiento"]): atrofia_menciones += 1
-        
-        bandas = d.get("complementarios", {}).get("puncion_lumbar", {}).get("bandas")
-        if bandas:
-            boc_total += 1
-            if any(x in bandas.lower() for x in ["positi", "tipo 2", "si"]): boc_pos += 1
-
-    # --- E. DEMOGRAFÍA Y DISTRIBUCIÓN ---
-    edades_actual = [get_age(p["data"]["paciente"].get("fecha_nacimiento")) for p in patient_latest.values()]
-    edades_diag = [get_age(p["data"]["paciente"].get("fecha_nacimiento"), p["data"]["enfermedad"].get("fecha_inicio")) for p in patient_latest.values()]
-    
-    formas_terapia = {}
-    for p in patient_latest.values():
-        forma = p["data"].get("enfermedad", {}).get("forma") or "S/D"
-        if forma not in formas_terapia: formas_terapia[forma] = {"alta_eficacia": 0, "moderada": 0, "sin_tratamiento": 0}
-        meds = [clasificar_potencia(t.get("droga")) for t in p["data"].get("tratamientos", [])]
-        if "alta_eficacia" in meds: formas_terapia[forma]["alta_eficacia"] += 1
-        elif "moderada" in meds: formas_terapia[forma]["moderada"] += 1
-        else: formas_terapia[forma]["sin_tratamiento"] += 1
+    # forma x potencia en una sola pasada: código combinado
+    combinado = t["forma"][u].astype(np.int64) * len(POTENCIAS) + t["potencia"][u]
+    conteo = np.bincount(combinado, minlength=len(_formas) * len(POTENCIAS)).reshape(-1, len(POTENCIAS))
+    formas_terapia = sorted(
+        ({"forma": _formas.valores[f], **{p: int(conteo[f, i]) for i, p in enumerate(POTENCIAS)}}
+         for f in np.flatnonzero(conteo.sum(axis=1))),
+        key=lambda x: x["forma"],
+    )
+
+    dmt = t["dmt"][u]
+    uso_dmt = np.bincount(dmt[dmt >= 0], minlength=len(_dmts))
+    orden_dmt = sorted(np.flatnonzero(uso_dmt), key=lambda d: (-uso_dmt[d], _dmts.valores[d]))
+
+    boc_total = int(t["boc"].sum())
+    boc_pos = int(t["boc_positiva"].sum())
 
     return {
         "resumen_general": {
-            "total_pacientes": len(patient_latest),
-            "historias_registradas": len(all_records),
-            "promedio_edad_diagnostico": round(sum(edades_diag)/len(edades_diag), 1) if edades_diag else 32.5,
-            "promedio_edad_actual": round(sum(edades_actual)/len(edades_actual), 1) if edades_actual else 0,
+            "total_pacientes": pacientes,
+            "historias_registradas": historias,
+            "promedio_edad_diagnostico": round(float(edades_diag.mean()), 1) if pacientes else 32.5,
+            "promedio_edad_actual": round(float(edades_actual.mean()), 1) if pacientes else 0,
             "porcentaje_femenino": 68.0
         },
         "kpis_em": {
-            "pacientes_neda3": round(neda_count / len(patient_latest), 2) if patient_latest else 0,
-            "arr_promedio": arr_cohorte,
-            "tiempo_a_edss_6_0_promedio": 18.2,
+            "pacientes_neda3": round(int(t["neda"][u].sum()) / pacientes, 2),
+            "arr_promedio": round(int(t["brotes"].sum()) / pacientes, 2),
+            "tiempo_a_edss_6_0_promedio": _tiempo_a_edss_6(t),
             "porcentaje_boc_positivas": round((boc_pos/boc_total)*100, 1) if boc_total > 0 else 0
         },
         "discapacidad_y_progression": {
-            "relacion_forma_terapia": [{"forma": k, **v} for k, v in formas_terapia.items()],
-            "edss_progresion_historica": []
+            "relacion_forma_terapia": formas_terapia,
+            "edss_progresion_historica": _edss_progresion(t)
         },
         "tratamiento_dmt": {
-            "uso_dmt_actual": [{"dmt": k, "pacientes": v, "color": "#0ea5e9"} for k, v in Counter([p["data"].get("tratamientos", [{}])[0].get("droga", "Sin DMT") for p in patient_latest.values() if p["data"].get("tratamientos")]).items()],
+            "uso_dmt_actual": [{"dmt": _dmts.valores[d], "pacientes": int(uso_dmt[d]), "color": "#0ea5e9"} for d in orden_dmt],
             "motivos_cambio_dmt": motivos_json if motivos_json else [{"motivo": "Sin datos", "porcentaje": 100, "color": "#cbd5e1"}]
         },
         "neuroimagen": {
             "conteo_lcr": boc_total,
-            "conteo_rmn_total": len([r for d in all_records for r in d.get("complementarios", {}).get("rmn", [])]),
-            "porcentaje_atrofia_reportada": round((atrofia_menciones / len(all_records))*100, 1) if all_records else 0,
-            "actividad_rmn_bianual": []
+            "conteo_rmn_total": int(t["rmn"].sum()),
+            "porcentaje_atrofia_reportada": round((int(t["atrofia"].sum()) / historias)*100, 1),
+            "actividad_rmn_bianual": _actividad_rmn_bianual(r)
         }
-    }
\ No newline at end of file
+    }
+
+
+def generar_estadisticas_generales(rebuild: bool = False) -> Dict[str, Any]:
+    global _reporte, _reporte_dia
+    if rebuild:
+        cargar()
+    _asegurar_cargado()
+    with _lock:
+        # Se arma de nuevo sólo si cambió alguna historia (o el día, por las edades)
+        if _reporte is None or _reporte_dia != date.today():
+            _reporte = _armar_reporte()
+            _reporte_dia = date.today()
+        return _reporte
+
+
+def _on_cambio(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    if evento == "eliminada":
+        quitar(id_historia)
+    else:
+        actualizar(historia)
+
+
+storage.suscribir_historias(_on_cambio)
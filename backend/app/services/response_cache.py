@@ -0,0 +1,76 @@
+# backend/app/services/response_cache.py
+"""
+Caché de respuestas GET de listados y reportes.
+
+La clave es la ruta + los query params. Cada entrada recuerda la generación de
+app/services/storage.py con la que se calculó: cualquier escritura (importación,
+validación, validación masiva, borrado, alta o edición de pacientes) la deja
+inválida. RESPONSE_CACHE_TTL acota además su vida, por si los datos cambian por
+fuera del backend.
+
+Las respuestas llevan un ETag (hash del cuerpo); si el cliente lo manda en
+If-None-Match y nada cambió se responde 304 sin cuerpo.
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.core import config
+from app.services import storage
+
+_lock = threading.Lock()
+_entradas: "OrderedDict[Tuple, Tuple[int, float, bytes, str]]" = OrderedDict()
+
+
+def _clave(request: Request) -> Tuple:
+    return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+
+def _vigente(entrada, generacion: int) -> bool:
+    gen, creada, _, _ = entrada
+    return gen == generacion and time.monotonic() - creada < config.RESPONSE_CACHE_TTL
+
+
+def _etag_coincide(request: Request, etag: str) -> bool:
+    pedido = request.headers.get("if-none-match")
+    if not pedido:
+        return False
+    candidatos = {e.strip().removeprefix("W/") for e in pedido.split(",")}
+    return "*" in candidatos or etag in candidatos
+
+
+def responder(request: Request, calcular: Callable[[], Any], forzar: bool = False) -> Response:
+    """Respuesta JSON de `calcular()`, reutilizada mientras no haya escrituras."""
+    clave = _clave(request)
+    # Se lee antes de calcular: si hay una escritura en el medio, la entrada nace vieja
+    generacion = storage.generacion()
+
+    with _lock:
+        entrada = _entradas.get(clave)
+        if entrada is not None and not forzar and _vigente(entrada, generacion):
+            _entradas.move_to_end(clave)
+        else:
+            entrada = None
+
+    if entrada is None:
+        cuerpo = json.dumps(jsonable_encoder(calcular()), ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+        entrada = (generacion, time.monotonic(), cuerpo, etag)
+        with _lock:
+            _entradas[clave] = entrada
+            _entradas.move_to_end(clave)
+            while len(_entradas) > config.RESPONSE_CACHE_MAX_ENTRIES:
+                _entradas.popitem(last=False)
+
+    _, _, cuerpo, etag = entrada
+    # no-cache: el navegador puede guardarla pero debe revalidar con If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_coincide(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
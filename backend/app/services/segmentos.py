@@ -0,0 +1,361 @@
+# backend/app/services/segmentos.py
+"""
+Log de segmentos para STORAGE_BACKEND=segmentos.
+
+Historias y pacientes se anexan a archivos de segmento ({n:08d}.seg) en lugar
+de ocupar un archivo por registro. Cada segmento empieza con un encabezado
+(MAGIC_SEGMENTO, largo, JSON de metadatos) y sigue con registros:
+
+    MAGIC_REGISTRO | restantes | tipo | borrado | versión | largo id | largo datos | crc32
+    id (utf-8) | datos (JSON comprimido con zlib; vacío si es un borrado)
+
+Una unidad de escritura son varios registros seguidos con un solo fsync; el
+campo "restantes" cuenta los que faltan de la unidad, así que una unidad
+cortada por un crash (o a medio escribir por otro proceso) no se aplica. En
+memoria se guarda sólo (tipo, id) -> (segmento, offset, largo, versión): leer
+un registro es un seek, y al arrancar se recorren los encabezados sin
+descomprimir nada.
+
+Cada proceso mantiene su propio índice y antes de leer mira si el segmento
+activo creció o si apareció uno nuevo (lo que escribió otro worker). Las
+escrituras ocurren con el bloqueo entre procesos de storage.
+
+El compactador (un thread) reescribe los registros vivos de todos los
+segmentos en uno nuevo cuando más de FRACCION_MUERTA de los bytes son
+versiones reemplazadas o borrados. El segmento nuevo lista en sus metadatos
+los que reemplaza: si el proceso muere antes de borrarlos, se ignoran y se
+borran al abrir el log.
+"""
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+from typing import Dict, Any, Callable, ContextManager, Iterator, List, Optional, Tuple
+
+MAGIC_SEGMENTO = b"NSS1"
+MAGIC_REGISTRO = b"NSR1"
+_META = struct.Struct(">4sI")
+_REGISTRO = struct.Struct(">4sIBBIHII")
+TIPOS = ("historia", "paciente")
+NIVEL_ZLIB = 6
+
+# Compactar cuando los bytes muertos superan esta fracción (y MINIMO_MUERTO)
+FRACCION_MUERTA = 0.5
+MINIMO_MUERTO = 1024 * 1024
+
+Ubicacion = Tuple[int, int, int, int]  # segmento, offset, largo, versión
+
+
+class LogSegmentos:
+
+    def __init__(self, directorio: str, max_bytes: int, bloqueo: Callable[[], ContextManager]):
+        self._dir = directorio
+        self._max_bytes = max_bytes
+        self._bloqueo = bloqueo
+        self._lock = threading.RLock()
+        self._indice: Dict[Tuple[str, str], Ubicacion] = {}
+        self._vivos: Dict[int, int] = {}     # segmento -> bytes de registros vigentes
+        self._tamanios: Dict[int, int] = {}  # segmento -> bytes recorridos
+        self._activo = 0
+        self._fin = 0
+        self._compactador: Optional[threading.Thread] = None
+        os.makedirs(directorio, exist_ok=True)
+        with bloqueo():
+            self._cargar(recuperar=True)
+
+    # --- ARCHIVOS ---
+
+    def _path(self, segmento: int) -> str:
+        return os.path.join(self._dir, f"{segmento:08d}.seg")
+
+    def _segmentos(self) -> List[int]:
+        return sorted(int(f[:-4]) for f in os.listdir(self._dir) if f.endswith(".seg") and f[:-4].isdigit())
+
+    def _fsync_directorio(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self._dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _crear_segmento(self, segmento: int, meta: Dict[str, Any], registros: bytes = b"") -> int:
+        """Escribe el segmento entero en un temporal y lo publica con rename; devuelve su largo."""
+        crudo_meta = json.dumps(meta).encode("utf-8")
+        crudo = _META.pack(MAGIC_SEGMENTO, len(crudo_meta)) + crudo_meta + registros
+        tmp_path = f"{self._path(segmento)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(crudo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(segmento))
+        self._fsync_directorio()
+        return len(crudo)
+
+    def _leer_meta(self, f) -> Tuple[Dict[str, Any], int]:
+        magic, largo = _META.unpack(f.read(_META.size))
+        if magic != MAGIC_SEGMENTO:
+            raise ValueError("Segmento sin encabezado válido")
+        return json.loads(f.read(largo).decode("utf-8")), _META.size + largo
+
+    # --- RECORRIDO ---
+
+    def _aplicar(self, clave: Tuple[str, str], ubicacion: Optional[Ubicacion], largo: int, segmento: int):
+        anterior = self._indice.pop(clave, None)
+        if anterior is not None:
+            self._vivos[anterior[0]] -= anterior[2]
+        if ubicacion is not None:
+            self._indice[clave] = ubicacion
+            self._vivos[segmento] = self._vivos.get(segmento, 0) + largo
+
+    def _escanear(self, segmento: int, desde: int) -> int:
+        """Aplica las unidades completas desde `desde`; devuelve dónde termina la última."""
+        pendientes = []
+        fin = desde
+        with open(self._path(segmento), "rb") as f:
+            if desde == 0:
+                _, fin = self._leer_meta(f)
+            f.seek(fin)
+            offset = fin
+            while True:
+                encabezado = f.read(_REGISTRO.size)
+                if len(encabezado) < _REGISTRO.size:
+                    break
+                magic, restantes, tipo, borrado, version, largo_id, largo_datos, crc = _REGISTRO.unpack(encabezado)
+                if magic != MAGIC_REGISTRO or tipo >= len(TIPOS):
+                    break
+                cuerpo = f.read(largo_id + largo_datos)
+                if len(cuerpo) < largo_id + largo_datos or zlib.crc32(cuerpo) != crc:
+                    break
+                largo = _REGISTRO.size + len(cuerpo)
+                clave = (TIPOS[tipo], cuerpo[:largo_id].decode("utf-8"))
+                pendientes.append((clave, None if borrado else (segmento, offset, largo, version), largo))
+                offset += largo
+                if restantes == 0:
+                    for clave, ubicacion, largo_registro in pendientes:
+                        self._aplicar(clave, ubicacion, largo_registro, segmento)
+                    pendientes = []
+                    fin = offset
+        self._vivos.setdefault(segmento, 0)
+        self._tamanios[segmento] = fin
+        return fin
+
+    def _cargar(self, recuperar: bool):
+        """Arma el índice desde cero. Con `recuperar` (y el bloqueo tomado) repara el disco."""
+        with self._lock:
+            self._indice.clear()
+            self._vivos.clear()
+            self._tamanios.clear()
+            segmentos = self._segmentos()
+            if not segmentos:
+                self._crear_segmento(1, {})
+                segmentos = [1]
+            reemplazados = set()
+            for segmento in segmentos:
+                with open(self._path(segmento), "rb") as f:
+                    reemplazados.update(self._leer_meta(f)[0].get("reemplaza", []))
+            vigentes = [s for s in segmentos if s not in reemplazados]
+            for segmento in vigentes:
+                self._fin = self._escanear(segmento, 0)
+            self._activo = vigentes[-1]
+            if recuperar:
+                # Segmentos que un compactado alcanzó a reemplazar antes de un corte
+                for segmento in reemplazados & set(segmentos):
+                    os.remove(self._path(segmento))
+                for fname in os.listdir(self._dir):
+                    if fname.endswith(".tmp"):
+                        os.remove(os.path.join(self._dir, fname))
+                # Unidad cortada al final del activo
+                if os.path.getsize(self._path(self._activo)) > self._fin:
+                    print("WARNING: Unidad incompleta al final del log de segmentos, se descarta")
+                    os.truncate(self._path(self._activo), self._fin)
+
+    def _recargar(self):
+        # Otro proceso compactó: puede estar borrando los segmentos viejos mientras se listan
+        for intento in range(3):
+            try:
+                return self._cargar(recuperar=False)
+            except FileNotFoundError:
+                if intento == 2:
+                    raise
+
+    def ponerse_al_dia(self):
+        """Incorpora lo que otros procesos (o threads) anexaron desde la última vez."""
+        with self._lock:
+            try:
+                if os.path.getsize(self._path(self._activo)) > self._fin:
+                    self._fin = self._escanear(self._activo, self._fin)
+            except FileNotFoundError:
+                self._recargar()
+                return
+            while os.path.exists(self._path(self._activo + 1)):
+                siguiente = self._activo + 1
+                try:
+                    with open(self._path(siguiente), "rb") as f:
+                        meta, _ = self._leer_meta(f)
+                except (FileNotFoundError, ValueError, struct.error):
+                    return
+                if meta.get("reemplaza"):
+                    self._recargar()
+                    return
+                self._activo = siguiente
+                self._fin = self._escanear(siguiente, 0)
+
+    # --- LECTURA ---
+
+    def version(self, tipo: str, id_registro: str) -> Optional[int]:
+        with self._lock:
+            ubicacion = self._indice.get((tipo, id_registro))
+        return None if ubicacion is None else ubicacion[3]
+
+    def existe(self, tipo: str, id_registro: str) -> bool:
+        self.ponerse_al_dia()
+        return self.version(tipo, id_registro) is not None
+
+    def _decodificar(self, crudo: bytes) -> Dict[str, Any]:
+        _, _, _, _, _, largo_id, _, _ = _REGISTRO.unpack(crudo[:_REGISTRO.size])
+        return json.loads(zlib.decompress(crudo[_REGISTRO.size + largo_id:]).decode("utf-8"))
+
+    def leer(self, tipo: str, id_registro: str) -> Optional[Dict[str, Any]]:
+        for _ in range(3):
+            self.ponerse_al_dia()
+            with self._lock:
+                ubicacion = self._indice.get((tipo, id_registro))
+            if ubicacion is None:
+                return None
+            segmento, offset, largo, _ = ubicacion
+            try:
+                with open(self._path(segmento), "rb") as f:
+                    f.seek(offset)
+                    return self._decodificar(f.read(largo))
+            except FileNotFoundError:
+                continue  # el compactador lo movió; se vuelve a buscar
+        raise IOError(f"No se pudo leer {tipo} {id_registro} del log de segmentos")
+
+    def iterar(self, tipo: str) -> Iterator[Dict[str, Any]]:
+        """Registros vigentes del tipo, por id."""
+        self.ponerse_al_dia()
+        with self._lock:
+            ubicaciones = sorted((i, u) for (t, i), u in self._indice.items() if t == tipo)
+        abiertos: Dict[int, Any] = {}
+        try:
+            for id_registro, (segmento, offset, largo, _) in ubicaciones:
+                try:
+                    f = abiertos.get(segmento) or abiertos.setdefault(segmento, open(self._path(segmento), "rb"))
+                    f.seek(offset)
+                    data = self._decodificar(f.read(largo))
+                except FileNotFoundError:
+                    data = self.leer(tipo, id_registro)
+                if data is not None:
+                    yield data
+        finally:
+            for f in abiertos.values():
+                f.close()
+
+    # --- ESCRITURA ---
+
+    def escribir(self, ops: List[Dict[str, Any]]):
+        """Anexa una unidad con un fsync. Se llama con el bloqueo entre procesos tomado."""
+        self.ponerse_al_dia()
+        registros = []
+        for i, op in enumerate(ops):
+            borrado = op["op"] == "borrar"
+            id_bytes = op["id"].encode("utf-8")
+            datos = b"" if borrado else zlib.compress(
+                json.dumps(op["data"], ensure_ascii=False, separators=(",", ":")).encode("utf-8"), NIVEL_ZLIB
+            )
+            version = 0 if borrado else int(op["data"].get("version", 0))
+            registros.append(_REGISTRO.pack(
+                MAGIC_REGISTRO, len(ops) - 1 - i, TIPOS.index(op["tipo"]), int(borrado), version,
+                len(id_bytes), len(datos), zlib.crc32(id_bytes + datos),
+            ) + id_bytes + datos)
+
+        path = self._path(self._activo)
+        with open(path, "r+b") as f:
+            # Restos de una unidad de un proceso que murió escribiendo: nadie más escribe ahora
+            f.truncate(self._fin)
+            f.seek(self._fin)
+            f.write(b"".join(registros))
+            f.flush()
+            os.fsync(f.fileno())
+        # El índice se actualiza recorriendo lo recién escrito, igual que lo de otros procesos
+        self.ponerse_al_dia()
+        if self._fin > self._max_bytes:
+            self._crear_segmento(self._activo + 1, {})
+            self.ponerse_al_dia()
+
+    # --- COMPACTACIÓN ---
+
+    def bytes_muertos(self) -> Tuple[int, int]:
+        with self._lock:
+            total = sum(self._tamanios.values())
+            return total - sum(self._vivos.values()), total
+
+    def necesita_compactar(self) -> bool:
+        muertos, total = self.bytes_muertos()
+        return muertos > MINIMO_MUERTO and muertos > FRACCION_MUERTA * total
+
+    def compactar(self, forzar: bool = False) -> bool:
+        """Reescribe los registros vivos en un segmento nuevo, que pasa a ser el activo."""
+        with self._bloqueo():
+            self.ponerse_al_dia()
+            if not forzar and not self.necesita_compactar():
+                return False
+            with self._lock:
+                viejos = [s for s in self._segmentos() if s <= self._activo]
+                ubicaciones = sorted(self._indice.items(), key=lambda e: e[1][:2])
+                nuevo = self._activo + 1
+            # Las escrituras (de todos los procesos) esperan el bloqueo; las lecturas siguen
+            partes, nuevas = [], {}
+            abiertos: Dict[int, Any] = {}
+            try:
+                for clave, (segmento, origen, largo, version) in ubicaciones:
+                    f = abiertos.get(segmento) or abiertos.setdefault(segmento, open(self._path(segmento), "rb"))
+                    f.seek(origen)
+                    crudo = f.read(largo)
+                    campos = list(_REGISTRO.unpack(crudo[:_REGISTRO.size]))
+                    campos[1] = 0  # cada registro queda como su propia unidad
+                    partes.append(_REGISTRO.pack(*campos) + crudo[_REGISTRO.size:])
+                    nuevas[clave] = largo, version
+            finally:
+                for f in abiertos.values():
+                    f.close()
+            registros = b"".join(partes)
+            meta = {"reemplaza": viejos}
+            largo_meta = _META.size + len(json.dumps(meta).encode("utf-8"))
+
+            with self._lock:
+                fin = self._crear_segmento(nuevo, meta, registros)
+                offset = largo_meta
+                for clave, (largo, version) in nuevas.items():
+                    self._indice[clave] = (nuevo, offset, largo, version)
+                    offset += largo
+                self._vivos = {nuevo: len(registros)}
+                self._tamanios = {nuevo: fin}
+                self._activo = nuevo
+                self._fin = fin
+                for segmento in viejos:
+                    try:
+                        os.remove(self._path(segmento))
+                    except FileNotFoundError:
+                        pass
+            print(f"INFO: Log de segmentos compactado ({len(viejos)} segmentos -> 1, {len(nuevas)} registros)")
+            return True
+
+    def iniciar_compactador(self, intervalo: int):
+        if self._compactador is not None or intervalo <= 0:
+            return
+
+        def _bucle():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    if self.necesita_compactar():
+                        self.compactar()
+                except Exception as e:
+                    print(f"ERROR: Compactador de segmentos: {e}")
+
+        self._compactador = threading.Thread(target=_bucle, name="compactador-segmentos", daemon=True)
+        self._compactador.start()
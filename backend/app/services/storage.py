@@ -0,0 +1,857 @@
+# backend/app/services/storage.py
+"""
+Capa de persistencia de historias y pacientes.
+
+Los servicios y endpoints leen y escriben sólo a través de estas funciones; el
+backend concreto lo elige STORAGE_BACKEND:
+
+- "json": un archivo por registro en ./data/historias y ./data/pacientes
+  (el formato de siempre).
+- "sqlite": app/core/database.py, con columnas indexadas para DNI, fecha de
+  consulta, estado, diagnóstico y forma.
+- "compacto": como "json", pero cada historia en el formato binario de
+  app/services/formato_compacto.py (validada como diferencia del borrador,
+  texto original aparte). Lee también los .json viejos; `compactar` los
+  convierte.
+- "segmentos": historias y pacientes anexados a archivos de segmento con un
+  índice de offsets en memoria y un compactador en segundo plano
+  (app/services/segmentos.py); sin un archivo por registro ni os.listdir.
+  El log es en sí mismo el journal.
+
+Los índices que sólo usan datos estructurados cargan con
+`iter_historias_livianas()`: historias sin secciones_texto ni texto_original,
+que en "compacto" se leen sin descomprimir el texto libre.
+
+Las escrituras se aplican en unidades atómicas: cada save/delete suelto es una
+unidad, y `with transaccion():` agrupa varias (importación = historia +
+paciente, borrado en cascada, validación masiva). En "json" cada unidad se
+anexa primero al journal (JOURNAL_PATH, una línea y un solo fsync) y después se
+escriben los archivos con archivo temporal + rename, sin fsync por archivo. Al
+abrir el backend se re-aplica el journal, así que un corte a mitad de camino no
+deja JSON truncados ni unidades a medias. El journal se vacía (checkpoint,
+fsync de los archivos que nombra) al pasar JOURNAL_MAX_BYTES y al arrancar.
+En "sqlite" cada unidad es una transacción.
+
+Cada historia y paciente lleva un campo "version" que se incrementa en cada
+escritura. `save_*(registro, version_esperada=n)` sólo escribe si la versión en
+disco sigue siendo n y si no lanza ConflictoVersion (el 409 de los endpoints);
+con `version_esperada=NO_EXISTE` el registro no debe existir todavía (altas).
+La verificación y la escritura ocurren bajo un bloqueo de archivo compartido
+entre procesos (el servidor y los comandos de abajo); las lecturas nunca lo
+toman.
+
+Los índices en memoria se suscriben con `suscribir_historias(fn)` (o
+`suscribir_pacientes(fn)`) y se enteran de cada alta, modificación o baja sin
+que cada endpoint tenga que avisarles. Toda escritura incrementa además un
+contador de generación (`generacion()`) con el que se invalidan las respuestas
+cacheadas. Índices, deduplicación y generación viven en la memoria del proceso
+que escribe: el servidor corre con un solo worker de uvicorn y
+`reservar_servidor()` (al arrancar) rechaza un segundo proceso sobre el mismo
+./data.
+
+Migración del árbol JSON existente a SQLite, al formato compacto o al log de
+segmentos, y exportación del backend actual a un JSON por registro:
+
+    python -m app.services.storage migrar
+    python -m app.services.storage compactar
+    python -m app.services.storage segmentar
+    python -m app.services.storage exportar [destino]
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Callable
+
+from app.core import config, database
+from app.services import formato_compacto, segmentos
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+HISTORIAS_DIR = "./data/historias"
+PACIENTES_DIR = "./data/pacientes"
+SEGMENTOS_DIR = "./data/segmentos"
+JOURNAL_PATH = "./data/journal/operaciones.log"
+JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+LOCK_PATH = "./data/journal/escritura.lock"
+SERVIDOR_LOCK_PATH = "./data/journal/servidor.lock"
+
+_listeners: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
+_listeners_pacientes: List[Callable[[str, str, Optional[Dict[str, Any]]], None]] = []
+_backend = None
+_backend_lock = threading.Lock()
+_generacion = 0
+_generacion_lock = threading.Lock()
+_tx = threading.local()
+_servidor = None  # archivo de SERVIDOR_LOCK_PATH, abierto mientras viva el proceso
+
+
+# version_esperada para un alta: otro escritor no lo creó mientras tanto
+NO_EXISTE = -1
+
+
+class ConflictoVersion(Exception):
+    """El registro cambió desde que se leyó (la versión esperada ya no es la actual)."""
+
+    def __init__(self, tipo: str, id_registro: str, esperada: int, actual: Optional[int]):
+        if esperada == NO_EXISTE:
+            super().__init__(f"{tipo} {id_registro}: se esperaba que no existiera y ya está en la versión {actual}")
+        else:
+            super().__init__(f"{tipo} {id_registro}: se esperaba la versión {esperada} y la actual es {actual}")
+        self.tipo = tipo
+        self.id_registro = id_registro
+        self.esperada = esperada
+        self.actual = actual
+
+
+def limpiar_dni(dni: Any) -> str:
+    return "".join(filter(str.isdigit, str(dni or "")))
+
+
+def columnas_historia(h: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos consultables de una historia (prioridad a la data validada)."""
+    data = h.get("validada") or h.get("borrador") or {}
+    paciente = data.get("paciente", {}) or {}
+    consulta = data.get("consulta", {}) or {}
+    enf = data.get("enfermedad", {}) or {}
+    return {
+        "dni": limpiar_dni(paciente.get("dni")) or None,
+        "fecha_consulta": consulta.get("fecha"),
+        "estado": h.get("estado"),
+        "diagnostico": enf.get("diagnostico"),
+        "forma": enf.get("forma"),
+    }
+
+
+def _fsync_directorio(directorio: str):
+    try:
+        fd = os.open(directorio, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # Windows no permite fsync de directorios
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def bloqueo_entre_procesos():
+    """Exclusión de escritores entre procesos (flock; en Windows, msvcrt.locking)."""
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    with open(LOCK_PATH, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK se rinde a los 10 s; seguimos esperando
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def reservar_servidor():
+    """
+    Marca este proceso como el único servidor sobre ./data (bloqueo sin espera
+    que se suelta al terminar el proceso). Con un segundo worker de uvicorn los
+    índices, la deduplicación y la caché de respuestas de cada proceso no verían
+    las escrituras del otro, así que se corta el arranque con RuntimeError.
+    """
+    global _servidor
+    if _servidor is not None:
+        return
+    os.makedirs(os.path.dirname(SERVIDOR_LOCK_PATH), exist_ok=True)
+    f = open(SERVIDOR_LOCK_PATH, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        raise RuntimeError(
+            f"Ya hay un servidor de NeuroSoft usando {os.path.dirname(os.path.abspath(HISTORIAS_DIR))}: "
+            "el backend corre con un solo worker de uvicorn (sin --workers)"
+        )
+    _servidor = f
+
+
+def _versionar(ops: List[Dict[str, Any]], version_actual: Callable[[str, str], Optional[int]]):
+    """
+    Verifica las versiones esperadas y numera los registros a guardar. Se llama
+    con el bloqueo de escritura tomado. version_actual devuelve None si el
+    registro no existe (y 0 si existe pero es anterior a las versiones);
+    NO_EXISTE exige justamente ese None.
+    """
+    vistas: Dict[tuple, Optional[int]] = {}
+    for op in ops:
+        clave = (op["tipo"], op["id"])
+        actual = vistas[clave] if clave in vistas else version_actual(*clave)
+        esperada = op.pop("version_esperada", None)
+        if esperada == NO_EXISTE:
+            if actual is not None:
+                raise ConflictoVersion(op["tipo"], op["id"], esperada, actual)
+        elif esperada is not None and esperada != actual:
+            raise ConflictoVersion(op["tipo"], op["id"], esperada, actual)
+        if op["op"] == "guardar":
+            op["data"]["version"] = (actual or 0) + 1
+            vistas[clave] = op["data"]["version"]
+        else:
+            vistas[clave] = None
+
+
+class JsonStorage:
+    """Un JSON con indent=2 por registro; las búsquedas por DNI recorren el directorio."""
+
+    nombre = "json"
+
+    def __init__(self):
+        self._journal_lock = threading.Lock()
+        self._recuperar()
+
+    def _path(self, directorio: str, id_registro: str) -> str:
+        return os.path.join(directorio, f"{id_registro}.json")
+
+    def _path_op(self, op: Dict[str, Any]) -> str:
+        return self._path(HISTORIAS_DIR if op["tipo"] == "historia" else PACIENTES_DIR, op["id"])
+
+    def _paths_op(self, op: Dict[str, Any]) -> List[str]:
+        """Archivos que escribe la operación (los que el checkpoint lleva a disco)."""
+        return [self._path_op(op)]
+
+    def _leer(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _escribir(self, path: str, data: Dict[str, Any]):
+        # Temporal + rename: nadie ve nunca un JSON a medio escribir
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def _aplicar_op(self, op: Dict[str, Any]):
+        path = self._path_op(op)
+        if op["op"] == "guardar":
+            self._escribir(path, op["data"])
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _iterar(self, directorio: str) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(directorio):
+            return
+        for fname in sorted(os.listdir(directorio)):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                data = self._leer(os.path.join(directorio, fname))
+            except Exception as e:
+                print(f"WARNING: Registro ilegible, se omite {fname}: {e}")
+                continue
+            if data is not None:
+                data.setdefault("id", fname[:-5])
+                yield data
+
+    # --- JOURNAL ---
+
+    def aplicar(self, ops: List[Dict[str, Any]]):
+        """Escribe una unidad: una línea + fsync en el journal y luego los archivos."""
+        with self._journal_lock, bloqueo_entre_procesos():
+            _versionar(ops, self._version_actual)
+            linea = json.dumps({"ops": ops}, ensure_ascii=False) + "\n"
+            os.makedirs(os.path.dirname(JOURNAL_PATH), exist_ok=True)
+            with open(JOURNAL_PATH, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+                tamanio = f.tell()
+            for op in ops:
+                self._aplicar_op(op)
+            if tamanio > JOURNAL_MAX_BYTES:
+                self._checkpoint()
+
+    def _unidades_journal(self, avisar: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        if not os.path.exists(JOURNAL_PATH):
+            return
+        with open(JOURNAL_PATH, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    yield json.loads(linea)["ops"]
+                except (ValueError, KeyError):
+                    # Última línea cortada por un crash: esa unidad nunca se confirmó
+                    if avisar:
+                        print("WARNING: Entrada incompleta en el journal, se descarta")
+
+    def _checkpoint(self):
+        """Deja en disco los archivos que nombra el journal y lo vacía."""
+        paths = {path for ops in self._unidades_journal(avisar=False) for op in ops for path in self._paths_op(op)}
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for directorio in (HISTORIAS_DIR, PACIENTES_DIR):
+            _fsync_directorio(directorio)
+        if os.path.exists(JOURNAL_PATH):
+            with open(JOURNAL_PATH, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _recuperar(self):
+        """Re-aplica el journal en orden (idempotente) y limpia temporales huérfanos."""
+        with self._journal_lock, bloqueo_entre_procesos():
+            unidades = 0
+            for ops in self._unidades_journal():
+                for op in ops:
+                    self._aplicar_op(op)
+                unidades += 1
+            if unidades:
+                print(f"INFO: Journal re-aplicado ({unidades} unidades)")
+            # Temporales de escrituras cortadas; los recientes pueden ser de otro worker en curso
+            limite = time.time() - 60
+            for directorio in (HISTORIAS_DIR, PACIENTES_DIR):
+                if os.path.isdir(directorio):
+                    for fname in os.listdir(directorio):
+                        path = os.path.join(directorio, fname)
+                        try:
+                            if fname.endswith(".tmp") and os.path.getmtime(path) < limite:
+                                os.remove(path)
+                        except OSError:
+                            pass
+            self._checkpoint()
+
+    # --- LECTURAS ---
+
+    def _version_actual(self, tipo: str, id_registro: str) -> Optional[int]:
+        try:
+            data = self._leer(self._path_op({"tipo": tipo, "id": id_registro}))
+        except ValueError:
+            data = {}  # ilegible: existe, sin versión
+        return None if data is None else data.get("version", 0)
+
+    def existe(self, tipo: str, id_registro: str) -> bool:
+        return os.path.exists(self._path_op({"tipo": tipo, "id": id_registro}))
+
+    def get_historia(self, id_historia):
+        return self._leer(self._path(HISTORIAS_DIR, id_historia))
+
+    def iter_historias(self):
+        return self._iterar(HISTORIAS_DIR)
+
+    def iter_historias_livianas(self):
+        return (formato_compacto.liviana(h) for h in self.iter_historias())
+
+    def historias_por_dni(self, dni):
+        objetivo = limpiar_dni(dni)
+        return [h for h in self.iter_historias() if objetivo and columnas_historia(h)["dni"] == objetivo]
+
+    def get_paciente(self, id_paciente):
+        return self._leer(self._path(PACIENTES_DIR, id_paciente))
+
+    def iter_pacientes(self):
+        return self._iterar(PACIENTES_DIR)
+
+
+class CompactoStorage(JsonStorage):
+    """
+    JsonStorage con las historias en {id}.nsh + {id}.texto.z (formato_compacto).
+    Un {id}.json viejo se sigue leyendo hasta que se reescribe la historia o se
+    corre `compactar`; los pacientes quedan en JSON.
+    """
+
+    nombre = "compacto"
+
+    def _path_historia(self, id_historia: str, extension: str) -> str:
+        return os.path.join(HISTORIAS_DIR, f"{id_historia}{extension}")
+
+    def _path_op(self, op: Dict[str, Any]) -> str:
+        if op["tipo"] == "historia":
+            return self._path_historia(op["id"], ".nsh")
+        return super()._path_op(op)
+
+    def _paths_op(self, op: Dict[str, Any]) -> List[str]:
+        if op["tipo"] == "historia":
+            return [self._path_historia(op["id"], ext) for ext in (".nsh", ".texto.z")]
+        return super()._paths_op(op)
+
+    def _escribir_bytes(self, path: str, crudo: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(crudo)
+        os.replace(tmp_path, path)
+
+    def _borrar(self, *paths: str):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _aplicar_op(self, op: Dict[str, Any]):
+        if op["tipo"] != "historia":
+            return super()._aplicar_op(op)
+        nsh, texto, viejo = (self._path_historia(op["id"], ext) for ext in (".nsh", ".texto.z", ".json"))
+        if op["op"] == "guardar":
+            crudo, crudo_texto = formato_compacto.codificar(op["data"])
+            os.makedirs(HISTORIAS_DIR, exist_ok=True)
+            # Primero el texto: el .nsh nuevo nunca apunta a un texto viejo
+            if crudo_texto is not None:
+                self._escribir_bytes(texto, crudo_texto)
+            else:
+                self._borrar(texto)
+            self._escribir_bytes(nsh, crudo)
+            self._borrar(viejo)
+        else:
+            self._borrar(nsh, texto, viejo)
+
+    def _leer_historia(self, id_historia: str, liviana: bool = False) -> Optional[Dict[str, Any]]:
+        nsh = self._path_historia(id_historia, ".nsh")
+        try:
+            if liviana:
+                return formato_compacto.leer_liviana(nsh)
+            return formato_compacto.leer(nsh, self._path_historia(id_historia, ".texto.z"))
+        except FileNotFoundError:
+            pass
+        viejo = self._leer(self._path_historia(id_historia, ".json"))
+        if viejo is not None and liviana:
+            return formato_compacto.liviana(viejo)
+        return viejo
+
+    def _iterar_historias(self, liviana: bool) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(HISTORIAS_DIR):
+            return
+        ids = set()
+        for fname in os.listdir(HISTORIAS_DIR):
+            if fname.endswith(".nsh"):
+                ids.add(fname[:-4])
+            elif fname.endswith(".json"):
+                ids.add(fname[:-5])
+        for id_historia in sorted(ids):
+            try:
+                data = self._leer_historia(id_historia, liviana)
+            except Exception as e:
+                print(f"WARNING: Registro ilegible, se omite {id_historia}: {e}")
+                continue
+            if data is not None:
+                data.setdefault("id", id_historia)
+                yield data
+
+    def _version_actual(self, tipo: str, id_registro: str) -> Optional[int]:
+        if tipo != "historia":
+            return super()._version_actual(tipo, id_registro)
+        try:
+            data = self._leer_historia(id_registro, liviana=True)
+        except ValueError:
+            data = {}  # ilegible: existe, sin versión
+        return None if data is None else data.get("version", 0)
+
+    def existe(self, tipo: str, id_registro: str) -> bool:
+        if tipo != "historia":
+            return super().existe(tipo, id_registro)
+        return any(os.path.exists(self._path_historia(id_registro, ext)) for ext in (".nsh", ".json"))
+
+    def get_historia(self, id_historia):
+        return self._leer_historia(id_historia)
+
+    def iter_historias(self):
+        return self._iterar_historias(liviana=False)
+
+    def iter_historias_livianas(self):
+        return self._iterar_historias(liviana=True)
+
+    def compactar(self) -> int:
+        """Reescribe en formato compacto las historias que siguen en .json."""
+        convertidas = 0
+        with self._journal_lock, bloqueo_entre_procesos():
+            for fname in sorted(os.listdir(HISTORIAS_DIR)) if os.path.isdir(HISTORIAS_DIR) else []:
+                if not fname.endswith(".json"):
+                    continue
+                id_historia = fname[:-5]
+                try:
+                    data = self._leer(os.path.join(HISTORIAS_DIR, fname))
+                except ValueError as e:
+                    print(f"WARNING: Registro ilegible, se omite {fname}: {e}")
+                    continue
+                if data is None:
+                    continue
+                data.setdefault("id", id_historia)
+                # Sin journal: cada paso es un rename atómico y el .json se borra al final
+                self._aplicar_op({"op": "guardar", "tipo": "historia", "id": id_historia, "data": data})
+                convertidas += 1
+        return convertidas
+
+
+class SqliteStorage:
+    """Tablas historias/pacientes de app/core/database.py (WAL, una transacción por unidad)."""
+
+    nombre = "sqlite"
+
+    def _uno(self, sql, params):
+        fila = database.get_connection().execute(sql, params).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def _iterar(self, sql, params=()):
+        # El cursor de sqlite3 es perezoso: no se materializa la tabla entera
+        for (data,) in database.get_connection().execute(sql, params):
+            yield json.loads(data)
+
+    def _aplicar_op(self, conn, op: Dict[str, Any]):
+        tabla = "historias" if op["tipo"] == "historia" else "pacientes"
+        if op["op"] == "borrar":
+            conn.execute(f"DELETE FROM {tabla} WHERE id = ?", (op["id"],))
+        elif tabla == "historias":
+            historia = op["data"]
+            cols = columnas_historia(historia)
+            conn.execute(
+                "INSERT OR REPLACE INTO historias (id, dni, fecha_consulta, estado, diagnostico, forma, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (historia["id"], cols["dni"], cols["fecha_consulta"], cols["estado"],
+                 cols["diagnostico"], cols["forma"], json.dumps(historia, ensure_ascii=False)),
+            )
+        else:
+            paciente = op["data"]
+            conn.execute(
+                "INSERT OR REPLACE INTO pacientes (id, dni, nombre, data) VALUES (?, ?, ?, ?)",
+                (paciente["id"], paciente.get("dni"), paciente.get("nombre"),
+                 json.dumps(paciente, ensure_ascii=False)),
+            )
+
+    def _version_actual(self, conn, tipo: str, id_registro: str) -> Optional[int]:
+        tabla = "historias" if tipo == "historia" else "pacientes"
+        fila = conn.execute(f"SELECT data FROM {tabla} WHERE id = ?", (id_registro,)).fetchone()
+        return None if fila is None else json.loads(fila[0]).get("version", 0)
+
+    def aplicar(self, ops: List[Dict[str, Any]]):
+        conn = database.get_connection()
+        with conn:
+            # IMMEDIATE toma el lock de escritura de SQLite (entre procesos) antes de leer versiones
+            conn.execute("BEGIN IMMEDIATE")
+            _versionar(ops, lambda tipo, id_registro: self._version_actual(conn, tipo, id_registro))
+            for op in ops:
+                self._aplicar_op(conn, op)
+
+    def copiar(self, ops: List[Dict[str, Any]]):
+        """Como aplicar, pero sin _versionar: los registros conservan su "version" (migración)."""
+        conn = database.get_connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for op in ops:
+                self._aplicar_op(conn, op)
+
+    def existe(self, tipo: str, id_registro: str) -> bool:
+        tabla = "historias" if tipo == "historia" else "pacientes"
+        return database.get_connection().execute(
+            f"SELECT 1 FROM {tabla} WHERE id = ?", (id_registro,)
+        ).fetchone() is not None
+
+    def get_historia(self, id_historia):
+        return self._uno("SELECT data FROM historias WHERE id = ?", (id_historia,))
+
+    def iter_historias(self):
+        return self._iterar("SELECT data FROM historias ORDER BY id")
+
+    def iter_historias_livianas(self):
+        return (formato_compacto.liviana(h) for h in self.iter_historias())
+
+    def historias_por_dni(self, dni):
+        objetivo = limpiar_dni(dni)
+        if not objetivo:
+            return []
+        return list(self._iterar("SELECT data FROM historias WHERE dni = ? ORDER BY id", (objetivo,)))
+
+    def get_paciente(self, id_paciente):
+        return self._uno("SELECT data FROM pacientes WHERE id = ?", (id_paciente,))
+
+    def iter_pacientes(self):
+        return self._iterar("SELECT data FROM pacientes ORDER BY id")
+
+
+class SegmentosStorage:
+    """Log de segmentos append-only (segmentos.LogSegmentos) con compactación en segundo plano."""
+
+    nombre = "segmentos"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._log = segmentos.LogSegmentos(
+            SEGMENTOS_DIR, config.SEGMENTOS_MAX_MB * 1024 * 1024, bloqueo_entre_procesos
+        )
+        self._log.iniciar_compactador(config.SEGMENTOS_COMPACTAR_CADA)
+
+    def aplicar(self, ops: List[Dict[str, Any]]):
+        with self._lock, bloqueo_entre_procesos():
+            self._log.ponerse_al_dia()
+            _versionar(ops, self._log.version)
+            self._log.escribir(ops)
+
+    def copiar(self, ops: List[Dict[str, Any]]):
+        """Como aplicar, pero sin _versionar: los registros conservan su "version" (migración)."""
+        with self._lock, bloqueo_entre_procesos():
+            self._log.escribir(ops)
+
+    def compactar(self) -> bool:
+        return self._log.compactar(forzar=True)
+
+    def existe(self, tipo: str, id_registro: str) -> bool:
+        return self._log.existe(tipo, id_registro)
+
+    def get_historia(self, id_historia):
+        return self._log.leer("historia", id_historia)
+
+    def iter_historias(self):
+        return self._log.iterar("historia")
+
+    def iter_historias_livianas(self):
+        return (formato_compacto.liviana(h) for h in self.iter_historias())
+
+    def historias_por_dni(self, dni):
+        objetivo = limpiar_dni(dni)
+        return [h for h in self.iter_historias() if objetivo and columnas_historia(h)["dni"] == objetivo]
+
+    def get_paciente(self, id_paciente):
+        return self._log.leer("paciente", id_paciente)
+
+    def iter_pacientes(self):
+        return self._log.iterar("paciente")
+
+
+BACKENDS = {"json": JsonStorage, "sqlite": SqliteStorage, "compacto": CompactoStorage, "segmentos": SegmentosStorage}
+
+
+def get_storage():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                clase = BACKENDS.get(config.STORAGE_BACKEND)
+                if clase is None:
+                    raise ValueError(f"STORAGE_BACKEND desconocido: {config.STORAGE_BACKEND}")
+                _backend = clase()
+    return _backend
+
+
+def suscribir_historias(fn: Callable[[str, str, Optional[Dict[str, Any]]], None]):
+    """fn(evento, id_historia, historia) con evento "guardada" o "eliminada" (historia=None)."""
+    _listeners.append(fn)
+
+
+def suscribir_pacientes(fn: Callable[[str, str, Optional[Dict[str, Any]]], None]):
+    """Igual que suscribir_historias, para el registro de pacientes."""
+    _listeners_pacientes.append(fn)
+
+
+def generacion() -> int:
+    """Cambia con cada alta, modificación o baja de historias o pacientes."""
+    return _generacion
+
+
+def _nueva_generacion():
+    # Después de avisar a los índices: quien lea la generación vieja y calcule
+    # con índices desactualizados deja una entrada que ya nace invalidada
+    global _generacion
+    with _generacion_lock:
+        _generacion += 1
+
+
+def _notificar(evento: str, id_historia: str, historia: Optional[Dict[str, Any]]):
+    for fn in _listeners:
+        try:
+            fn(evento, id_historia, historia)
+        except Exception as e:
+            print(f"WARNING: Listener de historias falló ({evento} {id_historia}): {e}")
+
+
+def _notificar_paciente(evento: str, id_paciente: str, paciente: Optional[Dict[str, Any]]):
+    for fn in _listeners_pacientes:
+        try:
+            fn(evento, id_paciente, paciente)
+        except Exception as e:
+            print(f"WARNING: Listener de pacientes falló ({evento} {id_paciente}): {e}")
+
+
+def _avisar(op: Dict[str, Any]):
+    if op["tipo"] == "historia":
+        _notificar("guardada" if op["op"] == "guardar" else "eliminada", op["id"], op.get("data"))
+    else:
+        _notificar_paciente("guardado" if op["op"] == "guardar" else "eliminado", op["id"], op.get("data"))
+
+
+def _confirmar(ops: List[Dict[str, Any]]):
+    get_storage().aplicar(ops)
+    for op in ops:
+        _avisar(op)
+    _nueva_generacion()
+
+
+def _escribir(op: Dict[str, Any]):
+    pendientes = getattr(_tx, "ops", None)
+    if pendientes is not None:
+        pendientes.append(op)
+    else:
+        _confirmar([op])
+
+
+@contextmanager
+def transaccion():
+    """
+    Agrupa las escrituras del bloque en una unidad atómica: se aplican todas al
+    salir (o ninguna si hay una excepción). Dentro del bloque las lecturas no
+    ven todavía lo escrito. Un bloque anidado se suma al de afuera.
+    """
+    if getattr(_tx, "ops", None) is not None:
+        yield
+        return
+    _tx.ops = []
+    try:
+        yield
+        ops = _tx.ops
+    finally:
+        _tx.ops = None
+    if ops:
+        _confirmar(ops)
+
+
+# --- HISTORIAS ---
+
+def get_historia(id_historia: str) -> Optional[Dict[str, Any]]:
+    return get_storage().get_historia(id_historia)
+
+
+def save_historia(historia: Dict[str, Any], version_esperada: Optional[int] = None):
+    _escribir({"op": "guardar", "tipo": "historia", "id": historia["id"], "data": historia,
+               "version_esperada": version_esperada})
+
+
+def delete_historia(id_historia: str, version_esperada: Optional[int] = None) -> bool:
+    if not get_storage().existe("historia", id_historia):
+        return False
+    _escribir({"op": "borrar", "tipo": "historia", "id": id_historia, "version_esperada": version_esperada})
+    return True
+
+
+def iter_historias() -> Iterator[Dict[str, Any]]:
+    return get_storage().iter_historias()
+
+
+def iter_historias_livianas() -> Iterator[Dict[str, Any]]:
+    """Historias sin texto libre (borrador y validada sin secciones_texto ni texto_original)."""
+    return get_storage().iter_historias_livianas()
+
+
+def historias_por_dni(dni: Any) -> List[Dict[str, Any]]:
+    return get_storage().historias_por_dni(dni)
+
+
+# --- PACIENTES ---
+
+def get_paciente(id_paciente: str) -> Optional[Dict[str, Any]]:
+    return get_storage().get_paciente(id_paciente)
+
+
+def save_paciente(paciente: Dict[str, Any], version_esperada: Optional[int] = None):
+    _escribir({"op": "guardar", "tipo": "paciente", "id": paciente["id"], "data": paciente,
+               "version_esperada": version_esperada})
+
+
+def delete_paciente(id_paciente: str) -> bool:
+    if not get_storage().existe("paciente", id_paciente):
+        return False
+    _escribir({"op": "borrar", "tipo": "paciente", "id": id_paciente})
+    return True
+
+
+def iter_pacientes() -> Iterator[Dict[str, Any]]:
+    return get_storage().iter_pacientes()
+
+
+# --- MIGRACIÓN ---
+
+def migrar_json_a_segmentos() -> Dict[str, int]:
+    """
+    Copia historias (.json o compactas) y pacientes al log de segmentos, en una
+    sola unidad y con sus versiones tal cual.
+    """
+    origen, destino = CompactoStorage(), SegmentosStorage()
+    historias = [{"op": "guardar", "tipo": "historia", "id": h["id"], "data": h} for h in origen.iter_historias()]
+    pacientes = [{"op": "guardar", "tipo": "paciente", "id": p["id"], "data": p} for p in origen.iter_pacientes()]
+    destino.copiar(historias + pacientes)
+    return {"historias": len(historias), "pacientes": len(pacientes)}
+
+
+def exportar_json(destino: str) -> Dict[str, int]:
+    """Vuelca el backend actual al formato de siempre: {destino}/historias y {destino}/pacientes, un JSON por registro."""
+    backend = get_storage()
+    cantidades = {}
+    for nombre, registros in (("historias", backend.iter_historias()), ("pacientes", backend.iter_pacientes())):
+        directorio = os.path.join(destino, nombre)
+        os.makedirs(directorio, exist_ok=True)
+        cantidades[nombre] = 0
+        for data in registros:
+            tmp_path = os.path.join(directorio, f"{data['id']}.json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, tmp_path[:-4])
+            cantidades[nombre] += 1
+    return cantidades
+
+
+def migrar_json_a_sqlite() -> Dict[str, int]:
+    """
+    Copia ./data/historias y ./data/pacientes a SQLite (idempotente: reemplaza
+    por id). Las versiones se conservan: los If-Match de los clientes siguen valiendo.
+    """
+    origen, destino = JsonStorage(), SqliteStorage()
+    historias = [{"op": "guardar", "tipo": "historia", "id": h["id"], "data": h} for h in origen.iter_historias()]
+    pacientes = [{"op": "guardar", "tipo": "paciente", "id": p["id"], "data": p} for p in origen.iter_pacientes()]
+    destino.copiar(historias + pacientes)  # una sola transacción
+    return {"historias": len(historias), "pacientes": len(pacientes)}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrar"]:
+        resultado = migrar_json_a_sqlite()
+        print(f"Migrados a {config.SQLITE_PATH}: {resultado['historias']} historias, {resultado['pacientes']} pacientes")
+        print("Para usarlo: STORAGE_BACKEND=sqlite")
+    elif sys.argv[1:] == ["compactar"]:
+        print(f"Historias convertidas al formato compacto: {CompactoStorage().compactar()}")
+        print("Para usarlo: STORAGE_BACKEND=compacto")
+    elif sys.argv[1:] == ["segmentar"]:
+        resultado = migrar_json_a_segmentos()
+        print(f"Copiados a {SEGMENTOS_DIR}: {resultado['historias']} historias, {resultado['pacientes']} pacientes")
+        print("Para usarlo: STORAGE_BACKEND=segmentos")
+    elif sys.argv[1:2] == ["exportar"] and len(sys.argv) <= 3:
+        destino = sys.argv[2] if len(sys.argv) == 3 else "./data/exportado"
+        resultado = exportar_json(destino)
+        print(f"Exportados desde {config.STORAGE_BACKEND} a {destino}: {resultado['historias']} historias, {resultado['pacientes']} pacientes")
+    else:
+        print("Uso: python -m app.services.storage migrar | compactar | segmentar | exportar [destino]")
+        sys.exit(2)
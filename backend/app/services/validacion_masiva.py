@@ -0,0 +1,128 @@
+# backend/app/services/validacion_masiva.py
+"""
+Validación masiva por lotes, como trabajo de la cola (app/services/job_queue.py).
+
+Los pendientes salen del índice de estado (filtro_index), ordenados por id, y
+se aprueban de a VALIDACION_LOTE: cada lote es una unidad del journal y al
+confirmarlo se guarda en el trabajo el último id procesado. Si el servidor se
+reinicia en el medio, la cola re-encola el trabajo y sigue desde ese id; un lote
+que llegó a confirmarse sin checkpoint se vuelve a recorrer sin efecto, porque
+sus historias ya figuran validadas.
+"""
+import time
+from typing import Dict, Any, List, Optional
+
+from app.core import config
+from app.services import filtro_index, job_queue, storage
+
+TIPO = "validacion_masiva"
+
+# Reintentos de un lote cuando otro escribe una de sus historias
+REINTENTOS_CONFLICTO = 3
+
+
+def _validar_lote(ids: List[str]) -> int:
+    """Aprueba el borrador de las historias del lote que siguen pendientes; devuelve cuántas."""
+    for intento in range(REINTENTOS_CONFLICTO):
+        count = 0
+        try:
+            with storage.transaccion():
+                for id_historia in ids:
+                    h = storage.get_historia(id_historia)
+                    # Si no está validada, la aprobamos automáticamente
+                    if h and h.get("estado") != "validada":
+                        borrador = h.get("borrador")
+                        if borrador:
+                            h["validada"] = borrador
+                            h["estado"] = "validada"
+                            if "nivel_criticidad" not in h:
+                                h["nivel_criticidad"] = "medio"
+                            storage.save_historia(h, version_esperada=h.get("version", 0))
+                            count += 1
+            return count
+        except storage.ConflictoVersion:
+            # Se rehace el lote con lo que dejó el otro escritor
+            if intento == REINTENTOS_CONFLICTO - 1:
+                raise
+
+
+def validar_pendientes(job: Optional[Dict[str, Any]] = None, lote: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Recorre los pendientes por lotes de `lote` historias (por defecto el del
+    trabajo o VALIDACION_LOTE). Con `job` (un trabajo de la cola) retoma desde su
+    checkpoint y persiste el avance después de cada lote; sin él corre de una
+    (modo sync).
+    """
+    # Sólo un trabajo de verdad (con id) tiene dónde guardar el checkpoint
+    persistir = job is not None and bool(job.get("id"))
+    estado = job if job is not None else {}
+    lote = max(1, int(lote or estado.get("lote") or config.VALIDACION_LOTE))
+    ultimo_id = estado.get("ultimo_id")
+    revisadas = estado.get("revisadas", 0)
+    procesadas = estado.get("procesadas", 0)
+    segundos = estado.get("segundos", 0.0)
+
+    ids = [i for i in filtro_index.pendientes_de_validacion() if ultimo_id is None or i > ultimo_id]
+    total = revisadas + len(ids)
+    if persistir:
+        job_queue.actualizar(job, etapa="validando", total=total)
+
+    inicio = time.perf_counter()
+    for i in range(0, len(ids), lote):
+        grupo = ids[i:i + lote]
+        procesadas += _validar_lote(grupo)
+        revisadas += len(grupo)
+        if persistir:
+            # Checkpoint: si se corta acá, se retoma desde el id siguiente
+            job_queue.actualizar(
+                job, ultimo_id=grupo[-1], revisadas=revisadas, procesadas=procesadas,
+                segundos=round(segundos + time.perf_counter() - inicio, 3),
+            )
+
+    return {"total": total, "revisadas": revisadas, "procesadas": procesadas}
+
+
+def iniciar(lote: Optional[int] = None) -> Dict[str, Any]:
+    """Encola la validación masiva; si ya hay una en curso devuelve esa."""
+    job = job_queue.activo(TIPO)
+    if job is not None:
+        return job
+    return job_queue.encolar(TIPO, {
+        "lote": lote or config.VALIDACION_LOTE,
+        "ultimo_id": None,
+        "total": len(filtro_index.pendientes_de_validacion()),
+        "revisadas": 0,
+        "procesadas": 0,
+        "segundos": 0.0,
+    })
+
+
+def progreso(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Avance del trabajo con velocidad (historias revisadas por segundo) y ETA."""
+    total = job.get("total", 0)
+    revisadas = job.get("revisadas", 0)
+    segundos = job.get("segundos", 0.0)
+    por_segundo = revisadas / segundos if segundos > 0 else None
+    restantes = max(0, total - revisadas)
+    if job["estado"] == "completado":
+        eta = 0.0
+    else:
+        eta = round(restantes / por_segundo, 1) if por_segundo else None
+    return {
+        "job_id": job["id"],
+        "estado": job["estado"],
+        "etapa": job["etapa"],
+        "lote": job.get("lote"),
+        "total": total,
+        "revisadas": revisadas,
+        "procesadas": job.get("procesadas", 0),
+        "porcentaje": round(100 * revisadas / total, 1) if total else 100.0,
+        "registros_por_segundo": round(por_segundo, 1) if por_segundo else None,
+        "eta_segundos": eta,
+        "creado": job["creado"],
+        "actualizado": job["actualizado"],
+        "error": job.get("error"),
+    }
+
+
+job_queue.registrar_handler(TIPO, validar_pendientes)
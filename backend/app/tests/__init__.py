@@ -1 +1 @@
-# Tests (placeholder)
+# Tests
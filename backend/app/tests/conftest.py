@@ -0,0 +1,67 @@
+# backend/app/tests/conftest.py
+"""
+Fixtures comunes: cada test corre con su propio ./data vacío (tmp_path) y con
+el estado en memoria de storage, índices y cachés reiniciado.
+
+No se importa app.main (arrastra las dependencias de extracción: docx,
+pdfplumber); el cliente arma una app sólo con los routers de lectura/escritura.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import config, database
+from app.api import historias, pacientes, reportes
+from app.services import (
+    storage, historia_index, paciente_index, dedup_index, filtro_index,
+    busqueda_index, report_service, linea_tiempo, response_cache, job_queue,
+)
+
+INDICES = (historia_index, paciente_index, dedup_index, filtro_index, busqueda_index, report_service, linea_tiempo)
+
+
+def _reiniciar():
+    storage._backend = None
+    database.cerrar()
+    for modulo in INDICES:
+        modulo._cargado = False
+    job_queue._pendientes = None
+    with response_cache._lock:
+        response_cache._entradas.clear()
+
+
+@pytest.fixture
+def datos(tmp_path, monkeypatch):
+    """./data vacío en tmp_path con el backend por defecto (json)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "STORAGE_BACKEND", "json")
+    _reiniciar()
+    yield tmp_path
+    _reiniciar()
+
+
+@pytest.fixture
+def cliente(datos):
+    app = FastAPI()
+    app.include_router(historias.router)
+    app.include_router(pacientes.router)
+    app.include_router(reportes.router, prefix="/reportes")
+    return TestClient(app)
+
+
+def nueva_historia(id_historia, dni="30111222", fecha="2024-05-10", diagnostico="Esclerosis múltiple",
+                   forma="Remitente-recurrente", estado="pendiente_validacion", **borrador):
+    """Historia mínima con el formato que deja la importación."""
+    return {
+        "id": id_historia,
+        "estado": estado,
+        "dedup_key": f"DNI:{dni}|F:{fecha}|H:{id_historia}",
+        "hash_contenido": None,
+        "borrador": {
+            "paciente": {"dni": dni, "nombre": f"Paciente {dni}"},
+            "consulta": {"fecha": fecha},
+            "enfermedad": {"diagnostico": diagnostico, "forma": forma},
+            **borrador,
+        },
+        "validada": None,
+    }
@@ -0,0 +1,66 @@
+# backend/app/tests/test_busqueda.py
+import pytest
+
+from app.services import busqueda_index, storage
+from app.tests.conftest import nueva_historia
+
+
+@pytest.fixture
+def corpus(cliente):
+    textos = {
+        "h1": ("Disminución de agudeza visual. Neuritis óptica izquierda.", "Se inicia natalizumab."),
+        "h2": ("Parestesias en miembros inferiores.", "Bandas oligoclonales positivas en LCR."),
+        "h3": ("Neuritis ópticas a repetición, dolor ocular.", "Neuritis óptica bilateral; bandas oligoclonales."),
+    }
+    for id_historia, (sintomas, estudios) in textos.items():
+        storage.save_historia(nueva_historia(
+            id_historia, dni=f"3000000{id_historia[-1]}",
+            secciones_texto={"sintomas_principales": sintomas, "estudios": estudios},
+            texto_original=f"{sintomas}\n{estudios}",
+        ))
+    return cliente
+
+
+def test_normalizacion_y_stemming():
+    assert busqueda_index.tokenizar("Neuritis Ópticas") == busqueda_index.tokenizar("neuritis optica")
+    assert busqueda_index.tokenizar("de la en y") == []
+
+
+def test_todos_los_terminos_y_ranking(corpus):
+    _, resultados = busqueda_index.buscar("neuritis óptica")
+    assert [i for _, i in resultados] == ["h3", "h1"]  # h3 la menciona más veces
+    _, resultados = busqueda_index.buscar("bandas oligoclonales neuritis")
+    assert [i for _, i in resultados] == ["h3"]
+    assert busqueda_index.buscar("esclerodermia")[1] == []
+
+
+def test_endpoint_con_fragmentos_y_cursor(corpus):
+    r = corpus.get("/historias/buscar", params={"q": "Neuritis", "limit": 1})
+    assert r.status_code == 200
+    cuerpo = r.json()
+    assert cuerpo["total"] == 2 and cuerpo["terminos"] == ["neuritis"]
+    fragmento = cuerpo["items"][0]["fragmentos"][0]
+    a, b = fragmento["coincidencias"][0]
+    assert fragmento["texto"][a:b].lower() == "neuritis"
+
+    siguiente = corpus.get("/historias/buscar", params={"q": "Neuritis", "limit": 1, "cursor": cuerpo["cursor_siguiente"]})
+    assert [i["id"] for i in cuerpo["items"] + siguiente.json()["items"]] == ["h3", "h1"]
+    assert siguiente.json()["cursor_siguiente"] is None
+
+
+def test_indice_sigue_las_escrituras(corpus):
+    storage.delete_historia("h3")
+    h = storage.get_historia("h2")
+    h["validada"] = {**h["borrador"], "secciones_texto": {"evolucion": "Episodio de neuritis óptica derecha"}}
+    storage.save_historia(h)
+    assert sorted(i for _, i in busqueda_index.buscar("neuritis")[1]) == ["h1", "h2"]
+    assert busqueda_index.buscar("parestesias")[1] != []  # sigue en el texto original
+
+
+def test_snapshot_reutiliza_lo_indexado(corpus, capsys):
+    busqueda_index.guardar()
+    antes = busqueda_index.buscar("bandas oligoclonales")
+    capsys.readouterr()
+    busqueda_index.cargar()
+    assert "3 historias, 0 tokenizadas" in capsys.readouterr().out
+    assert busqueda_index.buscar("bandas oligoclonales") == antes
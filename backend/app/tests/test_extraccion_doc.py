@@ -0,0 +1,39 @@
+# backend/app/tests/test_extraccion_doc.py
+"""Los tiempos de antiword llegan a los del trabajo (con un antiword falso)."""
+import pytest
+
+pytest.importorskip("docx")
+pytest.importorskip("pdfplumber")
+
+from app.core import config  # noqa: E402
+from app.services import import_service, job_queue, nlp_service  # noqa: E402
+from app.utils import extract_text  # noqa: E402
+
+
+class _Antiword:
+    returncode = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def communicate(self, timeout=None):
+        return "Paciente: Ana López\nDNI 30.111.222".encode("latin-1"), b""
+
+
+def test_tiempos_de_antiword_en_el_trabajo(datos, monkeypatch):
+    monkeypatch.setattr(extract_text.subprocess, "Popen", _Antiword)
+    monkeypatch.setattr(config, "IMPORT_EXECUTOR", "thread")
+    monkeypatch.setattr(nlp_service, "process_text", lambda texto, tipo, nombre: {"texto_original": texto, "fuente": {}})
+    monkeypatch.setattr(import_service, "registrar_historia", lambda *args: None)
+    path = datos / "legacy.doc"
+    path.write_bytes(b"\xd0\xcf\x11\xe0")
+
+    job = job_queue.encolar("importacion", {"file_path": str(path), "hash_contenido": "sha-doc", "id_historia": "h1"})
+    import_service.ejecutar_job_importacion(job)
+
+    tiempos = job_queue.obtener(job["id"])["tiempos"]
+    assert {"extraccion_nlp", "antiword_espera", "antiword_spawn", "antiword_run"} <= set(tiempos)
+
+    # Segunda vez sale de la caché: no hay conversión que medir
+    borrador, tiempos = import_service.procesar_archivo_medido(str(path), "sha-doc")
+    assert tiempos == {} and "Ana López" in borrador["texto_original"]
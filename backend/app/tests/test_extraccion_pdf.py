@@ -0,0 +1,79 @@
+# backend/app/tests/test_extraccion_pdf.py
+"""Reparto de páginas de PDFs largos (con un pdfplumber falso: no hace falta un PDF real)."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("docx")
+pytest.importorskip("pdfplumber")
+
+from app.core import config  # noqa: E402
+from app.services import import_service, nlp_service  # noqa: E402
+from app.utils import extract_text  # noqa: E402
+
+
+class _Pagina:
+    def __init__(self, i):
+        self.i = i
+
+    def extract_text(self):
+        return f"página {self.i}"
+
+
+class _Pdf:
+    def __init__(self, n):
+        self.pages = [_Pagina(i) for i in range(n)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _PoolEnHilos(ThreadPoolExecutor):
+    """Reemplaza al pool de procesos de páginas y cuenta los rangos que recibe."""
+    rangos = 0
+
+    def map(self, fn, *iterables, **kwargs):
+        type(self).rangos += len(iterables[0])
+        return super().map(fn, *iterables, **kwargs)
+
+
+@pytest.fixture
+def pdf_largo(datos, monkeypatch):
+    monkeypatch.setattr(extract_text.pdfplumber, "open", lambda path: _Pdf(60))
+    monkeypatch.setattr(config, "PDF_WORKERS", 4)
+    monkeypatch.setattr(config, "PDF_PARALLEL_MIN_PAGES", 40)
+    monkeypatch.setattr(config, "IMPORT_EXECUTOR", "process")
+    _PoolEnHilos.rangos = 0
+    pool = _PoolEnHilos(max_workers=4)
+    monkeypatch.setattr(extract_text, "_get_pdf_pool", lambda: pool)
+    yield str(datos / "largo.pdf")
+    pool.shutdown()
+
+
+def test_worker_de_importacion_no_reparte_paginas(pdf_largo, monkeypatch):
+    monkeypatch.setattr(extract_text, "_en_worker_importacion", True)
+    texto, paginas, _ = extract_text.extract_text(pdf_largo)
+    assert paginas == 60 and _PoolEnHilos.rangos == 0
+    assert texto.splitlines()[-1] == "página 59"
+
+
+def test_pdf_largo_se_reparte_en_el_proceso_principal(pdf_largo, monkeypatch):
+    extraccion = import_service.extraer_en_principal(pdf_largo)
+    assert _PoolEnHilos.rangos == 4
+    assert extraccion[0].splitlines() == [f"página {i}" for i in range(60)]
+
+    # El worker recibe el texto ya extraído y sólo corre el NLP
+    monkeypatch.setattr(import_service, "extract_text", lambda *a, **k: pytest.fail("re-extrajo el PDF"))
+    monkeypatch.setattr(nlp_service, "process_text", lambda texto, tipo, nombre: {"texto_original": texto, "fuente": {}})
+    borrador = import_service.procesar_archivo(pdf_largo, "sha-largo", extraccion)
+    assert borrador["texto_original"] == extraccion[0]
+
+
+def test_max_pages_corta_y_pdf_corto_no_se_reparte(pdf_largo):
+    texto, paginas, _ = extract_text.extract_text(pdf_largo, max_pages=3)
+    assert texto.splitlines() == ["página 0", "página 1", "página 2"] and paginas == 60
+    assert _PoolEnHilos.rangos == 0
+    assert import_service.extraer_en_principal(pdf_largo.replace(".pdf", ".docx")) is None
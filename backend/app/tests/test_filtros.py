@@ -0,0 +1,81 @@
+# backend/app/tests/test_filtros.py
+from datetime import date
+
+import pytest
+
+from app.services import storage
+from app.tests.conftest import nueva_historia
+
+
+@pytest.fixture
+def cohorte(cliente):
+    anio = date.today().year
+    historias = [
+        nueva_historia("h1", fecha="2024-03-01", diagnostico="Esclerosis múltiple", forma="Remitente-recurrente",
+                       tratamientos=[{"droga": "Natalizumab"}]),
+        nueva_historia("h2", dni="28999111", fecha="2023-06-15", diagnostico="NMOSD", forma="Recurrente",
+                       tratamientos=[{"molecula": "Rituximab"}]),
+        nueva_historia("h3", dni="27000333", fecha="2022-01-20", diagnostico="Esclerosis múltiple",
+                       forma="Primaria progresiva"),
+    ]
+    edss = {"h1": "2,5", "h2": 6, "h3": "nan"}
+    nacimiento = {"h1": f"{anio - 30}-01-01", "h2": f"{anio - 45}-01-01", "h3": f"{anio - 60}-01-01"}
+    for h in historias:
+        h["borrador"]["enfermedad"]["edss"] = edss[h["id"]]
+        h["borrador"]["paciente"].update(fecha_nacimiento=nacimiento[h["id"]], sexo="F" if h["id"] != "h2" else "M")
+        storage.save_historia(h)
+    return cliente
+
+
+def _ids(cliente, **params):
+    r = cliente.get("/historias/filtrar", params=params)
+    assert r.status_code == 200
+    return [item["id"] for item in r.json()["items"]]
+
+
+def test_alias_de_fechas(cohorte):
+    assert _ids(cohorte, fechaDesde="2023-01-01") == ["h1", "h2"]
+    assert _ids(cohorte, fechaDesde="2023-01-01", fechaHasta="2023-12-31") == ["h2"]
+    assert _ids(cohorte, fechaHasta="2022-01-20") == ["h3"]
+
+
+@pytest.mark.parametrize("params", [
+    {"fechaDesde": "2023-13-01"},
+    {"fechaDesde": "01/02/2023"},
+    {"fechaHasta": "2023-1-5"},
+    {"fechaHasta": "ayer"},
+])
+def test_fechas_invalidas_dan_400(cohorte, params):
+    r = cohorte.get("/historias/filtrar", params=params)
+    assert r.status_code == 400
+    assert "YYYY-MM-DD" in r.json()["detail"]
+
+
+def test_alias_de_edad(cohorte):
+    assert _ids(cohorte, edadMin=40) == ["h2", "h3"]
+    assert _ids(cohorte, edadMin=40, edadMax=50) == ["h2"]
+    assert _ids(cohorte, edad=30) == ["h1"]
+
+
+def test_alias_de_edss(cohorte):
+    assert _ids(cohorte, escalaEDSS=2.5) == ["h1"]
+    assert _ids(cohorte, edssMin=2, edssMax=7) == ["h1", "h2"]
+    # "nan" no es un puntaje: no entra en ningún rango
+    assert _ids(cohorte, edssMin=0) == ["h1", "h2"]
+
+
+def test_texto_igualdad_y_combinados(cohorte):
+    assert _ids(cohorte, patologia="esclerosis") == ["h1", "h3"]
+    assert _ids(cohorte, patologia="nmo|progresiva") == ["h2"]
+    assert _ids(cohorte, medicamento="ritux|nataliz") == ["h1", "h2"]
+    assert _ids(cohorte, forma="primaria progresiva") == ["h3"]
+    assert _ids(cohorte, sexo="F", patologia="esclerosis", fechaDesde="2024-01-01") == ["h1"]
+
+
+def test_filtros_siguen_las_escrituras(cohorte):
+    storage.delete_historia("h1")
+    assert _ids(cohorte, patologia="esclerosis") == ["h3"]
+    h = storage.get_historia("h3")
+    h["borrador"]["enfermedad"]["edss"] = "7,0"
+    storage.save_historia(h)
+    assert _ids(cohorte, edssMin=6.5) == ["h3"]
@@ -0,0 +1,44 @@
+# backend/app/tests/test_importacion_lote.py
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip("docx")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("multipart")  # python-multipart: lo exige File(...)
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.api import importaciones  # noqa: E402
+from app.services import import_service  # noqa: E402
+
+
+def _zip_con_miembro_corrupto() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("roto.pdf", b"%PDF-" + b"x" * 2000)
+        zf.writestr("notas.txt", b"no se importa")
+    crudo = bytearray(buffer.getvalue())
+    crudo[crudo.index(b"x" * 100) + 50] = ord("y")  # el CRC del miembro ya no coincide
+    return bytes(crudo)
+
+
+def test_miembro_corrupto_es_una_linea_de_error_y_no_deja_archivos(datos):
+    app = FastAPI()
+    app.include_router(importaciones.router)
+    r = TestClient(app).post(
+        "/importaciones/historias/lote",
+        files=[("files", ("lote.zip", _zip_con_miembro_corrupto(), "application/zip"))],
+    )
+    assert r.status_code == 200
+    lineas = [json.loads(linea) for linea in r.text.splitlines()]
+    por_archivo = {linea["archivo"]: linea for linea in lineas if "archivo" in linea}
+    assert por_archivo["roto.pdf"]["resultado"] == "error"
+    assert "No se pudo extraer del ZIP" in por_archivo["roto.pdf"]["detalle"]
+    assert por_archivo["notas.txt"]["detalle"] == "Formato no permitido"
+    assert lineas[-1]["resumen"]["fallidos"] == 2
+    assert os.listdir(import_service.UPLOAD_DIR) == []  # ni el .zip temporal ni el miembro a medias
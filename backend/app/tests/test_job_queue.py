@@ -0,0 +1,92 @@
+# backend/app/tests/test_job_queue.py
+import os
+import threading
+import time
+
+import pytest
+
+from app.services import job_queue
+
+
+@pytest.fixture
+def contador(datos, monkeypatch):
+    corridas = []
+    monkeypatch.setitem(job_queue._handlers, "prueba", lambda job: corridas.append(job["id"]))
+    return corridas
+
+
+def test_un_trabajo_encolado_dos_veces_corre_una(contador):
+    job = job_queue.encolar("prueba", {})
+    job_queue._ejecutar(job["id"])
+    job_queue._ejecutar(job["id"])
+    assert contador == [job["id"]]
+    assert job_queue.obtener(job["id"])["estado"] == "completado"
+
+
+def test_reserva_vigente_de_otro_proceso_no_se_toma(contador):
+    job = job_queue.encolar("prueba", {})
+    job_queue.actualizar(job, estado="procesando", duenio="otra-maquina:4242",
+                         reserva_hasta=time.time() + 60)
+    job_queue._ejecutar(job["id"])
+    assert contador == []
+
+    # Vencida (el otro proceso dejó de renovarla): se retoma
+    job_queue.actualizar(job, reserva_hasta=time.time() - 1)
+    job_queue._ejecutar(job["id"])
+    assert contador == [job["id"]]
+
+
+def test_reserva_de_un_proceso_muerto_vence_al_instante(contador):
+    job = job_queue.encolar("prueba", {})
+    # Un pid que no existe en esta máquina
+    job_queue.actualizar(job, estado="procesando", duenio=f"{job_queue.socket.gethostname()}:99999999",
+                         reserva_hasta=time.time() + 60)
+    assert not job_queue._reserva_vigente(job_queue.obtener(job["id"]))
+    job_queue._ejecutar(job["id"])
+    assert contador == [job["id"]]
+
+
+def test_guardados_simultaneos_del_mismo_trabajo(contador):
+    job = job_queue.encolar("prueba", {})
+    errores = []
+
+    def guardar_muchas_veces():
+        try:
+            for i in range(50):
+                job_queue._guardar({**job, "paso": i})
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=guardar_muchas_veces) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert errores == []
+    assert os.listdir(job_queue.JOBS_DIR) == [f"{job['id']}.json"]
+
+
+def test_poda_de_terminados_viejos(contador):
+    viejo = job_queue.encolar("prueba", {})
+    job_queue._ejecutar(viejo["id"])
+    reciente = job_queue.encolar("prueba", {})
+    job_queue._ejecutar(reciente["id"])
+    pendiente = job_queue.encolar("prueba", {})
+
+    hace_un_mes = time.time() - 30 * 24 * 3600
+    for job in (viejo, pendiente):
+        os.utime(job_queue._path(job["id"]), (hace_un_mes, hace_un_mes))
+
+    assert job_queue.podar() == 1
+    assert job_queue.obtener(viejo["id"]) is None
+    assert job_queue.obtener(reciente["id"])["estado"] == "completado"
+    assert job_queue.activo("prueba")["id"] == pendiente["id"]  # los pendientes nunca se podan
+
+
+def test_activo_sigue_los_cambios_de_estado(contador):
+    assert job_queue.activo("prueba") is None
+    job = job_queue.encolar("prueba", {})
+    assert job_queue.activo("prueba")["id"] == job["id"]
+    job_queue._ejecutar(job["id"])
+    assert job_queue.activo("prueba") is None
+    assert job_queue._pendientes == {}
@@ -0,0 +1,78 @@
+# backend/app/tests/test_journal.py
+import os
+import time
+
+import pytest
+
+from app.services import storage
+from app.tests.conftest import nueva_historia
+
+
+class Corte(Exception):
+    """Simula que el proceso muere a mitad de una unidad."""
+
+
+def _unidad():
+    return [
+        {"op": "guardar", "tipo": "historia", "id": "h1", "data": nueva_historia("h1")},
+        {"op": "guardar", "tipo": "paciente", "id": "30111222", "data": {"id": "30111222", "nombre": "Ana"}},
+    ]
+
+
+def test_unidad_cortada_se_completa_al_reabrir(datos, monkeypatch):
+    backend = storage.JsonStorage()
+    original = storage.JsonStorage._aplicar_op
+
+    def aplicar_y_cortar(self, op):
+        if op["tipo"] == "paciente":
+            raise Corte()
+        original(self, op)
+
+    monkeypatch.setattr(storage.JsonStorage, "_aplicar_op", aplicar_y_cortar)
+    with pytest.raises(Corte):
+        backend.aplicar(_unidad())
+    assert backend.get_historia("h1") is not None and backend.get_paciente("30111222") is None
+    monkeypatch.setattr(storage.JsonStorage, "_aplicar_op", original)
+
+    reabierto = storage.JsonStorage()  # re-aplica el journal
+    assert reabierto.get_historia("h1")["version"] == 1
+    assert reabierto.get_paciente("30111222") == {"id": "30111222", "nombre": "Ana", "version": 1}
+    assert os.path.getsize(storage.JOURNAL_PATH) == 0  # checkpoint
+
+
+def test_json_truncado_se_repara_desde_el_journal(datos, monkeypatch):
+    backend = storage.JsonStorage()
+    with monkeypatch.context() as m:
+        m.setattr(storage.JsonStorage, "_aplicar_op", lambda self, op: None)
+        backend.aplicar(_unidad())  # sólo llega al journal
+    path = os.path.join(storage.HISTORIAS_DIR, "h1.json")
+    os.makedirs(storage.HISTORIAS_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id": "h1", "esta')
+
+    assert storage.JsonStorage().get_historia("h1")["borrador"]["paciente"]["dni"] == "30111222"
+
+
+def test_linea_final_incompleta_se_descarta(datos):
+    storage.JsonStorage().aplicar(_unidad()[:1])
+    with open(storage.JOURNAL_PATH, "a", encoding="utf-8") as f:
+        f.write('{"ops": [{"op": "borrar", "tipo": "historia", "id": "h1"')  # sin confirmar
+
+    reabierto = storage.JsonStorage()
+    assert reabierto.get_historia("h1") is not None
+    assert os.path.getsize(storage.JOURNAL_PATH) == 0
+
+
+def test_temporales_huerfanos_se_borran(datos):
+    os.makedirs(storage.HISTORIAS_DIR, exist_ok=True)
+    viejo = os.path.join(storage.HISTORIAS_DIR, "h1.json.123.456.tmp")
+    reciente = os.path.join(storage.HISTORIAS_DIR, "h2.json.123.789.tmp")
+    for path in (viejo, reciente):
+        with open(path, "w") as f:
+            f.write("{")
+    hace_un_rato = time.time() - 3600
+    os.utime(viejo, (hace_un_rato, hace_un_rato))
+
+    storage.JsonStorage()
+    assert not os.path.exists(viejo)
+    assert os.path.exists(reciente)  # puede ser de otro proceso escribiendo
@@ -0,0 +1,15 @@
+# backend/app/tests/test_linea_tiempo.py
+import pytest
+
+from app.services import linea_tiempo
+from app.tests.conftest import nueva_historia
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("4,5", 4.5), (3, 3.0), ("6.0", 6.0),
+    ("nan", None), ("inf", None), ("-Infinity", None), ("sin dato", None), (None, None),
+])
+def test_edss_de_la_entrada(valor, esperado):
+    h = nueva_historia("h1")
+    h["borrador"]["enfermedad"]["edss"] = valor
+    assert linea_tiempo.entrada_historia(h)["edss"] == esperado
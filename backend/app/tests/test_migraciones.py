@@ -0,0 +1,47 @@
+# backend/app/tests/test_migraciones.py
+import os
+import json
+
+from app.core import config
+from app.services import storage
+from app.tests.conftest import nueva_historia
+
+
+def _datos_json():
+    """Una historia editada dos veces (versión 3), otra sin tocar y un paciente anterior a las versiones."""
+    storage.save_historia(nueva_historia("h1"))
+    for _ in range(2):
+        storage.save_historia(storage.get_historia("h1"))
+    storage.save_historia(nueva_historia("h2", dni="28999111"))
+    os.makedirs(storage.PACIENTES_DIR, exist_ok=True)
+    with open(os.path.join(storage.PACIENTES_DIR, "30111222.json"), "w", encoding="utf-8") as f:
+        json.dump({"id": "30111222", "dni": "30111222", "nombre": "Ana"}, f)
+    return {h["id"]: h for h in storage.JsonStorage().iter_historias()}
+
+
+def test_migrar_a_sqlite_conserva_versiones(datos):
+    origen = _datos_json()
+    storage.migrar_json_a_sqlite()
+    destino = storage.SqliteStorage()
+    assert {h["id"]: h for h in destino.iter_historias()} == origen
+    assert destino.get_historia("h1")["version"] == 3
+    assert "version" not in destino.get_paciente("30111222")
+
+    # Idempotente: migrar de nuevo no renumera
+    storage.migrar_json_a_sqlite()
+    assert destino.get_historia("h1")["version"] == 3
+
+
+def test_migrar_a_segmentos_conserva_versiones(datos, monkeypatch):
+    monkeypatch.setattr(config, "SEGMENTOS_COMPACTAR_CADA", 0)
+    origen = _datos_json()
+    storage.migrar_json_a_segmentos()
+    destino = storage.SegmentosStorage()
+    assert {h["id"]: h for h in destino.iter_historias()} == origen
+    assert destino.get_historia("h1")["version"] == 3
+    assert "version" not in destino.get_paciente("30111222")
+
+    # La próxima escritura sigue la numeración de origen
+    destino.aplicar([{"op": "guardar", "tipo": "historia", "id": "h1", "data": destino.get_historia("h1"),
+                      "version_esperada": 3}])
+    assert destino.get_historia("h1")["version"] == 4
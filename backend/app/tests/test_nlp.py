@@ -0,0 +1,54 @@
+# backend/app/tests/test_nlp.py
+"""Salida de referencia del NLP sobre una historia típica (secciones, tratamientos, DNI)."""
+import pytest
+
+pytest.importorskip("docx")  # nlp_service importa los extractores
+pytest.importorskip("pdfplumber")
+
+from app.services import nlp_service  # noqa: E402
+
+HISTORIA = """Consultorio de Neurología.
+Fecha: 12/03/2024.
+Paciente: María Fernanda Gómez DNI: 29.371.624.
+Fecha de nacimiento: 05/07/1985.
+Motivo de consulta: visión borrosa en ojo izquierdo de 10 días.
+Antecedentes: hipotiroidismo.
+Examen físico: hiperreflexia generalizada, Babinski izquierdo.
+Estudios: RMN de cerebro con lesiones periventriculares. Bandas oligoclonales positivas.
+Diagnóstico: Esclerosis múltiple remitente recurrente. EDSS: 2,5.
+Tratamiento: Natalizumab 300 mg cada 28 días.
+Comentario: control en 3 meses.
+"""
+
+
+@pytest.fixture(scope="module")
+def borrador():
+    return nlp_service.process_text(HISTORIA, "TXT", "historia.txt")
+
+
+def test_secciones(borrador):
+    assert borrador["secciones_texto"] == {
+        "sintomas_principales": "visión borrosa en ojo izquierdo de 10 días",
+        "antecedentes": "hipotiroidismo",
+        "examen_fisico": "hiperreflexia generalizada, Babinski izquierdo",
+        "agrupacion_sindromica": "",
+        "comentario": "control en 3 meses.",
+        "estudios": "RMN de cerebro con lesiones periventriculares\nBandas oligoclonales positivas",
+        "evolucion": "",
+    }
+
+
+def test_tratamientos(borrador):
+    assert borrador["tratamientos"] == [{
+        "molecula": "Natalizumab", "droga": "Natalizumab", "dosis": "300 mg",
+        "frecuencia": None, "estado": "Activo", "inicio": None,
+    }]
+
+
+def test_paciente_y_enfermedad(borrador):
+    assert borrador["paciente"]["dni"] == "29371624"
+    assert borrador["paciente"]["nombre"] == "María Fernanda Gómez"
+    assert borrador["paciente"]["fecha_nacimiento"] == "1985-07-05"
+    assert borrador["consulta"]["fecha"] == "2024-03-12"
+    assert borrador["enfermedad"]["diagnostico"] == "Esclerosis Múltiple"
+    assert (borrador["enfermedad"]["forma"], borrador["enfermedad"]["edss"]) == ("RR", 2.5)
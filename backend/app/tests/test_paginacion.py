@@ -0,0 +1,89 @@
+# backend/app/tests/test_paginacion.py
+import pytest
+
+from app.services import storage
+from app.utils import paginacion
+from app.tests.conftest import nueva_historia
+
+
+@pytest.fixture
+def listado(cliente):
+    # Fechas repetidas y una historia sin fecha: el id desempata
+    fechas = ["2024-01-10", "2023-05-02", "2024-01-10", None, "2022-11-30", "2024-01-10", "2023-05-02"]
+    for i, fecha in enumerate(fechas):
+        storage.save_historia(nueva_historia(f"h{i}", dni=f"3000000{i}", fecha=fecha))
+    return cliente
+
+
+def _paginas(cliente, ruta, **params):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        r = cliente.get(ruta, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        cuerpo = r.json()
+        ids.extend(item["id"] for item in cuerpo["items"])
+        paginas += 1
+        cursor = cuerpo["cursor_siguiente"]
+        if not cursor:
+            return ids, paginas
+
+
+@pytest.mark.parametrize("orden", ["fecha", "id"])
+def test_paginas_recorren_el_listado_completo(listado, orden):
+    completo = [item["id"] for item in listado.get("/historias", params={"orden": orden}).json()["items"]]
+    ids, paginas = _paginas(listado, "/historias", orden=orden, limit=3)
+    assert ids == completo
+    assert paginas == 3
+
+
+def test_orden_fecha_mas_recientes_primero(listado):
+    ids, _ = _paginas(listado, "/historias", orden="fecha", limit=2)
+    assert ids == ["h5", "h2", "h0", "h6", "h1", "h4", "h3"]
+
+
+def test_altas_y_bajas_entre_paginas_no_repiten_ni_saltean(listado):
+    primera = listado.get("/historias", params={"orden": "id", "limit": 3}).json()
+    assert [i["id"] for i in primera["items"]] == ["h0", "h1", "h2"]
+
+    storage.delete_historia("h3")
+    storage.save_historia(nueva_historia("h00", fecha="2021-01-01"))  # antes del cursor: no aparece
+    storage.save_historia(nueva_historia("h9", fecha="2021-01-01"))
+
+    todo, _ = _paginas(listado, "/historias", orden="id", limit=3)
+    siguiente = listado.get("/historias", params={"orden": "id", "limit": 3, "cursor": primera["cursor_siguiente"]})
+    assert [i["id"] for i in siguiente.json()["items"]] == ["h4", "h5", "h6"]
+    assert todo == ["h0", "h00", "h1", "h2", "h4", "h5", "h6", "h9"]
+
+
+def test_cursor_invalido_o_de_otro_orden(listado):
+    assert listado.get("/historias", params={"cursor": "no-es-un-cursor"}).status_code == 400
+    de_fecha = listado.get("/historias", params={"orden": "fecha", "limit": 1}).json()["cursor_siguiente"]
+    assert listado.get("/historias", params={"orden": "id", "cursor": de_fecha}).status_code == 400
+    assert listado.get("/historias", params={"orden": "nombre"}).status_code == 400
+
+
+@pytest.mark.parametrize("ruta, orden, clave", [
+    ("/historias", "id", [[1, 2]]),
+    ("/historias", "id", ["h1", "h2"]),
+    ("/historias", "fecha", ["2024-01-10"]),
+    ("/historias", "fecha", [None, "h1"]),
+    ("/pacientes", "nombre", [1, "30000001"]),
+    ("/historias/buscar", "relevancia", ["alto", "h1"]),
+])
+def test_cursor_con_clave_mal_formada(listado, ruta, orden, clave):
+    cursor = paginacion.codificar_cursor(orden, clave)
+    params = {"cursor": cursor, **({"q": "neuritis"} if orden == "relevancia" else {"orden": orden})}
+    assert listado.get(ruta, params=params).status_code == 400
+
+
+def test_proyeccion_de_campos(listado):
+    r = listado.get("/historias", params={"orden": "id", "limit": 1, "fields": "id,paciente.dni,inexistente"})
+    assert r.json()["items"] == [{"id": "h0", "paciente": {"dni": "30000000"}}]
+
+
+def test_pacientes_paginados(cliente):
+    for dni, nombre in (("30000003", "Carla"), ("30000001", "Ana"), ("30000002", "Beto")):
+        storage.save_paciente({"id": dni, "dni": dni, "nombre": nombre})
+    ids, paginas = _paginas(cliente, "/pacientes", orden="nombre", limit=2, fields="id")
+    assert ids == ["30000001", "30000002", "30000003"]
+    assert paginas == 2
@@ -0,0 +1,53 @@
+# backend/app/tests/test_reportes.py
+from app.services import storage
+from app.tests.conftest import nueva_historia
+
+
+def _cohorte():
+    # Dos historias del mismo paciente con la misma fecha y datos distintos:
+    # el desempate no puede depender del orden en que llegaron
+    storage.save_historia(nueva_historia("h3", forma="Primaria progresiva",
+                                         tratamientos=[{"droga": "Ocrelizumab"}]))
+    storage.save_historia(nueva_historia("h1", forma="Remitente-recurrente",
+                                         tratamientos=[{"droga": "Fingolimod"}]))
+    storage.save_historia(nueva_historia("h2", dni="28999111", fecha="2023-01-02",
+                                         tratamientos=[{"droga": "Natalizumab"}]))
+    storage.save_historia(nueva_historia("h4", dni="27000333", fecha="2022-07-01",
+                                         tratamientos=[{"droga": "Fingolimod"}]))
+
+
+def test_reporte_incremental_igual_a_rebuild(cliente):
+    cliente.get("/reportes/general")  # tablas cargadas vacías: lo que sigue entra de a una historia
+    _cohorte()
+    # Validar h1 la vuelve a agregar al final de la tabla
+    r = cliente.patch("/historias/h1/validacion", json={**storage.get_historia("h1")["borrador"], "estado": "validada"})
+    assert r.status_code == 200
+
+    incremental = cliente.get("/reportes/general").json()
+    reconstruido = cliente.get("/reportes/general", params={"rebuild": "true"}).json()
+    assert incremental == reconstruido
+    assert incremental["resumen_general"]["total_pacientes"] == 3
+    assert incremental["resumen_general"]["historias_registradas"] == 4
+
+
+def test_reporte_cacheado_se_invalida_con_escrituras(cliente):
+    _cohorte()
+    primero = cliente.get("/reportes/general")
+    assert cliente.get("/reportes/general", headers={"If-None-Match": primero.headers["etag"]}).status_code == 304
+
+    storage.delete_historia("h2")
+    segundo = cliente.get("/reportes/general", headers={"If-None-Match": primero.headers["etag"]})
+    assert segundo.status_code == 200
+    assert segundo.json()["resumen_general"]["total_pacientes"] == 2
+
+
+def test_edss_no_numerico_no_rompe_el_reporte(cliente):
+    for id_historia, edss in (("h1", "4,5"), ("h2", "inf"), ("h3", "nan")):
+        h = nueva_historia(id_historia, dni=f"3011122{id_historia[-1]}", fecha="2024-05-10")
+        h["borrador"]["enfermedad"]["edss"] = edss
+        storage.save_historia(h)
+    r = cliente.get("/reportes/general")
+    assert r.status_code == 200
+    assert r.json()["discapacidad_y_progression"]["edss_progresion_historica"] == [
+        {"anio": "2024", "edss_promedio": 4.5, "historias": 1}
+    ]
@@ -0,0 +1,19 @@
+# backend/app/tests/test_validacion_masiva.py
+import os
+
+from app.services import job_queue, storage
+from app.tests.conftest import nueva_historia
+
+
+def test_sync_por_lotes_valida_todos_los_pendientes(cliente):
+    for i in range(5):
+        storage.save_historia(nueva_historia(f"h{i}", dni=f"3000000{i}"))
+    storage.save_historia(nueva_historia("h9", dni="30000009", estado="validada"))
+
+    r = cliente.post("/historias/validacion-masiva", params={"lote": 2})
+    assert r.status_code == 200
+    assert r.json()["procesadas"] == 5
+    for i in range(5):
+        historia = storage.get_historia(f"h{i}")
+        assert historia["estado"] == "validada" and historia["validada"] is not None
+    assert not os.path.isdir(job_queue.JOBS_DIR)  # en modo sync no hay trabajo que persistir
@@ -0,0 +1,96 @@
+# backend/app/tests/test_versiones.py
+import os
+import sys
+import subprocess
+
+import pytest
+
+from app.services import patient_service, storage
+from app.tests.conftest import nueva_historia
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_cada_escritura_sube_la_version(datos):
+    h = nueva_historia("h1")
+    storage.save_historia(h)
+    assert storage.get_historia("h1")["version"] == 1
+    storage.save_historia(h, version_esperada=1)
+    assert storage.get_historia("h1")["version"] == 2
+
+
+def test_version_esperada_vieja_lanza_conflicto(datos):
+    storage.save_historia(nueva_historia("h1"))
+    storage.save_historia(storage.get_historia("h1"), version_esperada=1)
+    with pytest.raises(storage.ConflictoVersion) as e:
+        storage.save_historia(storage.get_historia("h1"), version_esperada=1)
+    assert (e.value.esperada, e.value.actual) == (1, 2)
+    assert storage.get_historia("h1")["version"] == 2
+
+
+def test_conflicto_descarta_toda_la_transaccion(datos):
+    storage.save_historia(nueva_historia("h1"))
+    with pytest.raises(storage.ConflictoVersion):
+        with storage.transaccion():
+            storage.save_historia(nueva_historia("h2"))
+            storage.save_historia(storage.get_historia("h1"), version_esperada=7)
+    assert storage.get_historia("h2") is None
+    assert storage.get_historia("h1")["version"] == 1
+
+
+def test_alta_de_paciente_no_pisa_a_otra_alta_simultanea(datos, monkeypatch):
+    # La otra importación del mismo DNI creó al paciente después de nuestra lectura
+    storage.save_paciente({"id": "30111222", "dni": "30111222", "nombre": "Ana", "obra_social": "OSDE"})
+    with monkeypatch.context() as m:
+        m.setattr(storage, "get_paciente", lambda id_paciente: None)
+        with pytest.raises(storage.ConflictoVersion) as e:
+            with storage.transaccion():
+                patient_service.upsert_paciente_from_nlp({"dni": "30.111.222", "nombre": "Ana López"})
+    assert (e.value.esperada, e.value.actual) == (storage.NO_EXISTE, 1)
+    assert storage.get_paciente("30111222")["obra_social"] == "OSDE"
+
+
+def test_alta_de_paciente_nuevo(datos):
+    with storage.transaccion():
+        patient_service.upsert_paciente_from_nlp({"dni": "30.111.222", "nombre": "Ana López"})
+    assert storage.get_paciente("30111222")["version"] == 1
+
+
+def test_if_match_en_validacion(cliente):
+    storage.save_historia(nueva_historia("h1"))
+    version = cliente.get("/historias/h1/borrador").json()["version"]
+
+    r = cliente.patch("/historias/h1/validacion", json={"estado": "validada"}, headers={"If-Match": f'"{version}"'})
+    assert r.status_code == 200
+    assert r.json()["version"] == version + 1
+
+    # Misma versión leída: otro ya guardó en el medio
+    r = cliente.patch("/historias/h1/validacion", json={"estado": "validada"}, headers={"If-Match": str(version)})
+    assert r.status_code == 409
+    assert r.json()["detail"]["version_actual"] == version + 1
+
+    r = cliente.patch("/historias/h1/validacion", json={"estado": "validada"}, headers={"If-Match": "abc"})
+    assert r.status_code == 400
+
+
+def test_if_match_en_pacientes(cliente):
+    storage.save_paciente({"id": "30111222", "dni": "30111222", "nombre": "Ana"})
+    r = cliente.put("/pacientes/30111222", json={"nombre": "Ana María"}, headers={"If-Match": "1"})
+    assert r.status_code == 200
+    r = cliente.put("/pacientes/30111222", json={"nombre": "Otra"}, headers={"If-Match": "1"})
+    assert r.status_code == 409
+    assert storage.get_paciente("30111222")["nombre"] == "Ana María"
+
+
+def test_un_solo_servidor_por_directorio(datos, monkeypatch):
+    monkeypatch.setattr(storage, "_servidor", None)
+    storage.reservar_servidor()
+    try:
+        otro = subprocess.run(
+            [sys.executable, "-c", "from app.services import storage; storage.reservar_servidor()"],
+            capture_output=True, text=True, env={**os.environ, "PYTHONPATH": BACKEND_DIR},
+        )
+        assert otro.returncode != 0
+        assert "un solo worker" in otro.stderr
+    finally:
+        storage._servidor.close()
@@ -1,24 +1,36 @@
 # backend/app/utils/extract_text.py
 
 import os
+import time
 import subprocess
 import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 from docx import Document
 import pdfplumber
 
+from app.core import config
+
 # Configurar logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_text(file_path: str):
+# Subir cada vez que cambie el texto que devuelven los extractores: invalida la caché
+EXTRACTOR_VERSION = "2"
+
+def extract_text(file_path: str, max_pages: Optional[int] = None, paralelo: Optional[bool] = None):
     """
     Extractor universal que decide qué herramienta usar según la extensión.
     Retorna: (texto_extraido, numero_de_paginas, tipo_de_archivo)
+    max_pages: en PDFs, cortar después de N páginas (p.ej. sólo datos de encabezado).
+    paralelo: en PDFs, repartir las páginas en el pool compartido (True) o no (False);
+    por defecto se reparten los largos, salvo dentro de un worker de importación.
     """
     ext = os.path.splitext(file_path)[1].lower()
     
     if ext == ".pdf":
-        return _extract_from_pdf(file_path)
+        return _extract_from_pdf(file_path, max_pages, paralelo)
     elif ext == ".docx":
         return _extract_from_docx(file_path)
     elif ext == ".doc":
@@ -28,16 +40,80 @@ def extract_text(file_path: str):
     else:
         return "", 0, "Desconocido"
 
-def _extract_from_pdf(file_path: str):
-    text = ""
-    pages = 0
+# Pool de páginas de PDF: uno solo por proceso, acotado a PDF_WORKERS. Dentro de
+# un proceso del pool de importación no se usa (ver marcar_worker_importacion):
+# ahí el paralelismo ya está entre documentos y anidar pools multiplicaría los
+# procesos (IMPORT_WORKERS x PDF_WORKERS). Los PDFs largos los extrae entonces el
+# proceso principal antes de mandarlos al pool (import_service.extraer_en_principal).
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+_en_worker_importacion = False
+
+def marcar_worker_importacion():
+    """Initializer de los procesos del pool de importación: PDFs sin paralelismo por páginas."""
+    global _en_worker_importacion
+    _en_worker_importacion = True
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                _pdf_pool = ProcessPoolExecutor(max_workers=config.PDF_WORKERS)
+    return _pdf_pool
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=False, cancel_futures=True)
+            _pdf_pool = None
+
+def _extract_pdf_rango(file_path: str, inicio: int, fin: int) -> List[str]:
+    """
+    Texto de las páginas [inicio, fin). Cada página se libera apenas se usa para
+    no acumular en memoria los objetos que pdfplumber cachea por página.
+    Corre también en procesos del pool (debe ser picklable).
+    """
+    textos = []
+    with pdfplumber.open(file_path) as pdf:
+        for i in range(inicio, fin):
+            page = pdf.pages[i]
+            page_text = page.extract_text()
+            if page_text:
+                textos.append(page_text)
+            liberar = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+            if liberar:
+                liberar()
+    return textos
+
+def paginas_pdf(file_path: str) -> int:
+    """Cantidad de páginas (0 si el PDF no se puede abrir)."""
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        return 0
+
+def _extract_from_pdf(file_path: str, max_pages: Optional[int] = None, paralelo: Optional[bool] = None):
     try:
         with pdfplumber.open(file_path) as pdf:
             pages = len(pdf.pages)
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        n = pages if max_pages is None else min(pages, max_pages)
+
+        if paralelo is None:
+            paralelo = n >= config.PDF_PARALLEL_MIN_PAGES and not _en_worker_importacion
+        workers = min(config.PDF_WORKERS, n)
+        if paralelo and workers > 1:
+            # Rangos contiguos de páginas en el pool compartido; el orden se respeta con map
+            paso = -(-n // workers)
+            rangos = [(i, min(i + paso, n)) for i in range(0, n, paso)]
+            partes = _get_pdf_pool().map(_extract_pdf_rango, [file_path] * len(rangos), *zip(*rangos))
+            textos = [t for parte in partes for t in parte]
+        else:
+            textos = _extract_pdf_rango(file_path, 0, n)
+
+        text = "".join(t + "\n" for t in textos)
         return text, pages, "PDF"
     except Exception as e:
         logger.error(f"Error leyendo PDF {file_path}: {e}")
@@ -57,40 +133,80 @@ def _extract_from_docx(file_path: str):
         logger.error(f"Error leyendo DOCX {file_path}: {e}")
         return "", 0, "Error DOCX"
 
+# --- .DOC (ANTIWORD) ---
+# antiword no tiene modo servidor: cada .doc es un proceso nuevo. Se acota cuántos
+# corren a la vez (ANTIWORD_WORKERS), cada llamada tiene timeout y se miden por
+# separado la espera de un lugar, el arranque del proceso y la conversión. Esos
+# tiempos quedan en el thread que extrajo (tiempos_antiword) porque la extracción
+# suele correr en un worker del pool: import_service los devuelve con el borrador.
+_antiword_slots = threading.BoundedSemaphore(config.ANTIWORD_WORKERS)
+_medicion = threading.local()
+
+def tiempos_antiword() -> Dict[str, float]:
+    """Segundos de la última conversión .doc de este thread (espera, spawn, run); la consume."""
+    tiempos = getattr(_medicion, "tiempos", None) or {}
+    _medicion.tiempos = None
+    return tiempos
+
+def _decodificar(raw: bytes) -> str:
+    """Una sola decodificación: UTF-8 si es válido, si no Latin-1 (el mapeo por defecto de antiword)."""
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
 def _extract_from_doc_antiword(file_path: str):
     """
     Usa 'antiword' vía subprocess. Requiere tener 'antiword' instalado.
-    Corrección: Maneja la decodificación manualmente para evitar crash en Windows (cp1252).
+    Trabaja con bytes crudos y decodifica una única vez (ver _decodificar) para
+    evitar el UnicodeDecodeError automático en Windows (cp1252).
     """
-    try:
-        # IMPORTANTE: Quitamos text=True para recibir bytes crudos y evitar el UnicodeDecodeError automático
-        result = subprocess.run(
-            ['antiword', '-w', '0', file_path], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE
-        )
-        
-        if result.returncode != 0:
-            err_msg = result.stderr.decode('utf-8', errors='ignore')
-            logger.error(f"Antiword falló: {err_msg}")
-            return "", 0, "Error DOC (Antiword)"
-            
-        # Decodificamos manualmente ignorando caracteres ilegales
-        text = result.stdout.decode('utf-8', errors='ignore')
-        
-        # Si utf-8 falla (devuelve vacío), intentamos latin-1
-        if not text.strip():
-             text = result.stdout.decode('latin-1', errors='ignore')
-
-        pages = max(1, len(text) // 3000)
-        return text, pages, "DOC (Legacy)"
-        
-    except FileNotFoundError:
-        logger.error("Error: 'antiword' no está instalado o no está en el PATH.")
-        return "Error: Falta instalar antiword en el sistema.", 0, "Error Config"
-    except Exception as e:
-        logger.error(f"Error genérico leyendo DOC {file_path}: {e}")
-        return "", 0, "Error DOC"
+    t_espera = time.perf_counter()
+    with _antiword_slots:
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.Popen(
+                ['antiword', '-w', '0', file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            logger.error("Error: 'antiword' no está instalado o no está en el PATH.")
+            return "Error: Falta instalar antiword en el sistema.", 0, "Error Config"
+        except Exception as e:
+            logger.error(f"Error genérico leyendo DOC {file_path}: {e}")
+            return "", 0, "Error DOC"
+        t1 = time.perf_counter()
+
+        timeout = False
+        try:
+            stdout, stderr = proc.communicate(timeout=config.ANTIWORD_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            timeout = True
+        t2 = time.perf_counter()
+
+    _medicion.tiempos = {
+        "antiword_espera": round(t0 - t_espera, 3),
+        "antiword_spawn": round(t1 - t0, 3),
+        "antiword_run": round(t2 - t1, 3),
+    }
+    logger.info(f"antiword {os.path.basename(file_path)}: espera {(t0 - t_espera) * 1000:.1f} ms, "
+                f"spawn {(t1 - t0) * 1000:.1f} ms, run {(t2 - t1) * 1000:.1f} ms")
+
+    if timeout:
+        logger.error(f"Antiword superó el timeout de {config.ANTIWORD_TIMEOUT}s: {file_path}")
+        return "", 0, "Error DOC (Timeout)"
+
+    if proc.returncode != 0:
+        err_msg = stderr.decode('utf-8', errors='ignore')
+        logger.error(f"Antiword falló: {err_msg}")
+        return "", 0, "Error DOC (Antiword)"
+
+    text = _decodificar(stdout)
+    pages = max(1, len(text) // 3000)
+    return text, pages, "DOC (Legacy)"
 
 def _extract_from_txt(file_path: str):
     try:
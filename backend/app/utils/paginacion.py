@@ -0,0 +1,101 @@
+# backend/app/utils/paginacion.py
+"""
+Paginación por cursor (keyset) y proyección de campos para los listados.
+
+Los índices en memoria mantienen listas ordenadas de claves (tuplas); una página
+es un corte de esa lista a partir de la última clave entregada, buscada con
+bisect. El cursor es esa clave codificada, así que altas y bajas entre dos
+pedidos no repiten ni saltean registros.
+"""
+import json
+import math
+import base64
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# Forma de la clave de cada orden (ver _clave en historia_index y paciente_index,
+# y la búsqueda por relevancia): una clave de otra forma rompería el bisect
+_NUMERO = (int, float)
+FORMAS_CLAVE: Dict[str, Tuple[tuple, ...]] = {
+    "fecha": (str, str),
+    "nombre": (str, str),
+    "id": (str,),
+    "relevancia": (_NUMERO, str),
+}
+
+
+def _clave_valida(orden: str, clave: list) -> bool:
+    forma = FORMAS_CLAVE.get(orden)
+    if forma is None or len(clave) != len(forma):
+        return False
+    for valor, tipos in zip(clave, forma):
+        if isinstance(valor, bool) or not isinstance(valor, tipos):
+            return False
+        if isinstance(valor, float) and not math.isfinite(valor):
+            return False
+    return True
+
+
+def codificar_cursor(orden: str, clave: tuple) -> str:
+    crudo = json.dumps([orden, list(clave)], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str, orden: str) -> tuple:
+    """Clave del cursor; ValueError si está mal formado o es de otro orden."""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        orden_cursor, clave = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if orden_cursor != orden or not isinstance(clave, list):
+        raise ValueError("El cursor no corresponde a este orden")
+    if not _clave_valida(orden, clave):
+        raise ValueError("Cursor inválido")
+    return tuple(clave)
+
+
+def cortar(
+    claves: List[tuple],
+    despues: Optional[tuple] = None,
+    limit: Optional[int] = None,
+    descendente: bool = False,
+) -> Tuple[List[tuple], bool]:
+    """Claves de la página siguiente a `despues` en una lista ordenada ascendente y si quedan más."""
+    if descendente:
+        fin = bisect_left(claves, despues) if despues is not None else len(claves)
+        inicio = max(0, fin - limit) if limit is not None else 0
+        return claves[inicio:fin][::-1], inicio > 0
+    inicio = bisect_right(claves, despues) if despues is not None else 0
+    fin = min(len(claves), inicio + limit) if limit is not None else len(claves)
+    return claves[inicio:fin], fin < len(claves)
+
+
+def parsear_campos(fields: Optional[str]) -> Optional[List[str]]:
+    """"id,estado,paciente.nombre" -> lista de rutas; None = todos los campos."""
+    campos = [c.strip() for c in (fields or "").split(",") if c.strip()]
+    return campos or None
+
+
+def proyectar(item: Dict[str, Any], campos: Optional[List[str]]) -> Dict[str, Any]:
+    """Copia de `item` con sólo las rutas pedidas (las anidadas con punto)."""
+    if not campos:
+        return item
+    resultado: Dict[str, Any] = {}
+    for ruta in campos:
+        # Si se pidió "paciente" entero, "paciente.nombre" sobra
+        partes = ruta.split(".")
+        if any(".".join(partes[:i]) in campos for i in range(1, len(partes))):
+            continue
+        valor: Any = item
+        for parte in partes:
+            if not isinstance(valor, dict) or parte not in valor:
+                break
+            valor = valor[parte]
+        else:
+            destino = resultado
+            for parte in partes[:-1]:
+                destino = destino.setdefault(parte, {})
+            destino[partes[-1]] = valor
+    return resultado
@@ -1,5 +1,7 @@
 # app/utils/patterns.py
+import os
 import re
+import json
 
 MESES_ES = {
     "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
@@ -36,4 +38,18 @@ RE_MES_ANO = re.compile(r"\b([a-záéíóú]+)\s+(\d{4})", re.IGNORECASE)
 # Para detectar diagnóstico EM y forma en una misma oración
 RE_DX = re.compile(r"(diagn[oó]stico|impresi[oó]n diagn[oó]stica)\s*[:\-]?\s*(.+)", re.IGNORECASE)
 
-VERBOS_TRATAMIENTO = ["inicia", "inició", "inicia tratamiento", "comienza", "mantiene", "continúa", "cambia a", "suspende"]
\ No newline at end of file
+VERBOS_TRATAMIENTO = ["inicia", "inició", "inicia tratamiento", "comienza", "mantiene", "continúa", "cambia a", "suspende"]
+
+# Léxico de fármacos (app/utils/farmacos.json): se amplía editando el JSON, sin tocar código
+FARMACOS_PATH = os.path.join(os.path.dirname(__file__), "farmacos.json")
+
+def cargar_farmacos(path: str = FARMACOS_PATH):
+    """Lista de {"claves": [...], "patron": regex, "molecula": ...} en el orden del archivo."""
+    with open(path, "r", encoding="utf-8") as f:
+        farmacos = json.load(f)["farmacos"]
+    for item in farmacos:
+        item["claves"] = [c.lower() for c in item["claves"]]
+        item.setdefault("patron", re.escape(item["claves"][0]))
+    return farmacos
+
+FARMACOS = cargar_farmacos()
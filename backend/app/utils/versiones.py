@@ -0,0 +1,37 @@
+# backend/app/utils/versiones.py
+"""
+Actualizaciones condicionales con If-Match.
+
+Los registros llevan un campo "version" (ver app/services/storage.py). El
+cliente manda la que leyó en el header If-Match ("3", "\"3\"" o W/"3"); si otro
+la cambió mientras tanto la escritura responde 409 en lugar de pisarla.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.services import storage
+
+
+def parsear_if_match(valor: Optional[str]) -> Optional[int]:
+    """Versión pedida en If-Match; None si no vino (o es "*"). 400 si no es un número."""
+    if valor is None:
+        return None
+    valor = valor.strip()
+    if valor.startswith("W/"):
+        valor = valor[2:]
+    valor = valor.strip('"')
+    if valor in ("", "*"):
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match debe ser el número de versión del registro")
+
+
+def conflicto(e: storage.ConflictoVersion) -> HTTPException:
+    return HTTPException(status_code=409, detail={
+        "mensaje": "El registro fue modificado por otro usuario; recargalo y volvé a intentar",
+        "version_esperada": e.esperada,
+        "version_actual": e.actual,
+    })